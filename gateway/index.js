@@ -7,7 +7,8 @@ const app = express();
 
 // Логирование запросов
 app.use(morgan("combined"));
-app.use(cors());
+// X-Read-Your-Writes: ответ календаря на запись, клиент повторяет его в следующих чтениях
+app.use(cors({ exposedHeaders: ["X-Read-Your-Writes"] }));
 
 app.get("/health", (req, res) => {
   res.status(200).json({ status: "OK" });
@@ -0,0 +1,103 @@
+"""
+Сравнение двух отчётов run.py.
+
+    python loadtest/compare.py loadtest/results/base.json loadtest/results/new.json --threshold 10
+
+Для каждого сценария выводит p50/p95/p99, среднее число SQL-запросов и
+пропускную способность обоих прогонов и изменение в процентах. Если какая-то
+задержка выросла (или пропускная способность упала) больше чем на
+threshold процентов либо появились ошибки, код возврата — 1.
+"""
+
+import argparse
+import json
+import sys
+from typing import List, Optional, Tuple
+
+# (название, путь к значению в сводке сценария, больше — хуже)
+METRICS = [
+    ("p50, мс", ("latency_ms", "p50"), True),
+    ("p95, мс", ("latency_ms", "p95"), True),
+    ("p99, мс", ("latency_ms", "p99"), True),
+    ("SQL/запрос", ("db_queries_mean",), True),
+    ("rps", ("throughput_rps",), False),
+]
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def get(summary: dict, keys: Tuple[str, ...]) -> Optional[float]:
+    value = summary
+    for key in keys:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+
+def change_percent(base: Optional[float], new: Optional[float]) -> Optional[float]:
+    if base is None or new is None:
+        return None
+    if base == 0:
+        return 0.0 if new == 0 else float("inf")
+    return (new - base) / base * 100
+
+
+def compare(base: dict, new: dict, threshold: float) -> List[str]:
+    """Печатает таблицу сравнения и возвращает список регрессий"""
+    regressions = []
+    print(f"база:  {base['meta'].get('commit') or '?'}  {base['meta'].get('started_at')}")
+    print(f"новый: {new['meta'].get('commit') or '?'}  {new['meta'].get('started_at')}")
+    if base.get("dataset") != new.get("dataset"):
+        print("! наборы данных различаются — сравнение может быть нечестным")
+    if base["meta"].get("concurrency") != new["meta"].get("concurrency"):
+        print("! прогоны выполнены с разной конкурентностью")
+
+    for name in sorted(set(base["scenarios"]) | set(new["scenarios"])):
+        print(f"\n{name}")
+        if name not in base["scenarios"] or name not in new["scenarios"]:
+            print("  есть только в одном из отчётов")
+            continue
+        before, after = base["scenarios"][name], new["scenarios"][name]
+        for label, keys, higher_is_worse in METRICS:
+            old_value, new_value = get(before, keys), get(after, keys)
+            delta = change_percent(old_value, new_value)
+            regressed = delta is not None and (delta > threshold if higher_is_worse else delta < -threshold)
+            delta_text = "" if delta is None else f"{delta:+.1f}%"
+            print(
+                f"  {label:<12} {_fmt(old_value):>10} -> {_fmt(new_value):>10} {delta_text:>9}"
+                f"{'  РЕГРЕССИЯ' if regressed else ''}"
+            )
+            if regressed:
+                regressions.append(f"{name}: {label} {delta_text}")
+        if after["errors"] > before["errors"]:
+            print(f"  ошибок       {before['errors']:>10} -> {after['errors']:>10}  РЕГРЕССИЯ")
+            regressions.append(f"{name}: ошибок {before['errors']} -> {after['errors']}")
+    return regressions
+
+
+def _fmt(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=10, help="допустимое ухудшение, %%")
+    args = parser.parse_args()
+
+    regressions = compare(load(args.base), load(args.new), args.threshold)
+    if regressions:
+        print(f"\nРегрессии (порог {args.threshold}%):")
+        for item in regressions:
+            print(f"  {item}")
+        sys.exit(1)
+    print("\nРегрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""
+Нагрузочный прогон API календаря по данным из seed.py.
+
+    python loadtest/run.py --base-url http://localhost:8000 --concurrency 16 \
+        --duration 30 --output loadtest/results/$(git rev-parse --short HEAD).json
+
+Сценарии выполняются по очереди, каждый — concurrency параллельными
+клиентами в течение duration секунд (после warmup запросов прогрева):
+
+    timeslots        GET  /timeslots/{date}   — случайная дата из диапазона манифеста
+    next_available   GET  /timeslots/next-available/ — ближайшие слоты случайного специалиста
+    bookings         POST /bookings/          — бронирование свободных слотов манифеста
+    specialists      GET  /specialists/
+    admin_timeslots  GET  /admin/timeslots/
+
+Отчёт — JSON с p50/p95/p99, пропускной способностью, кодами ответов и
+SQL-запросами на запрос (из заголовка Server-Timing); два отчёта сравнивает
+compare.py. Бронирования меняют данные: перед повторным прогоном заново
+запустите seed.py --reset. Календарь для прогона запускайте без
+TELEGRAM_BOT_SERVICE и WHATSAPP_SERVICE_URL, чтобы не рассылать уведомления.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+from collections import Counter, deque
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SERVER_TIMING_RE = re.compile(r'db;dur=([\d.]+);desc="(\d+) queries"')
+
+# Запрос сценария: (метод, путь, тело, ожидаемые коды ответа)
+RequestSpec = Tuple[str, str, Optional[dict], Tuple[int, ...]]
+
+
+class Scenario:
+    def __init__(self, name: str, make_request: Callable[[], Optional[RequestSpec]]):
+        self.name = name
+        self.make_request = make_request
+
+
+def build_scenarios(manifest: dict, rng: random.Random) -> Dict[str, Scenario]:
+    today = max(date.today(), date.fromisoformat(manifest["date_from"]))
+    days = max((date.fromisoformat(manifest["date_to"]) - today).days, 0)
+    free = list(manifest["free_slots"])
+    rng.shuffle(free)
+    free_slots = deque(free)
+    first_client, last_client = manifest["client_ids"]
+
+    def timeslots():
+        day = today + timedelta(days=rng.randint(0, days))
+        return "GET", f"/timeslots/{day.isoformat()}", None, (200,)
+
+    def next_available():
+        specialist_id = rng.choice(manifest["specialists"])
+        return "GET", f"/timeslots/next-available/?specialist_id={specialist_id}&limit=5", None, (200,)
+
+    def bookings():
+        if not free_slots:
+            return None  # свободные слоты кончились — сценарий завершается досрочно
+        slot = free_slots.popleft()
+        body = {
+            "time_slot_id": slot["id"],
+            "client_id": rng.randint(first_client, last_client),
+            "company_id": manifest["company_id"],
+            "employer_id": slot["employer_id"],
+        }
+        return "POST", "/bookings/", body, (200,)
+
+    return {
+        "timeslots": Scenario("timeslots", timeslots),
+        "next_available": Scenario("next_available", next_available),
+        "bookings": Scenario("bookings", bookings),
+        "specialists": Scenario("specialists", lambda: ("GET", "/specialists/", None, (200,))),
+        "admin_timeslots": Scenario("admin_timeslots", lambda: ("GET", "/admin/timeslots/", None, (200,))),
+    }
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class ScenarioResult:
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.db_queries: List[int] = []
+        self.db_ms: List[float] = []
+        self.elapsed = 0.0
+
+    def record(self, seconds: float, response: Optional[httpx.Response], expected: Tuple[int, ...],
+               error: Optional[Exception] = None):
+        self.latencies.append(seconds)
+        if error is not None:
+            self.errors[error.__class__.__name__] += 1
+            return
+        self.statuses[str(response.status_code)] += 1
+        if response.status_code not in expected:
+            self.errors[f"http_{response.status_code}"] += 1
+        match = SERVER_TIMING_RE.search(response.headers.get("server-timing", ""))
+        if match:
+            self.db_ms.append(float(match.group(1)))
+            self.db_queries.append(int(match.group(2)))
+
+    def summary(self) -> dict:
+        values = sorted(self.latencies)
+        count = len(values)
+        return {
+            "requests": count,
+            "errors": sum(self.errors.values()),
+            "error_types": dict(self.errors),
+            "status_codes": dict(self.statuses),
+            "duration_s": round(self.elapsed, 3),
+            "throughput_rps": round(count / self.elapsed, 2) if self.elapsed else 0.0,
+            "latency_ms": {
+                "min": round(values[0] * 1000, 2) if values else 0.0,
+                "mean": round(sum(values) / count * 1000, 2) if values else 0.0,
+                "p50": round(percentile(values, 50) * 1000, 2),
+                "p95": round(percentile(values, 95) * 1000, 2),
+                "p99": round(percentile(values, 99) * 1000, 2),
+                "max": round(values[-1] * 1000, 2) if values else 0.0,
+            },
+            "db_queries_mean": round(sum(self.db_queries) / len(self.db_queries), 2) if self.db_queries else None,
+            "db_ms_mean": round(sum(self.db_ms) / len(self.db_ms), 2) if self.db_ms else None,
+        }
+
+
+async def send(client: httpx.AsyncClient, spec: RequestSpec, result: Optional[ScenarioResult]):
+    method, path, body, expected = spec
+    started = time.perf_counter()
+    try:
+        response = await client.request(method, path, json=body)
+    except httpx.HTTPError as e:
+        if result is not None:
+            result.record(time.perf_counter() - started, None, expected, e)
+        return
+    if result is not None:
+        result.record(time.perf_counter() - started, response, expected)
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, concurrency: int,
+                       duration: float, warmup: int) -> ScenarioResult:
+    for _ in range(warmup):
+        spec = scenario.make_request()
+        if spec is None:
+            break
+        await send(client, spec, None)
+
+    result = ScenarioResult()
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            spec = scenario.make_request()
+            if spec is None:
+                return
+            await send(client, spec, result)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def git_revision() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=HERE, capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+async def main_async(args) -> dict:
+    with open(args.manifest, encoding="utf-8") as f:
+        manifest = json.load(f)
+    rng = random.Random(args.seed)
+    scenarios = build_scenarios(manifest, rng)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    report = {
+        "meta": {
+            **git_revision(),
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "base_url": args.base_url,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_requests": args.warmup,
+            "seed": args.seed,
+            "python": platform.python_version(),
+        },
+        "dataset": {"seed": manifest["seed"], **manifest["counts"]},
+        "scenarios": {},
+    }
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        for name in args.scenarios:
+            result = await run_scenario(client, scenarios[name], args.concurrency, args.duration, args.warmup)
+            summary = result.summary()
+            report["scenarios"][name] = summary
+            latency = summary["latency_ms"]
+            print(
+                f"{name:<16} {summary['requests']:>7} запросов {summary['throughput_rps']:>8.1f} rps  "
+                f"p50 {latency['p50']:>7.1f}  p95 {latency['p95']:>7.1f}  p99 {latency['p99']:>7.1f} мс  "
+                f"ошибок {summary['errors']}",
+                file=sys.stderr,
+            )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--manifest", default=os.path.join(HERE, "manifest.json"))
+    parser.add_argument("--scenarios", default="timeslots,next_available,bookings,specialists,admin_timeslots",
+                        type=lambda value: [name.strip() for name in value.split(",") if name.strip()])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30, help="секунд на сценарий")
+    parser.add_argument("--warmup", type=int, default=20, help="запросов прогрева перед замером")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="файл отчёта JSON (по умолчанию — stdout)")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - {"timeslots", "next_available", "bookings", "specialists", "admin_timeslots"}
+    if unknown:
+        parser.error(f"Неизвестные сценарии: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(main_async(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"Отчёт: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""
+Наполнение локальной Postgres данными для нагрузочного теста календаря.
+
+    DB_HOST=localhost:5438 python loadtest/seed.py --reset --specialists 40 \
+        --weeks-back 8 --weeks-ahead 12 --clients 5000 --booking-density 0.6 --seed 42
+
+Использует create_initial_data и generate_time_slots из service-database
+и масштабирует их: дополнительные специалисты получают графики из
+WORK_SCHEDULE по кругу, слоты строятся на weeks-back недель назад и
+weeks-ahead недель вперёд, доля booking-density слотов занята записями
+случайных клиентов. При одинаковом --seed данные совпадают.
+
+С --copy данные грузит synthetic.py из service-database (COPY, сотни тысяч
+строк за секунды) — для прогонов на объёмах, близких к боевым.
+
+Подключение — те же переменные DB_USER / DB_PASSWORD / DB_HOST / DB_NAME,
+что и у сервисов. --reset удаляет все таблицы схемы, поэтому без
+--allow-remote скрипт работает только с localhost.
+
+Результат — loadtest/manifest.json: диапазон дат, специалисты, клиенты и
+свободные будущие слоты для сценария бронирования в run.py.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "service-database"))
+
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import main as seeder  # noqa: E402
+from migrate import run_migrations  # noqa: E402
+from partitioning import ensure_partitions  # noqa: E402
+import synthetic  # noqa: E402
+from models import Base, Client, CompanyDescription, OnlineRegistration, TimeSlot, User  # noqa: E402
+
+logger = logging.getLogger("loadtest.seed")
+
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1", "db"}
+BATCH_SIZE = 10000
+
+FIRST_NAMES = ["Иван", "Елена", "Алексей", "Мария", "Дмитрий", "Анна", "Артур", "Гульнара", "Олег", "Наталья"]
+LAST_NAMES = ["Иванов", "Петрова", "Сидоров", "Хасанова", "Смирнов", "Гарипова", "Кузнецов", "Орлова"]
+
+
+def schedule_key(user: User) -> str:
+    """Ключ WORK_SCHEDULE для специалиста из create_initial_data: "Фамилия Имя Отчество" """
+    return f"{user.last_name} {user.name} {user.sur_name}"
+
+
+def insert_batches(conn, table, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        conn.execute(insert(table), rows[i:i + BATCH_SIZE])
+
+
+def add_specialists(session, total: int, rng: random.Random):
+    """Дополняет четырёх специалистов create_initial_data копиями до total; возвращает [(id, график)]"""
+    base = session.query(User).order_by(User.id).all()
+    templates = [(user, seeder.WORK_SCHEDULE[schedule_key(user)]) for user in base]
+    specialists = [(user.id, user.id_category_service, schedule) for user, schedule in templates]
+
+    # Один хэш на всех: bcrypt на каждого специалиста занял бы минуты
+    password = base[0].password
+    clones = []
+    for i in range(len(base), total):
+        template, _ = templates[i % len(templates)]
+        clones.append(User(
+            role="worker",
+            email=f"specialist{i}@loadtest.local",
+            password=password,
+            name=template.name,
+            last_name=f"{template.last_name}-{i}",
+            sur_name=template.sur_name,
+            phone_number=f"7900{rng.randrange(10 ** 7):07d}",
+            id_category_service=template.id_category_service,
+        ))
+    session.add_all(clones)
+    session.commit()
+    for i, user in enumerate(clones, start=len(base)):
+        specialists.append((user.id, user.id_category_service, templates[i % len(templates)][1]))
+    return specialists
+
+
+def add_clients(session, total: int, rng: random.Random) -> list:
+    password = session.query(Client.password).order_by(Client.id).limit(1).scalar()
+    existing = session.query(Client).count()
+    rows = [
+        {
+            "email": f"client{i}@loadtest.local",
+            "password": password,
+            "name": rng.choice(FIRST_NAMES),
+            "last_name": rng.choice(LAST_NAMES),
+            "phone_number": f"7911{i:07d}",
+        }
+        for i in range(existing, total)
+    ]
+    insert_batches(session.connection(), Client.__table__, rows)
+    session.commit()
+    return [row[0] for row in session.query(Client.id).order_by(Client.id)]
+
+
+def add_slots(session, specialists, date_from: date, date_to: date) -> int:
+    """Слоты по графикам WORK_SCHEDULE, как generate_missing_slots, но для всех специалистов и дат"""
+    rows = []
+    current = date_from
+    while current <= date_to:
+        weekday = seeder.WEEKDAYS[current.weekday()]
+        for employer_id, category_id, schedule in specialists:
+            if weekday not in schedule["days"]:
+                continue
+            for slot in seeder.generate_time_slots(
+                schedule["hours"][0], schedule["hours"][1], schedule["duration"],
+                current, employer_id, category_id,
+            ):
+                rows.append({
+                    "id_category_service": slot.id_category_service,
+                    "id_employer": slot.id_employer,
+                    "date": slot.date,
+                    "time_start": slot.time_start,
+                    "id_time_width_minutes_end": slot.id_time_width_minutes_end,
+                })
+        current += timedelta(days=1)
+    insert_batches(session.connection(), TimeSlot.__table__, rows)
+    session.commit()
+    return len(rows)
+
+
+def add_bookings(session, client_ids, company_id: int, density: float, today: date, rng: random.Random):
+    """Занимает долю density слотов; возвращает свободные будущие слоты для run.py"""
+    slots = session.execute(
+        select(TimeSlot.id, TimeSlot.id_employer, TimeSlot.date).order_by(TimeSlot.id)
+    ).all()
+    rows, free = [], []
+    for slot_id, employer_id, slot_date in slots:
+        if rng.random() < density:
+            created = datetime.combine(slot_date, datetime.min.time()) - timedelta(days=rng.randint(1, 14))
+            rows.append({
+                "id_client": rng.choice(client_ids),
+                "id_employer": employer_id,
+                "id_time_slot": slot_id,
+                "slot_date": slot_date,
+                "id_adress_company": company_id,
+                "date_time_create": created,
+            })
+        elif slot_date >= today:
+            free.append({"id": slot_id, "employer_id": employer_id, "date": slot_date.isoformat()})
+    insert_batches(session.connection(), OnlineRegistration.__table__, rows)
+    session.commit()
+    return len(slots), len(rows), free
+
+
+def free_future_slots(session, today: date) -> list:
+    rows = session.execute(
+        select(TimeSlot.id, TimeSlot.id_employer, TimeSlot.date)
+        .where(TimeSlot.date >= today)
+        .where(~select(OnlineRegistration.id).where(
+            OnlineRegistration.id_time_slot == TimeSlot.id,
+            OnlineRegistration.slot_date == TimeSlot.date,
+        ).exists())
+        .order_by(TimeSlot.id)
+    ).all()
+    return [{"id": slot_id, "employer_id": employer_id, "date": slot_date.isoformat()}
+            for slot_id, employer_id, slot_date in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--specialists", type=int, default=40)
+    parser.add_argument("--clients", type=int, default=5000)
+    parser.add_argument("--weeks-back", type=int, default=8)
+    parser.add_argument("--weeks-ahead", type=int, default=12)
+    parser.add_argument("--booking-density", type=float, default=0.6)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reset", action="store_true", help="удалить и создать таблицы заново")
+    parser.add_argument("--copy", action="store_true", help="загрузка через COPY (synthetic.py)")
+    parser.add_argument("--allow-remote", action="store_true", help="разрешить DB_HOST, отличный от localhost")
+    parser.add_argument("--manifest", default=os.path.join(HERE, "manifest.json"))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    host = (os.getenv("DB_HOST") or "").rsplit(":", 1)[0]
+    if host not in LOCAL_HOSTS and not args.allow_remote:
+        parser.error(f"DB_HOST={host!r} не похож на локальную базу; добавьте --allow-remote, если это не ошибка")
+
+    rng = random.Random(args.seed)
+    engine = seeder.engine
+    seeder.wait_for_db(engine)
+    if args.reset:
+        Base.metadata.drop_all(bind=engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "DROP TABLE IF EXISTS schema_migrations, time_slot_history, online_registration_history"
+            )
+    run_migrations(engine)
+
+    today = date.today()
+    date_from = today - timedelta(weeks=args.weeks_back)
+    date_to = today + timedelta(weeks=args.weeks_ahead)
+    with engine.begin() as conn:
+        ensure_partitions(conn, date_from, date_to)
+
+    session = sessionmaker(bind=engine)()
+    started = time.perf_counter()
+    try:
+        if session.query(TimeSlot).first() is not None:
+            parser.error("В базе уже есть слоты; запустите с --reset")
+        seeder.create_initial_data(session)
+        company_id = session.query(CompanyDescription.id).order_by(CompanyDescription.id).limit(1).scalar()
+
+        if args.copy:
+            base_ids = [user_id for user_id, in session.query(User.id).order_by(User.id)]
+            session.commit()
+            summary = synthetic.seed_synthetic_data(
+                engine, seeder.WORK_SCHEDULE, seeder.WEEKDAYS,
+                clients=args.clients,
+                specialists=max(args.specialists - len(base_ids), 0),
+                weeks_back=args.weeks_back,
+                weeks_ahead=args.weeks_ahead,
+                booking_density=args.booking_density,
+                seed=args.seed,
+                today=today,
+            )
+            specialist_ids = [user_id for user_id, in session.query(User.id).order_by(User.id)]
+            client_ids = [user_id for user_id, in session.query(Client.id).order_by(Client.id)]
+            slots, bookings = summary["slots"], summary["registrations"]
+            free = free_future_slots(session, today)
+        else:
+            specialists = add_specialists(session, args.specialists, rng)
+            specialist_ids = [employer_id for employer_id, _, _ in specialists]
+            client_ids = add_clients(session, args.clients, rng)
+            add_slots(session, specialists, date_from, date_to)
+            slots, bookings, free = add_bookings(session, client_ids, company_id, args.booking_density, today, rng)
+            with engine.begin() as conn:
+                for table in ("users", "clients", "time_slot", "online_registration"):
+                    conn.exec_driver_sql(f"ANALYZE {table}")
+    finally:
+        session.close()
+
+    manifest = {
+        "seed": args.seed,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "company_id": company_id,
+        "specialists": specialist_ids,
+        "client_ids": [client_ids[0], client_ids[-1]],
+        "counts": {
+            "specialists": len(specialist_ids),
+            "clients": len(client_ids),
+            "slots": slots,
+            "bookings": bookings,
+            "free_future_slots": len(free),
+        },
+        "free_slots": free,
+    }
+    with open(args.manifest, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    logger.info(
+        f"Готово за {time.perf_counter() - started:.1f} с: {len(specialist_ids)} специалистов, "
+        f"{len(client_ids)} клиентов, {slots} слотов, {bookings} записей; манифест {args.manifest}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+import logging
+import os
+import sys
+import threading
+import time
+from array import array
+from datetime import date, datetime, time as dt_time
+from typing import Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from models import OnlineRegistration, TimeSlot
+
+logger = logging.getLogger(__name__)
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+# Сутки делятся на тики по 5 минут: 288 бит на специалиста и день
+TICK_MINUTES = 5
+TICKS_PER_DAY = 24 * 60 // TICK_MINUTES
+
+
+def tick_of(value: dt_time) -> int:
+    return (value.hour * 60 + value.minute) // TICK_MINUTES
+
+
+def time_of(tick: int) -> dt_time:
+    minutes = tick * TICK_MINUTES
+    return dt_time(minutes // 60, minutes % 60)
+
+
+def tick_mask(start_tick: int, end_tick: int) -> int:
+    """Биты тиков [start_tick, end_tick)"""
+    return ((1 << end_tick) - 1) ^ ((1 << start_tick) - 1)
+
+
+def _popcount(value: int) -> int:
+    return bin(value).count("1")
+
+
+def _ticks(mask: int):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class DayAvailability:
+    """
+    Слоты одного специалиста за один день.
+
+    starts — биты тиков, в которые начинается слот; booked — подмножество
+    starts с записями. slot_ids хранит id слотов в порядке времени начала:
+    id слота на тике t лежит по индексу popcount(starts ниже t), поэтому
+    отдельная таблица «тик -> id» не нужна.
+    """
+
+    __slots__ = ("starts", "booked", "slot_ids")
+
+    def __init__(self):
+        self.starts = 0
+        self.booked = 0
+        self.slot_ids = array("l")
+
+    @property
+    def free(self) -> int:
+        return self.starts & ~self.booked
+
+    def _rank(self, tick: int) -> int:
+        return _popcount(self.starts & ((1 << tick) - 1))
+
+    def slot_id(self, tick: int) -> int:
+        return self.slot_ids[self._rank(tick)]
+
+    def add(self, tick: int, slot_id: int, booked: bool):
+        bit = 1 << tick
+        if self.starts & bit:
+            self.slot_ids[self._rank(tick)] = slot_id
+        else:
+            self.slot_ids.insert(self._rank(tick), slot_id)
+            self.starts |= bit
+        if booked:
+            self.booked |= bit
+        else:
+            self.booked &= ~bit
+
+    def remove(self, tick: int) -> Optional[bool]:
+        """Убирает слот; возвращает, был ли он занят (None — слота не было)"""
+        bit = 1 << tick
+        if not self.starts & bit:
+            return None
+        del self.slot_ids[self._rank(tick)]
+        self.starts &= ~bit
+        was_booked = bool(self.booked & bit)
+        self.booked &= ~bit
+        return was_booked
+
+    def size(self) -> int:
+        return (
+            sys.getsizeof(self) + sys.getsizeof(self.starts) + sys.getsizeof(self.booked)
+            + sys.getsizeof(self.slot_ids)
+        )
+
+
+class AvailabilityIndex:
+    """
+    Свободные слоты специалистов в памяти: битовые маски по дням вместо
+    соединения time_slot с online_registration на каждый вопрос.
+
+    Индекс строится из базы при старте и перестраивается каждые
+    refresh_seconds: слоты на новые недели создаёт service-database, а записи
+    могут прийти через другие экземпляры календаря. Между перестройками его
+    обновляют бронирования и CRUD слотов этого экземпляра. Ответы индекса —
+    подсказка для выбора слота: бронирование по-прежнему проверяется в базе.
+
+    Хранятся только дни начиная с сегодняшнего (МСК).
+    """
+
+    def __init__(self, session_factory: Callable, refresh_seconds: float = 300):
+        self.session_factory = session_factory
+        self.refresh_seconds = refresh_seconds
+        self._days: Dict[int, Dict[date, DayAvailability]] = {}
+        self._lock = threading.Lock()
+        # Изменения, пришедшие во время перестройки: применяются к новой копии
+        self._replay: Optional[List[Tuple[str, tuple]]] = None
+        self.built_at: Optional[datetime] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._wake = threading.Event()
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    # ----------------------------
+    # Жизненный цикл
+    # ----------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="availability-index", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def refresh_soon(self):
+        """Перестроить индекс, не дожидаясь refresh_seconds (например, после потери событий)"""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopped:
+            try:
+                self.rebuild()
+                delay = self.refresh_seconds
+            except Exception as e:
+                logger.error(f"Не удалось построить индекс доступности: {e}")
+                delay = min(self.refresh_seconds, 30)
+            self._wake.wait(delay)
+            self._wake.clear()
+
+    # ----------------------------
+    # Построение из базы
+    # ----------------------------
+    def rebuild(self, today: Optional[date] = None):
+        today = today or datetime.now(MOSCOW_TZ).date()
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            days = self._load(today)
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            for operation, args in self._replay:
+                getattr(self, operation)(days, *args)
+            self._replay = None
+            self._days = days
+            self.built_at = datetime.utcnow()
+        stats = self.stats()
+        logger.info(
+            f"Индекс доступности построен за {time.perf_counter() - started:.2f} с: "
+            f"{stats['specialists']} специалистов, {stats['slots']} слотов, {stats['bytes'] // 1024} КБ"
+        )
+
+    def _load(self, today: date) -> Dict[int, Dict[date, DayAvailability]]:
+        session = self.session_factory()
+        try:
+            booked = session.query(OnlineRegistration.id).filter(
+                OnlineRegistration.id_time_slot == TimeSlot.id,
+                OnlineRegistration.slot_date == TimeSlot.date
+            ).exists()
+            rows = (
+                session.query(TimeSlot.id, TimeSlot.id_employer, TimeSlot.date, TimeSlot.time_start, booked)
+                .filter(TimeSlot.date >= today)
+                .yield_per(10000)
+            )
+            days: Dict[int, Dict[date, DayAvailability]] = {}
+            for slot_id, employer_id, slot_date, time_start, is_booked in rows:
+                if employer_id is None:
+                    continue
+                self._add(days, employer_id, slot_date, time_start, slot_id, is_booked)
+            return days
+        finally:
+            session.close()
+
+    # ----------------------------
+    # Изменения
+    # ----------------------------
+    @staticmethod
+    def _add(days, specialist_id: int, day: date, start: dt_time, slot_id: int, booked: bool):
+        days.setdefault(specialist_id, {}).setdefault(day, DayAvailability()).add(tick_of(start), slot_id, booked)
+
+    @staticmethod
+    def _remove(days, specialist_id: int, day: date, start: dt_time) -> Optional[bool]:
+        day_availability = days.get(specialist_id, {}).get(day)
+        if day_availability is None:
+            return None
+        was_booked = day_availability.remove(tick_of(start))
+        if not day_availability.starts:
+            del days[specialist_id][day]
+        return was_booked
+
+    @staticmethod
+    def _mark_booked(days, specialist_id: int, day: date, start: dt_time):
+        day_availability = days.get(specialist_id, {}).get(day)
+        if day_availability is not None:
+            day_availability.booked |= day_availability.starts & (1 << tick_of(start))
+
+    def _apply(self, operation: str, *args):
+        with self._lock:
+            result = getattr(self, operation)(self._days, *args)
+            if self._replay is not None:
+                self._replay.append((operation, args))
+        return result
+
+    def add_slot(self, specialist_id: int, day: date, start: dt_time, slot_id: int, booked: bool = False):
+        self._apply("_add", specialist_id, day, start, slot_id, booked)
+
+    def remove_slot(self, specialist_id: int, day: date, start: dt_time) -> Optional[bool]:
+        """Возвращает, был ли слот занят; None — слота в индексе нет (прошедший день)"""
+        return self._apply("_remove", specialist_id, day, start)
+
+    def mark_booked(self, specialist_id: int, day: date, start: dt_time):
+        self._apply("_mark_booked", specialist_id, day, start)
+
+    # ----------------------------
+    # Запросы
+    # ----------------------------
+    def _day(self, specialist_id: int, day: date) -> Optional[DayAvailability]:
+        return self._days.get(specialist_id, {}).get(day)
+
+    def slot(self, specialist_id: int, day: date, start: dt_time) -> Optional[Tuple[int, bool]]:
+        """(id, свободен ли) слота, начинающегося в start; None — такого слота нет"""
+        tick = tick_of(start)
+        bit = 1 << tick
+        with self._lock:
+            day_availability = self._day(specialist_id, day)
+            if day_availability is None or not day_availability.starts & bit:
+                return None
+            return day_availability.slot_id(tick), not day_availability.booked & bit
+
+    def is_free(self, specialist_id: int, day: date, start: dt_time) -> bool:
+        found = self.slot(specialist_id, day, start)
+        return found is not None and found[1]
+
+    def free_slots(
+        self,
+        specialist_id: int,
+        day: date,
+        time_from: Optional[dt_time] = None,
+        time_to: Optional[dt_time] = None,
+    ) -> List[Tuple[dt_time, int]]:
+        """Свободные слоты дня с началом в [time_from, time_to): [(время, id слота)]"""
+        with self._lock:
+            day_availability = self._day(specialist_id, day)
+            if day_availability is None:
+                return []
+            start_tick = tick_of(time_from) if time_from else 0
+            end_tick = tick_of(time_to) if time_to else TICKS_PER_DAY
+            free = day_availability.free & tick_mask(start_tick, end_tick)
+            return [(time_of(tick), day_availability.slot_id(tick)) for tick in _ticks(free)]
+
+    def free_days(self, specialist_id: int, date_from: date, date_to: date) -> List[date]:
+        """Дни в [date_from, date_to], где у специалиста есть хотя бы один свободный слот"""
+        with self._lock:
+            days = self._days.get(specialist_id, {})
+            return sorted(
+                day for day, day_availability in days.items()
+                if date_from <= day <= date_to and day_availability.free
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            days = [day for specialist_days in self._days.values() for day in specialist_days.values()]
+            return {
+                "specialists": len(self._days),
+                "days": len(days),
+                "slots": sum(len(day.slot_ids) for day in days),
+                "free_slots": sum(_popcount(day.free) for day in days),
+                "bytes": sum(day.size() for day in days),
+                "built_at": self.built_at.isoformat() if self.built_at else None,
+            }
+
+
+def create_availability_from_env(session_factory: Callable) -> AvailabilityIndex:
+    return AvailabilityIndex(
+        session_factory,
+        refresh_seconds=float(os.getenv("AVAILABILITY_REFRESH_SECONDS", "300")),
+    )
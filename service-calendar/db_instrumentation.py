@@ -0,0 +1,180 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, List, Optional
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy import event
+
+from metrics import find_route, UNMATCHED_ROUTE
+
+logger = logging.getLogger(__name__)
+
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Время выполнения SQL-запроса",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request",
+    "Число SQL-запросов на один HTTP-запрос",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 250),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds",
+    "Суммарное время SQL-запросов на один HTTP-запрос",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+DB_QUERY_BUDGET_EXCEEDED = Counter(
+    "db_query_budget_exceeded_total",
+    "Запросы, превысившие бюджет SQL-запросов маршрута",
+    ["route"],
+)
+
+# Бюджет по умолчанию для маршрутов без @query_budget (пусто — без ограничения)
+DEFAULT_QUERY_BUDGET = int(os.getenv("DB_QUERY_BUDGET_DEFAULT", "0")) or None
+# Строгий режим для тестов: превышение бюджета роняет запрос вместо предупреждения в лог
+QUERY_BUDGET_STRICT = os.getenv("DB_QUERY_BUDGET_STRICT", "0") == "1"
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Маршрут выполнил больше SQL-запросов, чем допускает его бюджет"""
+
+
+class QueryStats:
+    """Счётчики SQL-запросов в рамках одного HTTP-запроса (или блока track_queries)"""
+
+    __slots__ = ("count", "duration", "statements")
+
+    def __init__(self, keep_statements: bool = False):
+        self.count = 0
+        self.duration = 0.0
+        # Тексты запросов — только по требованию (для сообщения о превышении бюджета)
+        self.statements: Optional[List[str]] = [] if keep_statements else None
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries"'
+
+
+# Изменяемый объект в contextvar: FastAPI копирует контекст в поток синхронного
+# обработчика, поэтому запросы из пула потоков попадают в статистику HTTP-запроса
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar("db_query_stats", default=None)
+
+
+@contextmanager
+def track_queries(keep_statements: bool = False) -> Iterator[QueryStats]:
+    """Считает SQL-запросы, выполненные внутри блока в текущем контексте"""
+    stats = QueryStats(keep_statements)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def query_budget(max_queries: int):
+    """
+    Бюджет SQL-запросов маршрута:
+
+        @app.get("/admin/timeslots/")
+        @query_budget(1)
+        def read_all_slots(...):
+    """
+    def decorator(func):
+        func.__query_budget__ = max_queries
+        return func
+    return decorator
+
+
+# ----------------------------
+# События SQLAlchemy
+# ----------------------------
+def _format_params(parameters, limit: int = 500) -> str:
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def instrument_engine(engine, slow_query_ms: Optional[float] = None):
+    """Подписывается на выполнение запросов engine: метрики, статистика запроса, лог медленных"""
+    if slow_query_ms is None:
+        slow_query_ms = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        DB_QUERY_DURATION.labels(operation).observe(duration)
+
+        stats = _current_stats.get()
+        if stats is not None:
+            stats.count += 1
+            stats.duration += duration
+            if stats.statements is not None:
+                stats.statements.append(" ".join(statement.split()))
+
+        if duration * 1000 >= slow_query_ms:
+            logger.warning(
+                f"Медленный SQL-запрос ({duration * 1000:.0f} мс): {' '.join(statement.split())} "
+                f"| параметры: {_format_params(parameters)}"
+            )
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # Запрос упал — снимаем отметку времени, чтобы стек не рос
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start"):
+            conn.info["query_start"].pop()
+
+
+# ----------------------------
+# Middleware
+# ----------------------------
+class QueryStatsMiddleware:
+    """
+    Считает SQL-запросы каждого HTTP-запроса: заголовок Server-Timing,
+    метрики по маршрутам и проверка бюджета (@query_budget).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route = find_route(scope)
+        route_path = getattr(route, "path", UNMATCHED_ROUTE)
+        budget = getattr(getattr(route, "endpoint", None), "__query_budget__", DEFAULT_QUERY_BUDGET)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                self._check_budget(route_path, budget, stats)
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", stats.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with track_queries(keep_statements=QUERY_BUDGET_STRICT) as stats:
+            await self.app(scope, receive, send_wrapper)
+        DB_QUERIES_PER_REQUEST.labels(route_path).observe(stats.count)
+        DB_TIME_PER_REQUEST.labels(route_path).observe(stats.duration)
+
+    @staticmethod
+    def _check_budget(route_path: str, budget: Optional[int], stats: QueryStats):
+        if budget is None or stats.count <= budget:
+            return
+        DB_QUERY_BUDGET_EXCEEDED.labels(route_path).inc()
+        message = f"{route_path}: выполнено {stats.count} SQL-запросов при бюджете {budget}"
+        if QUERY_BUDGET_STRICT:
+            raise QueryBudgetExceeded(message + "\n" + "\n".join(stats.statements or []))
+        logger.warning(message)
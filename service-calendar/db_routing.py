@@ -0,0 +1,206 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Callable, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики: NULL, если реплика не получает WAL с первичной (приёмник WAL
+# отключён — «всё применено» тогда ничего не значит); 0, если всё полученное WAL
+# уже применено (первичная простаивает); иначе — время с последней применённой транзакции
+REPLICA_LAG_SQL = text(
+    """
+    SELECT CASE
+               WHEN NOT pg_is_in_recovery() THEN 0
+               WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+               WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+               ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END
+    """
+)
+
+# Заголовок «читать с первичной»: ответ на запись несёт в нём срок (unix-время),
+# клиент повторяет заголовок в своих запросах, пока срок не истёк
+READ_YOUR_WRITES_HEADER = "X-Read-Your-Writes"
+
+
+class Replica:
+    def __init__(self, name: str, engine):
+        self.name = name
+        self.engine = engine
+        self.session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        self.lag: Optional[float] = None  # None — недоступна или ещё не проверялась
+
+    def check(self) -> Optional[float]:
+        try:
+            with self.engine.connect() as conn:
+                lag = conn.execute(REPLICA_LAG_SQL).scalar()
+        except Exception as e:
+            if self.lag is not None:
+                logger.warning(f"Реплика {self.name} недоступна: {e}")
+            self.lag = None
+            return None
+        if lag is None and self.lag is not None:
+            logger.warning(f"Реплика {self.name} не получает WAL с первичной")
+        self.lag = None if lag is None else float(lag)
+        return self.lag
+
+
+class DatabaseRouter:
+    """
+    Первичная база для записи и N реплик для чтения.
+
+    Фоновый поток каждые check_seconds измеряет отставание реплик; реплика,
+    отстающая больше max_lag_seconds, недоступная или потерявшая соединение
+    с первичной (приёмник WAL не в состоянии streaming), не получает чтений,
+    пока не догонит. Без подходящих реплик чтения идут на первичную.
+
+    Read-your-writes: ответ на успешную запись содержит заголовок
+    READ_YOUR_WRITES_HEADER со сроком через read_your_writes_seconds; чтения,
+    в которых клиент повторил заголовок, до этого срока идут на первичную.
+    Заголовок, а не cookie: фронтенд обращается к шлюзу с другого origin без
+    credentials, и cookie браузер не сохранил бы. Окно должно быть больше
+    max_lag_seconds — тогда реплика, получившая чтение после окна, уже
+    содержит запись.
+    """
+
+    def __init__(
+        self,
+        primary_engine,
+        replica_engines: List = (),
+        max_lag_seconds: float = 5,
+        check_seconds: float = 2,
+        read_your_writes_seconds: float = 10,
+    ):
+        self.primary_engine = primary_engine
+        self.primary_session = sessionmaker(autocommit=False, autoflush=False, bind=primary_engine)
+        self.replicas = [Replica(f"replica-{i}", engine) for i, engine in enumerate(replica_engines, start=1)]
+        self.max_lag_seconds = max_lag_seconds
+        self.check_seconds = check_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._round_robin = itertools.count()
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    # ----------------------------
+    # Проверка отставания
+    # ----------------------------
+    def start(self):
+        if not self.replicas or self._thread is not None:
+            return
+        self.check_replicas()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="replica-lag", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Чтение с реплик: {len(self.replicas)} шт., допустимое отставание {self.max_lag_seconds} с, "
+            f"read-your-writes {self.read_your_writes_seconds} с"
+        )
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.check_seconds):
+            self.check_replicas()
+
+    def check_replicas(self):
+        for replica in self.replicas:
+            was_available = self._is_available(replica)
+            replica.check()
+            if was_available != self._is_available(replica):
+                state = "снова принимает чтения" if self._is_available(replica) else "исключена из чтения"
+                logger.warning(f"Реплика {replica.name} {state} (отставание {replica.lag})")
+
+    def _is_available(self, replica: Replica) -> bool:
+        return replica.lag is not None and replica.lag <= self.max_lag_seconds
+
+    # ----------------------------
+    # Выбор базы
+    # ----------------------------
+    def read_replica(self) -> Optional[Replica]:
+        """Следующая по кругу реплика с допустимым отставанием; None — читать с первичной"""
+        available = [replica for replica in self.replicas if self._is_available(replica)]
+        if not available:
+            return None
+        return available[next(self._round_robin) % len(available)]
+
+    def read_session_factory(self, sticky: bool = False) -> Callable:
+        replica = None if sticky else self.read_replica()
+        return replica.session_factory if replica else self.primary_session
+
+    def sticky_token(self) -> str:
+        """Значение READ_YOUR_WRITES_HEADER для ответа на запись"""
+        return f"{time.time() + self.read_your_writes_seconds:.3f}"
+
+    def is_sticky(self, token: Optional[str]) -> bool:
+        """
+        Читать ли с первичной по присланному клиентом заголовку. Срок дальше
+        окна read-your-writes не принимается: иначе клиент закрепил бы себя
+        за первичной навсегда.
+        """
+        if not token:
+            return False
+        try:
+            deadline = float(token)
+        except ValueError:
+            return False
+        now = time.time()
+        return now < deadline <= now + self.read_your_writes_seconds + 1
+
+    def stats(self) -> dict:
+        lags = [replica.lag for replica in self.replicas if replica.lag is not None]
+        return {
+            "replicas": len(self.replicas),
+            "available": sum(self._is_available(replica) for replica in self.replicas),
+            "max_lag_seconds": max(lags) if lags else 0,
+        }
+
+
+class ReadYourWritesMiddleware:
+    """Добавляет READ_YOUR_WRITES_HEADER к успешным ответам пишущих запросов (не GET/HEAD/OPTIONS)"""
+
+    def __init__(self, app, router: DatabaseRouter):
+        self.app = app
+        self.router = router
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in ("GET", "HEAD", "OPTIONS") or not self.router.replicas:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and 200 <= message["status"] < 300:
+                headers = list(message.get("headers", []))
+                headers.append((READ_YOUR_WRITES_HEADER.lower().encode("latin-1"), self.router.sticky_token().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+def database_url(host: str) -> str:
+    return f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@{host}/{os.getenv('DB_NAME')}"
+
+
+def create_router_from_env(primary_engine, engine_factory: Callable = create_engine) -> DatabaseRouter:
+    """
+    DB_REPLICA_HOSTS — адреса реплик через запятую (host:port), учётные данные
+    и имя базы те же, что у первичной. Пусто — все запросы идут на первичную.
+    """
+    hosts = [host.strip() for host in os.getenv("DB_REPLICA_HOSTS", "").split(",") if host.strip()]
+    return DatabaseRouter(
+        primary_engine,
+        [engine_factory(database_url(host), pool_pre_ping=True) for host in hosts],
+        max_lag_seconds=float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5")),
+        check_seconds=float(os.getenv("DB_REPLICA_CHECK_SECONDS", "2")),
+        read_your_writes_seconds=float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "10")),
+    )
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from datetime import date, datetime
+from typing import Callable, List, Optional, Set
+
+from sqlalchemy import text
+
+logger = logging.getLogger(__name__)
+
+# Канал Postgres LISTEN/NOTIFY для изменений слотов
+CHANNEL = "slot_availability"
+# Экземпляр сервиса: свои события не применяются к индексу доступности повторно
+INSTANCE_ID = uuid.uuid4().hex[:12]
+
+SLOT_ADDED = "slot-added"
+SLOT_REMOVED = "slot-removed"
+SLOT_TAKEN = "slot-taken"
+# Часть событий могла потеряться (переподключение, переполнение очереди) — клиенту нужно перечитать слоты
+RESYNC = "resync"
+
+
+def slot_event(event_type: str, slot, **extra) -> dict:
+    return {
+        "type": event_type,
+        "slot_id": slot.id,
+        "specialist_id": slot.id_employer,
+        "date": slot.date.isoformat(),
+        "time_start": slot.time_start.strftime("%H:%M"),
+        **extra,
+    }
+
+
+def publish(db, *events: dict):
+    """
+    Отправляет события через pg_notify в транзакции сессии db: Postgres
+    доставит их слушателям всех экземпляров только после коммита,
+    а при откате не доставит вовсе. Все события — одним запросом.
+    """
+    if not events:
+        return
+    params = {"channel": CHANNEL}
+    calls = []
+    for i, event in enumerate(events):
+        params[f"payload_{i}"] = json.dumps({**event, "origin": INSTANCE_ID})
+        calls.append(f"pg_notify(:channel, :payload_{i})")
+    db.execute(text("SELECT " + ", ".join(calls)), params)
+
+
+# ----------------------------
+# Подписчики (SSE)
+# ----------------------------
+class Subscription:
+    """Подписка одного клиента: фильтр по дате и/или специалисту и очередь событий в его event loop"""
+
+    def __init__(self, loop, day: Optional[date], specialist_id: Optional[int], max_queue: int):
+        self.loop = loop
+        self.day = day.isoformat() if day else None
+        self.specialist_id = specialist_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+
+    def matches(self, event: dict) -> bool:
+        if event["type"] == RESYNC:
+            return True
+        if self.day is not None and event.get("date") != self.day:
+            return False
+        if self.specialist_id is not None and event.get("specialist_id") != self.specialist_id:
+            return False
+        return True
+
+    def offer(self, event: dict):
+        """Вызывается в event loop подписчика. Медленный клиент вместо потерянных событий получит resync"""
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": RESYNC})
+
+
+class LiveBroker:
+    """Раздача событий слотов подписчикам этого экземпляра; dispatch можно вызывать из любого потока"""
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self._subscriptions: Set[Subscription] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, day: Optional[date] = None, specialist_id: Optional[int] = None) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop(), day, specialist_id, self.max_queue)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscriptions)
+
+    def dispatch(self, event: dict):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.matches(event):
+                try:
+                    subscription.loop.call_soon_threadsafe(subscription.offer, event)
+                except RuntimeError:
+                    # event loop уже закрыт (остановка сервиса)
+                    self.unsubscribe(subscription)
+
+
+def format_sse(event: dict) -> str:
+    data = {key: value for key, value in event.items() if key not in ("type", "origin")}
+    return f"event: {event['type']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# ----------------------------
+# LISTEN
+# ----------------------------
+class NotificationListener:
+    """
+    Фоновый поток с отдельным соединением Postgres, подписанным на CHANNEL.
+    Каждое событие передаётся обработчикам; после переподключения
+    (события за время разрыва потеряны) обработчики получают resync.
+    """
+
+    def __init__(self, engine, handlers: List[Callable[[dict], None]], reconnect_delay: float = 5):
+        self.engine = engine
+        self.handlers = handlers
+        self.reconnect_delay = reconnect_delay
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="slot-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _connect(self):
+        # Соединение изымается из пула: LISTEN живёт, пока соединение открыто
+        raw = self.engine.raw_connection()
+        raw.detach()
+        conn = raw.dbapi_connection if hasattr(raw, "dbapi_connection") else raw.connection
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    def _run(self):
+        connected_before = False
+        while not self._stop_event.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                logger.info(f"Подписка на изменения слотов ({CHANNEL}) активна")
+                if connected_before:
+                    self._handle({"type": RESYNC})
+                connected_before = True
+                while not self._stop_event.is_set():
+                    if select.select([conn], [], [], 1.0)[0]:
+                        conn.poll()
+                        while conn.notifies:
+                            self._handle_payload(conn.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Подписка на изменения слотов прервана: {e}")
+                self._stop_event.wait(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _handle_payload(self, payload: str):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Некорректное событие в канале {CHANNEL}: {payload!r}")
+            return
+        self._handle(event)
+
+    def _handle(self, event: dict):
+        for handler in self.handlers:
+            try:
+                handler(event)
+            except Exception as e:
+                logger.error(f"Ошибка обработки события {event.get('type')}: {e}")
+
+
+def apply_to_index(index, event: dict):
+    """Применяет событие другого экземпляра к индексу доступности (availability.py)"""
+    if event["type"] == RESYNC:
+        index.refresh_soon()
+        return
+    if event.get("origin") == INSTANCE_ID or event.get("specialist_id") is None:
+        return
+    day = date.fromisoformat(event["date"])
+    start = datetime.strptime(event["time_start"], "%H:%M").time()
+    if event["type"] == SLOT_ADDED:
+        index.add_slot(event["specialist_id"], day, start, event["slot_id"], event.get("booked", False))
+    elif event["type"] == SLOT_REMOVED:
+        index.remove_slot(event["specialist_id"], day, start)
+    elif event["type"] == SLOT_TAKEN:
+        index.mark_booked(event["specialist_id"], day, start)
+
+
+def create_broker_from_env() -> LiveBroker:
+    return LiveBroker(max_queue=int(os.getenv("LIVE_QUEUE_SIZE", "100")))
@@ -1,18 +1,30 @@
 import logging
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, tuple_
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import OperationalError, IntegrityError
 from dotenv import load_dotenv
 from fastapi import Response
+import asyncio
 import os
 import time
 from datetime import datetime, timedelta, date as _date
 from typing import List, Optional
 from pydantic import BaseModel
-from models import Base, CategoryService, TimeSlot, User, OnlineRegistration, Client, CompanyDescription  # Импорт всех моделей
-import httpx
+from models import Base, CategoryService, TimeSlot, User, OnlineRegistration, Client, CompanyDescription, AvailabilityDayCounter  # Импорт всех моделей
+from notifications import create_notifier_from_env
+from availability import create_availability_from_env
+from live import (
+    SLOT_ADDED, SLOT_REMOVED, SLOT_TAKEN, NotificationListener, apply_to_index, create_broker_from_env,
+    format_sse, publish, slot_event
+)
+from metrics import instrument_app, register_db_pool, register_stats
+from db_routing import READ_YOUR_WRITES_HEADER, ReadYourWritesMiddleware, create_router_from_env
+from db_instrumentation import QueryStatsMiddleware, instrument_engine, query_budget
+from profiling import install_profiling
+from tracing import install_tracing, instrument_engine as trace_engine, start_span
 from ics import Calendar, Event
 from zoneinfo import ZoneInfo
 
@@ -32,8 +44,19 @@ app.add_middleware(
     allow_origins=["http://localhost:5173"],
     allow_methods=["*"],
     allow_headers=["*"],
+    # Срок read-your-writes: фронтенд читает его из ответа на запись и повторяет в запросах
+    expose_headers=[READ_YOUR_WRITES_HEADER],
 )
 
+# Метрики Prometheus: задержки по маршрутам, GET /metrics
+instrument_app(app)
+# Число и время SQL-запросов на HTTP-запрос: Server-Timing, метрики, бюджеты @query_budget
+app.add_middleware(QueryStatsMiddleware)
+# Профиль отдельного запроса по заголовку X-Profile-Token (только если задан PROFILING_TOKEN)
+install_profiling(app)
+# Трассировка W3C traceparent: продолжение трассы шлюза, участки SQL, ICS и уведомлений
+install_tracing(app, "calendar")
+
 # Модели для запросов и ответов API
 class ServiceResponse(BaseModel):
     id: int
@@ -49,6 +72,33 @@ class TimeSlotResponse(BaseModel):
     service_name: str
     specialist_name: str
 
+class AvailableSlotResponse(TimeSlotResponse):
+    specialist_id: int
+    category_id: int
+
+class FreeSlotResponse(BaseModel):
+    id: int
+    time_start: str
+
+class FreeDaysResponse(BaseModel):
+    specialist_id: int
+    days: List[str]
+
+class SlotAvailabilityResponse(BaseModel):
+    id: int
+    free: bool
+
+class DayCounterResponse(BaseModel):
+    date: str
+    total: int
+    booked: int
+    free: int
+
+class MonthAvailabilityResponse(BaseModel):
+    month: str
+    specialist_id: Optional[int] = None
+    days: List[DayCounterResponse]
+
 class SpecialistResponse(BaseModel):
     id: int
     role: str
@@ -110,6 +160,19 @@ DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@
 logger.info(f"Подключение к базе данных по URL: {DATABASE_URL}")
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+register_db_pool(engine, "calendar")
+instrument_engine(engine)
+trace_engine(engine)
+
+# Реплики для чтения (DB_REPLICA_HOSTS): GET-маршруты читают с них, запись — только первичная
+db_router = create_router_from_env(engine)
+for replica in db_router.replicas:
+    register_db_pool(replica.engine, f"calendar-{replica.name}")
+    instrument_engine(replica.engine)
+    trace_engine(replica.engine)
+register_stats("db_replicas", db_router.stats)
+# После записи клиент какое-то время читает с первичной (read-your-writes)
+app.add_middleware(ReadYourWritesMiddleware, router=db_router)
 
 # Dependency для получения сессии БД
 def get_db():
@@ -119,6 +182,14 @@ def get_db():
     finally:
         db.close()
 
+# Dependency для чтения: реплика, если клиент недавно ничего не записывал и реплика не отстаёт
+def get_read_db(request: Request):
+    db = db_router.read_session_factory(sticky=db_router.is_sticky(request.headers.get(READ_YOUR_WRITES_HEADER)))()
+    try:
+        yield db
+    finally:
+        db.close()
+
 # Ожидание подключения к базе данных
 def wait_for_db(engine, retries=5, delay=5):
     for i in range(retries):
@@ -133,7 +204,51 @@ def wait_for_db(engine, retries=5, delay=5):
 
 wait_for_db(engine)
 
+# Уведомления о записях специалистам со сводками за окно агрегации
+notifier = create_notifier_from_env()
+
+# Свободные слоты специалистов в памяти (битовые маски по дням)
+availability = create_availability_from_env(SessionLocal)
+
+@app.on_event("startup")
+def start_notifier():
+    notifier.start()
+
+@app.on_event("shutdown")
+def stop_notifier():
+    notifier.stop()
+
+@app.on_event("startup")
+def start_availability():
+    availability.start()
+
+@app.on_event("shutdown")
+def stop_availability():
+    availability.stop()
+
+# Изменения слотов всех экземпляров (LISTEN/NOTIFY): подписчикам SSE и в индекс доступности
+live_broker = create_broker_from_env()
+slot_listener = NotificationListener(engine, [lambda event: apply_to_index(availability, event), live_broker.dispatch])
+LIVE_KEEPALIVE_SECONDS = float(os.getenv("LIVE_KEEPALIVE_SECONDS", "15"))
+
+@app.on_event("startup")
+def start_db_router():
+    db_router.start()
+
+@app.on_event("shutdown")
+def stop_db_router():
+    db_router.stop()
+
+@app.on_event("startup")
+def start_slot_listener():
+    slot_listener.start()
+
+@app.on_event("shutdown")
+def stop_slot_listener():
+    slot_listener.stop()
+
 @app.post("/bookings/", response_class=Response)
+@query_budget(9)
 def create_booking(booking: BookingRequest, db: Session = Depends(get_db)):
     """
     Создание бронирования временного слота, генерация ICS-файла и отправка уведомлений
@@ -158,7 +273,8 @@ def create_booking(booking: BookingRequest, db: Session = Depends(get_db)):
 
         # 2. Проверяем, что слот ещё не забронирован
         existing_booking = db.query(OnlineRegistration).filter(
-            OnlineRegistration.id_time_slot == booking.time_slot_id
+            OnlineRegistration.id_time_slot == booking.time_slot_id,
+            OnlineRegistration.slot_date == time_slot.date
         ).first()
         if existing_booking:
             raise HTTPException(status_code=400, detail="This time slot is already booked")
@@ -173,14 +289,16 @@ def create_booking(booking: BookingRequest, db: Session = Depends(get_db)):
             id_client=booking.client_id,
             id_employer=booking.employer_id,
             id_time_slot=booking.time_slot_id,
+            slot_date=time_slot.date,
             id_adress_company=booking.company_id,
             date_time_create=datetime.utcnow()
         )
         db.add(new_booking)
-        db.commit()
-        db.refresh(new_booking)
+        db.flush()
+        publish(db, slot_event(SLOT_TAKEN, time_slot))
 
-        # 5. Подготавливаем данные для уведомлений
+        # 5. Подготавливаем данные для уведомлений и ICS до коммита: после него
+        # объекты сессии устаревают, и каждое обращение к ним — новый SELECT
         booking_data = {
             "client_name": f"{client.name} {client.last_name or ''}",
             "phone": client.phone_number,
@@ -189,63 +307,48 @@ def create_booking(booking: BookingRequest, db: Session = Depends(get_db)):
             "service_name": service.name_category if service else "Не указана",
             "specialist_name": f"{employer.name} {employer.last_name}"
         }
+        slot_position = (time_slot.id_employer, time_slot.date, time_slot.time_start)
+        appointment_start = datetime.combine(time_slot.date, time_slot.time_start)
+        headers = {
+            "Content-Disposition": f"attachment; filename=appointment_{new_booking.id}.ics",
+            "Content-Type": "text/calendar"
+        }
+
+        # 6. Генерация ICS-файла
+        with start_span("booking.ics"):
+            calendar = Calendar()
+            event = Event()
+            event.name = f"Запись на приём: {service.name_category}"
+            event.begin = appointment_start
+            event.end = appointment_start + timedelta(minutes=service.time_width_minutes_end)
+            event.description = (
+                f"Клиент: {client.name} {client.last_name or ''}\n"
+                f"Специалист: {employer.name} {employer.last_name}\n"
+                f"Услуга: {service.name_category}"
+            )
+            event.location = (
+                f"{company.company_adress_city}, "
+                f"{company.company_adress_street} {company.company_adress_house_number}"
+            )
+            calendar.events.add(event)
+            ics_content = str(calendar)
+
+        db.commit()
+        availability.mark_booked(*slot_position)
 
         logger.info(
             "Новая запись создана:\n"
-            f"  Дата: {time_slot.date}\n"
-            f"  Время: {time_slot.time_start}\n"
+            f"  Дата: {appointment_start.date()}\n"
+            f"  Время: {appointment_start.time()}\n"
             f"  Клиент: {booking_data['client_name']} (тел.: {booking_data['phone']})\n"
             f"  Услуга: {booking_data['service_name']}\n"
             f"  Специалист: {booking_data['specialist_name']}"
         )
 
-        # 6. Отправка в телеграм-бот (если настроено)
-        try:
-            bot_service_url = f"http://{os.getenv('TELEGRAM_BOT_SERVICE')}/send-appointment"
-            with httpx.Client(timeout=5.0) as client_http:
-                resp = client_http.post(bot_service_url, json=booking_data)
-                if resp.status_code != 200:
-                    logger.error(f"Ошибка отправки в телеграм-бот: {resp.text}")
-        except Exception as e:
-            logger.error(f"Не удалось отправить данные в телеграм-бот: {e}")
-
-        # 7. Отправка WhatsApp-уведомления
-        try:
-            whatsapp_url = os.getenv("WHATSAPP_SERVICE_URL")  # например "http://localhost:7001"
-            with httpx.Client(timeout=5.0) as client_http:
-                resp = client_http.post(
-                    f"http://{whatsapp_url}/send-notification",
-                    json=booking_data
-                )
-                if resp.status_code != 200:
-                    logger.error(f"WhatsApp notification failed: {resp.text}")
-        except Exception as e:
-            logger.error(f"Error when sending WhatsApp notification: {e}")
-
-        # 8. Генерация ICS-файла
-        start_dt = datetime.combine(time_slot.date, time_slot.time_start)
-        end_dt = start_dt + timedelta(minutes=service.time_width_minutes_end)
-        calendar = Calendar()
-        event = Event()
-        event.name = f"Запись на приём: {service.name_category}"
-        event.begin = start_dt
-        event.end = end_dt
-        event.description = (
-            f"Клиент: {client.name} {client.last_name or ''}\n"
-            f"Специалист: {employer.name} {employer.last_name}\n"
-            f"Услуга: {service.name_category}"
-        )
-        event.location = (
-            f"{company.company_adress_city}, "
-            f"{company.company_adress_street} {company.company_adress_house_number}"
-        )
-        calendar.events.add(event)
-        ics_content = str(calendar)
+        # 7. Уведомления: клиенту в WhatsApp сразу, специалисту — через агрегацию
+        with start_span("booking.notify"):
+            notifier.notify_booking(booking_data, appointment_start.replace(tzinfo=ZoneInfo("Europe/Moscow")))
 
-        headers = {
-            "Content-Disposition": f"attachment; filename=appointment_{new_booking.id}.ics",
-            "Content-Type": "text/calendar"
-        }
         return Response(content=ics_content, media_type="text/calendar", headers=headers)
 
     except IntegrityError as e:
@@ -260,7 +363,8 @@ def create_booking(booking: BookingRequest, db: Session = Depends(get_db)):
 
 
 @app.get("/services/", response_model=List[ServiceResponse])
-def get_all_services(db: Session = Depends(get_db)):
+@query_budget(1)
+def get_all_services(db: Session = Depends(get_read_db)):
     """Получение списка всех услуг с их подуслугами"""
     try:
         services = db.query(CategoryService).all()
@@ -277,8 +381,124 @@ def get_all_services(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Internal server error")
     
 
+def parse_time_of_day(value: Optional[str], field: str):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%H:%M").time()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Неверный формат {field}. Используйте HH:MM.")
+
+# /timeslots/stream/ и /timeslots/next-available/ объявлены до /timeslots/{date},
+# чтобы путь не принимался за дату
+@app.get("/timeslots/stream/")
+@query_budget(0)
+async def stream_slot_changes(date: Optional[str] = None, specialist_id: Optional[int] = None):
+    """
+    Server-Sent Events об изменениях слотов на дату и/или у специалиста:
+    slot-taken (забронирован), slot-added, slot-removed. Событие resync значит,
+    что часть изменений потеряна и слоты нужно перечитать.
+    """
+    subscription = live_broker.subscribe(parse_day(date) if date else None, specialist_id)
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            live_broker.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/timeslots/next-available/", response_model=List[AvailableSlotResponse])
+@query_budget(1)
+def get_next_available_slots(
+    after: Optional[datetime] = None,
+    limit: int = Query(5, ge=1, le=50),
+    specialist_id: Optional[int] = None,
+    category_id: Optional[int] = None,
+    time_from: Optional[str] = None,
+    time_to: Optional[str] = None,
+    until: Optional[_date] = None,
+    db: Session = Depends(get_read_db),
+):
+    """
+    Первые limit свободных слотов, начинающихся не раньше after (по умолчанию и
+    не раньше, чем сейчас по МСК). Фильтры: специалист, категория, окно времени
+    начала [time_from, time_to) и последняя дата until.
+
+    Один запрос: слоты читаются по индексу (date, time_start) в порядке времени,
+    занятые отсекаются анти-джойном к записям той же секции, и обход
+    останавливается на LIMIT — сколько дней до первого свободного слота, не важно.
+    """
+    window_start = parse_time_of_day(time_from, "time_from")
+    window_end = parse_time_of_day(time_to, "time_to")
+
+    now_msk = datetime.now(ZoneInfo("Europe/Moscow")).replace(tzinfo=None)
+    if after is None:
+        start = now_msk
+    else:
+        if after.tzinfo is not None:
+            after = after.astimezone(ZoneInfo("Europe/Moscow")).replace(tzinfo=None)
+        start = max(after, now_msk)
+
+    booked = db.query(OnlineRegistration.id).filter(
+        OnlineRegistration.id_time_slot == TimeSlot.id,
+        OnlineRegistration.slot_date == TimeSlot.date
+    ).exists()
+    query = (
+        db.query(TimeSlot, CategoryService, User)
+          .join(CategoryService, TimeSlot.id_category_service == CategoryService.id)
+          .join(User, TimeSlot.id_employer == User.id)
+          # Условие на date отдельно — для отсечения секций прошлых месяцев
+          .filter(TimeSlot.date >= start.date())
+          .filter(tuple_(TimeSlot.date, TimeSlot.time_start) >= tuple_(start.date(), start.time()))
+          .filter(~booked)
+    )
+    if until is not None:
+        query = query.filter(TimeSlot.date <= until)
+    if specialist_id is not None:
+        query = query.filter(TimeSlot.id_employer == specialist_id)
+    if category_id is not None:
+        query = query.filter(TimeSlot.id_category_service == category_id)
+    if window_start is not None:
+        query = query.filter(TimeSlot.time_start >= window_start)
+    if window_end is not None:
+        query = query.filter(TimeSlot.time_start < window_end)
+
+    rows = query.order_by(TimeSlot.date, TimeSlot.time_start, TimeSlot.id).limit(limit).all()
+
+    result: List[AvailableSlotResponse] = []
+    for ts, svc, usr in rows:
+        end_time = (
+            datetime.combine(datetime.min, ts.time_start)
+            + timedelta(minutes=svc.time_width_minutes_end)
+        ).time()
+        result.append(AvailableSlotResponse(
+            id=ts.id,
+            date=ts.date.strftime("%Y-%m-%d"),
+            time_start=ts.time_start.strftime("%H:%M"),
+            time_end=end_time.strftime("%H:%M"),
+            service_name=svc.name_category,
+            specialist_name=f"{usr.name} {usr.last_name}",
+            specialist_id=usr.id,
+            category_id=svc.id
+        ))
+    return result
+
 @app.get("/timeslots/{date}", response_model=List[TimeSlotResponse])
-def get_time_slots_by_date(date: str, db: Session = Depends(get_db)):
+@query_budget(2)
+def get_time_slots_by_date(date: str, db: Session = Depends(get_read_db)):
     """
     Возвращает слоты на дату запроса +1 день. 
     Если effective_date (date+1) < сегодня (МСК) — возвращает пустой список.
@@ -295,11 +515,10 @@ def get_time_slots_by_date(date: str, db: Session = Depends(get_db)):
     if effective_date < today_msk:
         return []
 
-    # Собираем занятые слоты на effective_date
+    # Собираем занятые слоты на effective_date (slot_date — дата слота, читается одна секция)
     booked_rows = (
         db.query(OnlineRegistration.id_time_slot)
-          .join(TimeSlot, OnlineRegistration.id_time_slot == TimeSlot.id)
-          .filter(TimeSlot.date == effective_date)
+          .filter(OnlineRegistration.slot_date == effective_date)
           .all()
     )
     booked_ids = {row[0] for row in booked_rows}
@@ -339,7 +558,8 @@ def get_time_slots_by_date(date: str, db: Session = Depends(get_db)):
 
     
 @app.get("/specialists/", response_model=List[SpecialistResponse])
-def get_all_specialists(category_id: Optional[int] = None, db: Session = Depends(get_db)):
+@query_budget(1)
+def get_all_specialists(category_id: Optional[int] = None, db: Session = Depends(get_read_db)):
     """Получение списка всех специалистов клиники с возможностью фильтрации по category_id"""
     try:
         query = db.query(
@@ -375,7 +595,8 @@ def get_all_specialists(category_id: Optional[int] = None, db: Session = Depends
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @app.get("/company/", response_model=CompanyResponse)
-def get_company_info(db: Session = Depends(get_db)):
+@query_budget(1)
+def get_company_info(db: Session = Depends(get_read_db)):
     """Получение информации о компании"""
     try:
         company = db.query(CompanyDescription).first()
@@ -420,17 +641,31 @@ def get_company_info(db: Session = Depends(get_db)):
         logger.error(f"Ошибка при получении информации о компании: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+def has_bookings(db: Session, slot: TimeSlot) -> bool:
+    """Есть ли записи на слот; поиск идёт только в секции месяца слота"""
+    return db.query(
+        db.query(OnlineRegistration.id).filter(
+            OnlineRegistration.id_time_slot == slot.id,
+            OnlineRegistration.slot_date == slot.date
+        ).exists()
+    ).scalar()
+
 @app.get("/admin/timeslots/", response_model=List[AdminTimeSlotResponse])
-def read_all_slots(db: Session = Depends(get_db)):
+@query_budget(1)
+def read_all_slots(db: Session = Depends(get_read_db)):
     """
     Возвращает все временные слоты (для администратора), включая вычисленное time_end.
     """
-    slots = db.query(TimeSlot).all()
+    # Длительность услуги берём тем же запросом, а не отдельным SELECT на каждый слот
+    rows = (
+        db.query(TimeSlot, CategoryService.time_width_minutes_end)
+          .outerjoin(CategoryService, TimeSlot.id_category_service == CategoryService.id)
+          .all()
+    )
     result = []
-    for slot in slots:
+    for slot, time_width in rows:
         # вычисляем time_end
-        service = db.query(CategoryService).filter(CategoryService.id == slot.id_category_service).first()
-        duration = service.time_width_minutes_end if service else 0
+        duration = time_width or 0
         end_time = (datetime.combine(_date.min, slot.time_start) + timedelta(minutes=duration)).time().strftime("%H:%M")
         result.append(AdminTimeSlotResponse(
             id=slot.id,
@@ -443,15 +678,21 @@ def read_all_slots(db: Session = Depends(get_db)):
     return result
 
 @app.get("/admin/timeslots/{slot_id}/", response_model=AdminTimeSlotResponse)
-def read_slot(slot_id: int, db: Session = Depends(get_db)):
+@query_budget(1)
+def read_slot(slot_id: int, db: Session = Depends(get_read_db)):
     """
     Возвращает один временной слот по ID (для администратора).
     """
-    slot = db.query(TimeSlot).filter(TimeSlot.id == slot_id).first()
-    if not slot:
+    row = (
+        db.query(TimeSlot, CategoryService.time_width_minutes_end)
+          .outerjoin(CategoryService, TimeSlot.id_category_service == CategoryService.id)
+          .filter(TimeSlot.id == slot_id)
+          .first()
+    )
+    if not row:
         raise HTTPException(status_code=404, detail="TimeSlot not found")
-    service = db.query(CategoryService).filter(CategoryService.id == slot.id_category_service).first()
-    duration = service.time_width_minutes_end if service else 0
+    slot, time_width = row
+    duration = time_width or 0
     end_time = (datetime.combine(_date.min, slot.time_start) + timedelta(minutes=duration)).time().strftime("%H:%M")
     return AdminTimeSlotResponse(
         id=slot.id,
@@ -463,6 +704,7 @@ def read_slot(slot_id: int, db: Session = Depends(get_db)):
     )
 
 @app.post("/admin/timeslots/", response_model=AdminTimeSlotResponse, status_code=201)
+@query_budget(6)
 def create_slot(payload: AdminTimeSlotCreate, db: Session = Depends(get_db)):
     """
     Создание нового временного слота (для администратора).
@@ -493,6 +735,10 @@ def create_slot(payload: AdminTimeSlotCreate, db: Session = Depends(get_db)):
     if conflict:
         raise HTTPException(status_code=400, detail="TimeSlot already exists for this employer at this datetime")
 
+    # Вычисляем time_end до коммита: после него service устареет и перечитается отдельным SELECT
+    duration = service.time_width_minutes_end
+    end_time = (datetime.combine(_date.min, slot_time) + timedelta(minutes=duration)).time().strftime("%H:%M")
+
     # Сохраняем новый слот
     new_slot = TimeSlot(
         id_category_service=payload.id_category_service,
@@ -502,12 +748,17 @@ def create_slot(payload: AdminTimeSlotCreate, db: Session = Depends(get_db)):
         id_time_width_minutes_end=payload.id_category_service
     )
     db.add(new_slot)
-    db.commit()
+    try:
+        db.flush()
+        publish(db, slot_event(SLOT_ADDED, new_slot, booked=False))
+        db.commit()
+    except IntegrityError as e:
+        # В том числе дата за пределами созданных месячных секций
+        db.rollback()
+        logger.error(f"Не удалось создать слот на {slot_date}: {e}")
+        raise HTTPException(status_code=400, detail="TimeSlot date is out of the supported range")
     db.refresh(new_slot)
-
-    # Вычисляем time_end
-    duration = service.time_width_minutes_end
-    end_time = (datetime.combine(_date.min, slot_time) + timedelta(minutes=duration)).time().strftime("%H:%M")
+    availability.add_slot(new_slot.id_employer, new_slot.date, new_slot.time_start, new_slot.id)
 
     return AdminTimeSlotResponse(
         id=new_slot.id,
@@ -519,6 +770,7 @@ def create_slot(payload: AdminTimeSlotCreate, db: Session = Depends(get_db)):
     )
 
 @app.put("/admin/timeslots/{slot_id}/", response_model=AdminTimeSlotResponse)
+@query_budget(8)
 def update_slot(slot_id: int, payload: AdminTimeSlotUpdate, db: Session = Depends(get_db)):
     """
     Редактирование существующего временного слота (для администратора).
@@ -564,19 +816,35 @@ def update_slot(slot_id: int, payload: AdminTimeSlotUpdate, db: Session = Depend
     if conflict:
         raise HTTPException(status_code=400, detail="Another TimeSlot already exists at this datetime")
 
+    # Таблицы секционированы по месяцам: забронированный слот нельзя перенести в другой месяц
+    booked = has_bookings(db, slot)
+    if (slot_date.year, slot_date.month) != (slot.date.year, slot.date.month) and booked:
+        raise HTTPException(status_code=400, detail="Booked TimeSlot cannot be moved to another month")
+
+    # Вычисляем time_end до коммита: после него svc устареет и перечитается отдельным SELECT
+    duration = svc.time_width_minutes_end
+    end_time = (datetime.combine(_date.min, slot_time) + timedelta(minutes=duration)).time().strftime("%H:%M")
+
     # Применяем изменения
+    old_position = (slot.id_employer, slot.date, slot.time_start)
+    removed_event = slot_event(SLOT_REMOVED, slot)
     slot.id_category_service = new_category
     slot.id_employer = new_employer
     slot.date = slot_date
     slot.time_start = slot_time
     slot.id_time_width_minutes_end = new_category
+    publish(db, removed_event, slot_event(SLOT_ADDED, slot, booked=booked))
 
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        logger.error(f"Не удалось изменить слот {slot_id}: {e}")
+        raise HTTPException(status_code=400, detail="TimeSlot date is out of the supported range")
     db.refresh(slot)
 
-    # Вычисляем time_end
-    duration = svc.time_width_minutes_end
-    end_time = (datetime.combine(_date.min, slot_time) + timedelta(minutes=duration)).time().strftime("%H:%M")
+    availability.remove_slot(*old_position)
+    availability.add_slot(slot.id_employer, slot.date, slot.time_start, slot.id, booked)
 
     return AdminTimeSlotResponse(
         id=slot.id,
@@ -588,6 +856,7 @@ def update_slot(slot_id: int, payload: AdminTimeSlotUpdate, db: Session = Depend
     )
 
 @app.delete("/admin/timeslots/{slot_id}/", status_code=204)
+@query_budget(5)
 def delete_slot(slot_id: int, db: Session = Depends(get_db)):
     """
     Удаление временного слота (для администратора).
@@ -595,10 +864,100 @@ def delete_slot(slot_id: int, db: Session = Depends(get_db)):
     slot = db.query(TimeSlot).filter(TimeSlot.id == slot_id).first()
     if not slot:
         raise HTTPException(status_code=404, detail="TimeSlot not found")
+    if has_bookings(db, slot):
+        raise HTTPException(status_code=400, detail="TimeSlot has bookings and cannot be deleted")
+    publish(db, slot_event(SLOT_REMOVED, slot))
     db.delete(slot)
     db.commit()
+    availability.remove_slot(slot.id_employer, slot.date, slot.time_start)
     return Response(status_code=204)
 
+def parse_day(value: str) -> _date:
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат даты. Используйте YYYY-MM-DD.")
+
+def require_availability():
+    if not availability.ready:
+        raise HTTPException(status_code=503, detail="Индекс доступности ещё строится")
+
+@app.get("/availability/stats/")
+@query_budget(0)
+def get_availability_stats():
+    """Размер индекса доступности: специалисты, дни, слоты, байты"""
+    return availability.stats()
+
+@app.get("/availability/month/{month}/", response_model=MonthAvailabilityResponse)
+@query_budget(1)
+def get_month_availability(month: str, specialist_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    """
+    Слоты и записи по дням месяца YYYY-MM из availability_day_counter:
+    по специалисту — около 30 строк, без него — сумма по всем специалистам.
+    Дни без слотов в ответ не попадают.
+    """
+    try:
+        first_day = datetime.strptime(month, "%Y-%m").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Неверный формат месяца. Используйте YYYY-MM.")
+    next_month = (first_day + timedelta(days=32)).replace(day=1)
+
+    query = db.query(
+        AvailabilityDayCounter.date,
+        func.sum(AvailabilityDayCounter.total),
+        func.sum(AvailabilityDayCounter.booked)
+    ).filter(
+        AvailabilityDayCounter.date >= first_day,
+        AvailabilityDayCounter.date < next_month
+    )
+    if specialist_id is not None:
+        query = query.filter(AvailabilityDayCounter.id_employer == specialist_id)
+    rows = query.group_by(AvailabilityDayCounter.date).order_by(AvailabilityDayCounter.date).all()
+
+    days = []
+    for day, total, booked in rows:
+        if not total:
+            continue
+        days.append(DayCounterResponse(
+            date=day.strftime("%Y-%m-%d"),
+            total=total,
+            booked=booked,
+            free=max(total - booked, 0)
+        ))
+    return MonthAvailabilityResponse(month=month, specialist_id=specialist_id, days=days)
+
+@app.get("/availability/{specialist_id}/days/", response_model=FreeDaysResponse)
+@query_budget(0)
+def get_free_days(specialist_id: int, date_from: str, date_to: str):
+    """Дни в [date_from, date_to], где у специалиста есть свободные слоты (из индекса в памяти)"""
+    require_availability()
+    days = availability.free_days(specialist_id, parse_day(date_from), parse_day(date_to))
+    return FreeDaysResponse(specialist_id=specialist_id, days=[day.strftime("%Y-%m-%d") for day in days])
+
+@app.get("/availability/{specialist_id}/{date}/", response_model=List[FreeSlotResponse])
+@query_budget(0)
+def get_free_slots(specialist_id: int, date: str, time_from: Optional[str] = None, time_to: Optional[str] = None):
+    """Свободные слоты специалиста на дату с началом в [time_from, time_to) (из индекса в памяти)"""
+    require_availability()
+    slots = availability.free_slots(
+        specialist_id, parse_day(date),
+        parse_time_of_day(time_from, "time_from"), parse_time_of_day(time_to, "time_to")
+    )
+    return [FreeSlotResponse(id=slot_id, time_start=start.strftime("%H:%M")) for start, slot_id in slots]
+
+@app.get("/availability/{specialist_id}/{date}/{time_start}/", response_model=SlotAvailabilityResponse)
+@query_budget(0)
+def get_slot_availability(specialist_id: int, date: str, time_start: str):
+    """Свободен ли слот специалиста, начинающийся в time_start (из индекса в памяти)"""
+    require_availability()
+    day = parse_day(date)
+    start = parse_time_of_day(time_start, "time_start")
+    found = availability.slot(specialist_id, day, start)
+    if found is None:
+        raise HTTPException(status_code=404, detail="TimeSlot not found")
+    slot_id, free = found
+    return SlotAvailabilityResponse(id=slot_id, free=free)
+
 @app.get("/")
 def read_root():
     logger.info("Обработан запрос к корневому маршруту")
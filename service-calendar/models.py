@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, TIMESTAMP, Date, Time, DateTime, ARRAY
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, ForeignKeyConstraint, Index, TIMESTAMP, Date, Time, DateTime, ARRAY
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -15,7 +15,7 @@ class User(Base):
     name = Column(String, nullable=False)
     last_name = Column(String, nullable=False)
     sur_name = Column(String, nullable=True)
-    phone_number = Column(String, nullable=False)
+    phone_number = Column(String, nullable=False, index=True)
     date_time_created = Column(DateTime, default=datetime.utcnow)
     date_time_edited = Column(DateTime, onupdate=datetime.utcnow)
     id_category_service = Column(Integer, ForeignKey("category_service.id"), nullable=True)
@@ -41,18 +41,26 @@ class Client(Base):
     sur_name = Column(String, nullable=True)
     phone_number = Column(String, nullable=False)
     whatsapp = Column(String, nullable=True)
-    tg_name = Column(String, nullable=True)
+    tg_name = Column(String, nullable=True, index=True)
     chat_id = Column(String, nullable=True)  # Новое поле: ID чата Telegram
     
     online_registrations = relationship("OnlineRegistration", back_populates="client")
 
 class OnlineRegistration(Base):
     __tablename__ = "online_registration"
+    # Секции по месяцам даты слота (partitioning.py): запись лежит в секции того же месяца, что и слот
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["id_time_slot", "slot_date"], ["time_slot.id", "time_slot.date"], onupdate="CASCADE"
+        ),
+        {"postgresql_partition_by": "RANGE (slot_date)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    slot_date = Column(Date, primary_key=True)  # Дата слота — ключ секционирования
     id_client = Column(Integer, ForeignKey("clients.id"))
     id_employer = Column(Integer, ForeignKey("users.id"))
-    id_time_slot = Column(Integer, ForeignKey("time_slot.id"))
+    id_time_slot = Column(Integer, index=True)
     date_time_create = Column(DateTime, default=datetime.utcnow)
     date_time_edit = Column(DateTime, onupdate=datetime.utcnow)
     id_adress_company = Column(Integer, ForeignKey("company_description.id"))
@@ -87,11 +95,17 @@ class CompanyDescription(Base):
 
 class TimeSlot(Base):
     __tablename__ = "time_slot"
+    # Секции по месяцам (partitioning.py); первичный ключ обязан включать ключ секционирования
+    __table_args__ = (
+        # Поиск ближайших свободных слотов: обход по времени начала
+        Index("ix_time_slot_date_time_start", "date", "time_start"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     id_category_service = Column(Integer, ForeignKey("category_service.id"))
     id_employer = Column(Integer, ForeignKey("users.id"))
-    date = Column(Date, nullable=False)
+    date = Column(Date, primary_key=True, index=True)
     time_start = Column(Time, nullable=False)
     id_time_width_minutes_end = Column(Integer, ForeignKey("category_service.id"))
     
@@ -100,6 +114,15 @@ class TimeSlot(Base):
     time_width = relationship("CategoryService", foreign_keys=[id_time_width_minutes_end], back_populates="time_width_slots")
     online_registrations = relationship("OnlineRegistration", back_populates="time_slot")
 
+class AvailabilityDayCounter(Base):
+    __tablename__ = "availability_day_counter"
+    # Слоты и записи специалиста за день; ведётся триггерами (service-database/day_counters.py)
+
+    id_employer = Column(Integer, primary_key=True)
+    date = Column(Date, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    booked = Column(Integer, nullable=False, default=0)
+
 class CategoryService(Base):
     __tablename__ = "category_service"
 
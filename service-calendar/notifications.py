@@ -0,0 +1,339 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import httpx
+
+from metrics import track_outbound
+from tracing import SpanContext, current_context, inject_traceparent, parse_traceparent, start_span
+
+logger = logging.getLogger(__name__)
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+# Телеграм-бот рассылает уведомления всем своим подписчикам, поэтому получатель
+# у всех записей один: сводка за окно — одна на всех специалистов
+SUBSCRIBERS = "subscribers"
+
+
+def parse_quiet_hours(value: Optional[str]) -> Optional[Tuple[dt_time, dt_time]]:
+    """
+    Разбирает интервал тихих часов в формате "HH:MM-HH:MM" (например, "22:00-08:00").
+    Пустое значение отключает тихие часы.
+    """
+    if not value:
+        return None
+    try:
+        start_str, end_str = value.split("-", 1)
+        start = datetime.strptime(start_str.strip(), "%H:%M").time()
+        end = datetime.strptime(end_str.strip(), "%H:%M").time()
+    except ValueError:
+        logger.error(f"Неверный формат NOTIFY_QUIET_HOURS: {value!r}, ожидается HH:MM-HH:MM")
+        return None
+    if start == end:
+        return None
+    return start, end
+
+
+class PendingNotificationStore:
+    """
+    Отложенные уведомления в локальной SQLite-базе: буфер, копившийся за
+    тихие часы, переживает падение или SIGKILL процесса и уходит после
+    перезапуска.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pending_notifications (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    recipient TEXT NOT NULL,
+                    booking TEXT NOT NULL,
+                    traceparent TEXT,
+                    deadline REAL NOT NULL
+                )
+            """)
+
+    def add(self, recipient: str, booking_data: dict, context: Optional[SpanContext], deadline: float) -> int:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO pending_notifications (recipient, booking, traceparent, deadline) VALUES (?, ?, ?, ?)",
+                (recipient, json.dumps(booking_data, ensure_ascii=False),
+                 context.traceparent() if context else None, deadline),
+            )
+            return cursor.lastrowid
+
+    def remove(self, ids: List[int]):
+        if not ids:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM pending_notifications WHERE id = ?", [(i,) for i in ids])
+
+    def load(self) -> List[Tuple[int, str, dict, Optional[SpanContext], float]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, recipient, booking, traceparent, deadline FROM pending_notifications ORDER BY id"
+            ).fetchall()
+        return [
+            (row_id, recipient, json.loads(booking), parse_traceparent(traceparent), deadline)
+            for row_id, recipient, booking, traceparent, deadline in rows
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BookingNotifier:
+    """
+    Отправка уведомлений о новых записях с агрегацией по получателю.
+
+    Несрочные записи копятся в буфере получателя в течение окна агрегации
+    (или до конца тихих часов) и уходят одним сводным сообщением.
+    Запись срочная, если приём начнётся раньше, чем через urgent_margin_seconds
+    после отправки буфера, — такие уходят сразу. С store буфер хранится
+    на диске и восстанавливается при старте.
+    """
+
+    def __init__(
+        self,
+        telegram_service: Optional[str],
+        whatsapp_service: Optional[str],
+        window_seconds: float = 300,
+        quiet_hours: Optional[Tuple[dt_time, dt_time]] = None,
+        urgent_margin_seconds: float = 3600,
+        store: Optional[PendingNotificationStore] = None,
+    ):
+        self.telegram_service = telegram_service
+        self.whatsapp_service = whatsapp_service
+        self.window_seconds = window_seconds
+        self.quiet_hours = quiet_hours
+        self.urgent_margin_seconds = urgent_margin_seconds
+        self.store = store
+
+        # Один долгоживущий клиент вместо нового соединения на каждое уведомление
+        # Заголовок traceparent добавляется к каждому запросу из текущего участка трассы
+        self._http = httpx.Client(timeout=5.0, event_hooks={"request": [inject_traceparent]})
+
+        # Буферы: {ключ получателя: [(booking_data, контекст трассы, id в store), ...]} и время отправки буфера
+        self._pending: Dict[str, List[Tuple[dict, Optional[SpanContext], Optional[int]]]] = {}
+        self._deadlines: Dict[str, float] = {}
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+
+    # ----------------------------
+    # Жизненный цикл
+    # ----------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped = False
+        self._restore()
+        self._thread = threading.Thread(target=self._run, name="booking-notifier", daemon=True)
+        self._thread.start()
+        logger.info(
+            f"Агрегация уведомлений запущена: окно {self.window_seconds} с, "
+            f"тихие часы {self._format_quiet_hours()}"
+        )
+
+    def stop(self):
+        """
+        Останавливает фоновый поток. Буферы без store отправляются сразу, чтобы
+        не потеряться; со store остаются на диске и уйдут в срок после перезапуска.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        if self.store is None:
+            self._flush(list(self._pending.keys()))
+        else:
+            self.store.close()
+        self._http.close()
+
+    def _restore(self):
+        """Возвращает в буферы уведомления, не отправленные до остановки процесса"""
+        if self.store is None:
+            return
+        restored = self.store.load()
+        with self._cond:
+            for row_id, recipient, booking_data, context, deadline in restored:
+                self._pending.setdefault(recipient, []).append((booking_data, context, row_id))
+                self._deadlines[recipient] = min(deadline, self._deadlines.get(recipient, deadline))
+        if restored:
+            logger.info(f"Восстановлено отложенных уведомлений: {len(restored)}")
+
+    # ----------------------------
+    # Публичный API
+    # ----------------------------
+    def notify_booking(self, booking_data: dict, appointment_start: datetime, recipient_key: str = SUBSCRIBERS):
+        """
+        Обрабатывает новую запись: клиенту уведомление уходит сразу,
+        специалисту — сразу для срочных записей, иначе через буфер агрегации.
+        appointment_start — начало приёма (с часовым поясом).
+        """
+        self.send_client_notification(booking_data)
+
+        now = datetime.now(MOSCOW_TZ)
+        with self._cond:
+            deadline = self._deadlines.get(recipient_key) or self._next_deadline(now)
+            urgent = (
+                appointment_start.date() <= now.date()
+                or appointment_start.timestamp() <= deadline + self.urgent_margin_seconds
+            )
+            if not urgent and (self.window_seconds > 0 or self._in_quiet_hours(now)):
+                context = current_context()
+                row_id = self.store.add(recipient_key, booking_data, context, deadline) if self.store else None
+                pending = self._pending.setdefault(recipient_key, [])
+                pending.append((booking_data, context, row_id))
+                self._deadlines[recipient_key] = deadline
+                self._cond.notify_all()
+                logger.info(f"Уведомление для {recipient_key} отложено, в буфере {len(pending)} записей")
+                return
+
+        self._send_to_specialist([booking_data])
+
+    def send_client_notification(self, booking_data: dict):
+        """WhatsApp-уведомление клиенту (и планирование напоминаний на стороне сервиса)"""
+        if not self.whatsapp_service:
+            return
+        try:
+            with start_span("notify.whatsapp") as span, track_outbound("whatsapp") as call:
+                resp = self._http.post(f"http://{self.whatsapp_service}/send-notification", json=booking_data)
+                call.status(resp.status_code)
+                span.set_attribute("http.status_code", resp.status_code)
+            if resp.status_code != 200:
+                logger.error(f"WhatsApp notification failed: {resp.text}")
+        except Exception as e:
+            logger.error(f"Error when sending WhatsApp notification: {e}")
+
+    # ----------------------------
+    # Внутренняя логика
+    # ----------------------------
+    def _format_quiet_hours(self) -> str:
+        if not self.quiet_hours:
+            return "не заданы"
+        start, end = self.quiet_hours
+        return f"{start.strftime('%H:%M')}-{end.strftime('%H:%M')}"
+
+    def _in_quiet_hours(self, now: datetime) -> bool:
+        if not self.quiet_hours:
+            return False
+        start, end = self.quiet_hours
+        current = now.time()
+        if start < end:
+            return start <= current < end
+        # Интервал через полночь, например 22:00-08:00
+        return current >= start or current < end
+
+    def _quiet_hours_end(self, now: datetime) -> datetime:
+        _, end = self.quiet_hours
+        end_dt = datetime.combine(now.date(), end, tzinfo=MOSCOW_TZ)
+        if end_dt <= now:
+            end_dt += timedelta(days=1)
+        return end_dt
+
+    def _next_deadline(self, now: datetime) -> float:
+        """Момент отправки буфера: конец окна, но не раньше окончания тихих часов"""
+        deadline = now + timedelta(seconds=max(self.window_seconds, 0))
+        if self._in_quiet_hours(deadline):
+            deadline = self._quiet_hours_end(deadline)
+        return time.time() + (deadline - now).total_seconds()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                now_ts = time.time()
+                due = [key for key, deadline in self._deadlines.items() if deadline <= now_ts]
+                if not due:
+                    timeout = min(self._deadlines.values()) - now_ts if self._deadlines else None
+                    self._cond.wait(timeout=timeout)
+                    continue
+
+                # Окно истекло во время тихих часов — переносим отправку на их окончание
+                now = datetime.now(MOSCOW_TZ)
+                if self._in_quiet_hours(now):
+                    postponed = time.time() + (self._quiet_hours_end(now) - now).total_seconds()
+                    for key in due:
+                        self._deadlines[key] = postponed
+                    continue
+
+            self._flush(due)
+
+    def _flush(self, keys: List[str]):
+        for key in keys:
+            with self._cond:
+                pending = self._pending.pop(key, [])
+                self._deadlines.pop(key, None)
+            if not pending:
+                continue
+            # Отправка идёт из фонового потока: одиночная запись продолжает свою трассу,
+            # сводка начинает новую со ссылками на трассы всех вошедших в неё записей
+            bookings = [booking for booking, _, _ in pending]
+            contexts = [context for _, context, _ in pending if context is not None]
+            if len(pending) == 1:
+                with start_span("notify.flush", parent=pending[0][1]):
+                    self._send_to_specialist(bookings)
+            else:
+                with start_span("notify.digest", links=contexts, bookings=len(bookings)):
+                    self._send_to_specialist(bookings)
+            if self.store is not None:
+                self.store.remove([row_id for _, _, row_id in pending if row_id is not None])
+
+    def _send_to_specialist(self, bookings: List[dict]):
+        """
+        Одна запись — обычное уведомление, несколько — сводное сообщение
+        (записи разных специалистов бот группирует по specialist_name)
+        """
+        if not self.telegram_service:
+            return
+        if len(bookings) == 1:
+            url = f"http://{self.telegram_service}/send-appointment"
+            payload = bookings[0]
+        else:
+            url = f"http://{self.telegram_service}/send-appointment-digest"
+            specialists = {booking["specialist_name"] for booking in bookings}
+            payload = {
+                "specialist_name": specialists.pop() if len(specialists) == 1 else None,
+                "bookings": bookings,
+            }
+        try:
+            with start_span("notify.telegram-bot") as span, track_outbound("telegram-bot") as call:
+                resp = self._http.post(url, json=payload)
+                call.status(resp.status_code)
+                span.set_attribute("http.status_code", resp.status_code)
+            if resp.status_code != 200:
+                logger.error(f"Ошибка отправки в телеграм-бот: {resp.text}")
+            elif len(bookings) > 1:
+                logger.info(f"Отправлена сводка по {len(bookings)} записям")
+        except Exception as e:
+            logger.error(f"Не удалось отправить данные в телеграм-бот: {e}")
+
+
+def create_notifier_from_env() -> BookingNotifier:
+    """NOTIFY_PENDING_DB — файл SQLite для отложенных уведомлений (пусто — только в памяти)"""
+    pending_db = os.getenv("NOTIFY_PENDING_DB")
+    if pending_db:
+        os.makedirs(os.path.dirname(os.path.abspath(pending_db)), exist_ok=True)
+    return BookingNotifier(
+        telegram_service=os.getenv("TELEGRAM_BOT_SERVICE"),
+        whatsapp_service=os.getenv("WHATSAPP_SERVICE_URL"),
+        window_seconds=float(os.getenv("NOTIFY_DIGEST_WINDOW_SECONDS", "300")),
+        quiet_hours=parse_quiet_hours(os.getenv("NOTIFY_QUIET_HOURS")),
+        urgent_margin_seconds=float(os.getenv("NOTIFY_URGENT_MARGIN_MINUTES", "60")) * 60,
+        store=PendingNotificationStore(pending_db) if pending_db else None,
+    )
@@ -0,0 +1,163 @@
+"""
+Тесты календаря работают с настоящим Postgres: секционированные таблицы,
+pg_notify и потоковая репликация в SQLite не воспроизводятся.
+
+    TEST_DB_HOST=127.0.0.1:5432 TEST_DB_REPLICA_HOST=127.0.0.1:5433 python -m pytest tests
+
+TEST_DB_HOST — первичная база (host:port), TEST_DB_REPLICA_HOST — её
+потоковая реплика (нужна только тестам чтения с реплик);
+TEST_DB_USER / TEST_DB_PASSWORD / TEST_DB_NAME — учётные данные и база
+(по умолчанию postgres, пустой пароль, clinic_test). Без TEST_DB_HOST тесты
+пропускаются. Схема создаётся по models.py, если её ещё нет; данные тестов
+удаляются после каждого теста.
+"""
+
+import os
+import sys
+import uuid
+from datetime import date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DB_HOST = os.getenv("TEST_DB_HOST")
+TEST_DB_REPLICA_HOST = os.getenv("TEST_DB_REPLICA_HOST", "")
+
+if TEST_DB_HOST:
+    # main.py читает настройки при импорте: окружение готовится до него
+    os.environ.update(
+        DB_HOST=TEST_DB_HOST,
+        DB_USER=os.getenv("TEST_DB_USER", "postgres"),
+        DB_PASSWORD=os.getenv("TEST_DB_PASSWORD", ""),
+        DB_NAME=os.getenv("TEST_DB_NAME", "clinic_test"),
+        DB_REPLICA_HOSTS=TEST_DB_REPLICA_HOST,
+        # Реплика с приостановленным воспроизведением WAL остаётся «допустимой»:
+        # тесты read-your-writes проверяют, что запись не читается с неё
+        DB_REPLICA_MAX_LAG_SECONDS="60",
+        DB_REPLICA_CHECK_SECONDS="1",
+        # Превышение бюджета SQL-запросов маршрута (@query_budget) роняет тест
+        DB_QUERY_BUDGET_STRICT="1",
+        TELEGRAM_BOT_SERVICE="",
+        WHATSAPP_SERVICE_URL="",
+    )
+
+requires_db = pytest.mark.skipif(not TEST_DB_HOST, reason="TEST_DB_HOST не задан")
+requires_replica = pytest.mark.skipif(
+    not (TEST_DB_HOST and TEST_DB_REPLICA_HOST), reason="TEST_DB_HOST и TEST_DB_REPLICA_HOST не заданы"
+)
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    if not TEST_DB_HOST:
+        pytest.skip("TEST_DB_HOST не задан")
+    import main
+    from models import Base
+
+    with main.engine.begin() as conn:
+        Base.metadata.create_all(bind=conn)
+    return main
+
+
+@pytest.fixture(scope="session")
+def client(app_module):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app_module.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def slot_day(app_module) -> date:
+    """День для тестовых слотов (через две недели) с секциями его месяца"""
+    day = datetime.now(MOSCOW_TZ).date() + timedelta(days=14)
+    month = day.replace(day=1)
+    next_month = (month + timedelta(days=32)).replace(day=1)
+    with app_module.engine.begin() as conn:
+        for table in ("time_slot", "online_registration"):
+            conn.exec_driver_sql(
+                f'CREATE TABLE IF NOT EXISTS "{table}_{month:%Y_%m}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+            )
+    return day
+
+
+@pytest.fixture
+def seed(app_module, slot_day):
+    """
+    Специалист, клиент, компания, услуга и slots_count слотов на slot_day
+    (с 10:00 через час). Возвращает функцию seed(slots_count) -> dict с id.
+    """
+    from models import CategoryService, Client, CompanyDescription, OnlineRegistration, TimeSlot, User
+
+    created = []
+
+    def _seed(slots_count: int = 3) -> dict:
+        marker = uuid.uuid4().hex[:8]
+        db = app_module.SessionLocal()
+        try:
+            category = CategoryService(name_category=f"Тест {marker}", time_width_minutes_end=60)
+            db.add(category)
+            db.flush()
+            employer = User(
+                role="worker", name="Тест", last_name=marker, phone_number=f"+7000{marker}",
+                id_category_service=category.id,
+            )
+            client = Client(name="Клиент", last_name=marker, phone_number=f"+7001{marker}")
+            company = CompanyDescription(
+                company_name=f"Клиника {marker}", company_adress_country="Россия",
+                company_adress_city="Москва", company_adress_street="Тестовая",
+                company_adress_house_number="1", company_adress_house_number_index="101000",
+                time_work_start=time(9, 0), time_work_end=time(21, 0),
+            )
+            db.add_all([employer, client, company])
+            db.flush()
+            slots = [
+                TimeSlot(
+                    id_category_service=category.id, id_employer=employer.id, date=slot_day,
+                    time_start=time(10 + i, 0), id_time_width_minutes_end=category.id,
+                )
+                for i in range(slots_count)
+            ]
+            db.add_all(slots)
+            db.commit()
+            data = {
+                "category_id": category.id,
+                "employer_id": employer.id,
+                "client_id": client.id,
+                "company_id": company.id,
+                "slot_ids": [slot.id for slot in slots],
+                "date": slot_day,
+            }
+            created.append(data)
+            return data
+        finally:
+            db.close()
+
+    yield _seed
+
+    db = app_module.SessionLocal()
+    try:
+        for data in created:
+            db.query(OnlineRegistration).filter(OnlineRegistration.id_employer == data["employer_id"]).delete()
+            db.query(TimeSlot).filter(TimeSlot.id_employer == data["employer_id"]).delete()
+            db.query(User).filter(User.id == data["employer_id"]).delete()
+            db.query(Client).filter(Client.id == data["client_id"]).delete()
+            db.query(CompanyDescription).filter(CompanyDescription.id == data["company_id"]).delete()
+            db.query(CategoryService).filter(CategoryService.id == data["category_id"]).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def booking_payload(data: dict, slot_index: int = 0) -> dict:
+    return {
+        "time_slot_id": data["slot_ids"][slot_index],
+        "client_id": data["client_id"],
+        "company_id": data["company_id"],
+        "employer_id": data["employer_id"],
+    }
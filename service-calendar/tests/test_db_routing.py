@@ -0,0 +1,169 @@
+"""
+Чтение с реплик (db_routing.py) на первичной базе и её потоковой реплике:
+исключение отстающей и отключённой от первичной реплики, read-your-writes
+после бронирования. Пауза воспроизведения WAL и отключение приёмника WAL
+(ALTER SYSTEM) на реплике требуют прав суперпользователя.
+"""
+
+import time
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from conftest import booking_payload, requires_replica
+from db_routing import READ_YOUR_WRITES_HEADER, DatabaseRouter, database_url
+
+
+def wait_for_replay(primary_engine, replica_engine, timeout: float = 10):
+    """Ждёт, пока реплика воспроизведёт WAL первичной до текущей позиции"""
+    with primary_engine.connect() as conn:
+        target = conn.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+    deadline = time.monotonic() + timeout
+    with replica_engine.connect() as conn:
+        while not conn.execute(
+            text("SELECT pg_last_wal_replay_lsn() >= CAST(:target AS pg_lsn)"), {"target": target}
+        ).scalar():
+            assert time.monotonic() < deadline, "реплика не догнала первичную"
+            time.sleep(0.05)
+
+
+@contextmanager
+def replay_paused(replica_engine):
+    with replica_engine.connect() as conn:
+        conn.execute(text("SELECT pg_wal_replay_pause()"))
+    try:
+        yield
+    finally:
+        with replica_engine.connect() as conn:
+            conn.execute(text("SELECT pg_wal_replay_resume()"))
+
+
+@contextmanager
+def wal_receiver_stopped(replica_engine, timeout: float = 10):
+    """Отключает реплику от первичной (пустой primary_conninfo), затем восстанавливает"""
+    autocommit = replica_engine.execution_options(isolation_level="AUTOCOMMIT")
+    with autocommit.connect() as conn:
+        conninfo = conn.execute(text("SHOW primary_conninfo")).scalar()
+        conn.exec_driver_sql("ALTER SYSTEM SET primary_conninfo = ''")
+        conn.execute(text("SELECT pg_reload_conf()"))
+        wait_for_receiver(conn, streaming=False, timeout=timeout)
+    try:
+        yield
+    finally:
+        with autocommit.connect() as conn:
+            conn.exec_driver_sql(f"ALTER SYSTEM SET primary_conninfo = '{conninfo.replace(chr(39), chr(39) * 2)}'")
+            conn.execute(text("SELECT pg_reload_conf()"))
+            wait_for_receiver(conn, streaming=True, timeout=timeout)
+
+
+def wait_for_receiver(conn, streaming: bool, timeout: float):
+    deadline = time.monotonic() + timeout
+    while conn.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming')")
+    ).scalar() != streaming:
+        assert time.monotonic() < deadline, "приёмник WAL реплики не сменил состояние"
+        time.sleep(0.1)
+
+
+@pytest.fixture
+def replica_engine(app_module):
+    return app_module.db_router.replicas[0].engine
+
+
+def test_sticky_token_window():
+    router = DatabaseRouter(primary_engine=None, read_your_writes_seconds=10)
+    assert router.is_sticky(router.sticky_token())
+    assert not router.is_sticky(None)
+    assert not router.is_sticky("garbage")
+    assert not router.is_sticky(f"{time.time() - 1:.3f}")
+    # Срок за пределами окна не даёт закрепиться за первичной навсегда
+    assert not router.is_sticky(f"{time.time() + 3600:.3f}")
+
+
+@requires_replica
+def test_lagging_replica_falls_back_to_primary(app_module, replica_engine):
+    router = DatabaseRouter(app_module.engine, [replica_engine], max_lag_seconds=0.5)
+    wait_for_replay(app_module.engine, replica_engine)
+    router.check_replicas()
+    assert router.read_replica() is router.replicas[0]
+    assert router.read_session_factory() is router.replicas[0].session_factory
+
+    with replay_paused(replica_engine):
+        # Транзакция на первичной, которую реплика не воспроизведёт до снятия паузы
+        with app_module.engine.begin() as conn:
+            conn.execute(text("SELECT txid_current()"))
+        time.sleep(1)
+        router.check_replicas()
+        assert router.replicas[0].lag > router.max_lag_seconds
+        assert router.read_replica() is None
+        assert router.read_session_factory() is router.primary_session
+
+    wait_for_replay(app_module.engine, replica_engine)
+    router.check_replicas()
+    assert router.read_replica() is router.replicas[0]
+
+
+@requires_replica
+def test_disconnected_replica_falls_back_to_primary(app_module, replica_engine):
+    # Отставание допускается большое: отключённая реплика, применившая всё
+    # полученное, без проверки приёмника WAL считалась бы догнавшей
+    router = DatabaseRouter(app_module.engine, [replica_engine], max_lag_seconds=60)
+    wait_for_replay(app_module.engine, replica_engine)
+    router.check_replicas()
+    assert router.read_replica() is router.replicas[0]
+
+    with wal_receiver_stopped(replica_engine):
+        with app_module.engine.begin() as conn:
+            conn.execute(text("SELECT txid_current()"))
+        router.check_replicas()
+        assert router.replicas[0].lag is None
+        assert router.read_replica() is None
+        assert router.read_session_factory() is router.primary_session
+
+    wait_for_replay(app_module.engine, replica_engine)
+    router.check_replicas()
+    assert router.read_replica() is router.replicas[0]
+
+
+@requires_replica
+def test_unreachable_replica_falls_back_to_primary(app_module):
+    router = DatabaseRouter(app_module.engine, [create_engine(database_url("127.0.0.1:1"))])
+    router.check_replicas()
+    assert router.replicas[0].lag is None
+    assert router.read_session_factory() is router.primary_session
+    assert router.stats()["available"] == 0
+
+
+@requires_replica
+def test_reads_after_booking_go_to_primary(app_module, client, seed, replica_engine):
+    data = seed(2)
+    booked_id = data["slot_ids"][0]
+    day = data["date"].isoformat()
+    wait_for_replay(app_module.engine, replica_engine)
+    app_module.db_router.check_replicas()
+
+    with replay_paused(replica_engine):
+        response = client.post("/bookings/", json=booking_payload(data))
+        assert response.status_code == 200, response.text
+        token = response.headers.get(READ_YOUR_WRITES_HEADER)
+        assert token
+
+        # Без заголовка чтение уходит на реплику: бронирования она ещё не видит
+        stale = client.get(f"/timeslots/{day}")
+        assert booked_id in {slot["id"] for slot in stale.json()}
+
+        # С заголовком из ответа на запись — на первичную
+        fresh = client.get(f"/timeslots/{day}", headers={READ_YOUR_WRITES_HEADER: token})
+        assert fresh.status_code == 200
+        assert booked_id not in {slot["id"] for slot in fresh.json()}
+        assert data["slot_ids"][1] in {slot["id"] for slot in fresh.json()}
+
+
+@requires_replica
+def test_failed_write_is_not_sticky(app_module, client, seed):
+    data = seed(1)
+    assert client.post("/bookings/", json=booking_payload(data)).status_code == 200
+    repeated = client.post("/bookings/", json=booking_payload(data))
+    assert repeated.status_code >= 400
+    assert READ_YOUR_WRITES_HEADER not in repeated.headers
@@ -0,0 +1,122 @@
+"""
+Бюджеты SQL-запросов маршрутов (@query_budget) в строгом режиме
+(DB_QUERY_BUDGET_STRICT=1, задаётся в conftest.py): маршрут, выполнивший
+больше запросов, чем допускает бюджет, роняет тест с QueryBudgetExceeded.
+
+Данных заведомо больше одного слота и одной записи на специалиста:
+N+1 (запрос на каждый слот) проявляется только на таких данных.
+"""
+
+import re
+
+import pytest
+
+from conftest import booking_payload
+from db_instrumentation import QueryBudgetExceeded
+from db_routing import READ_YOUR_WRITES_HEADER
+
+SPECIALISTS = 2
+SLOTS_PER_SPECIALIST = 4
+BOOKED_PER_SPECIALIST = 2
+
+
+def query_count(response) -> int:
+    """Число SQL-запросов из заголовка Server-Timing"""
+    return int(re.search(r'desc="(\d+) queries"', response.headers["server-timing"]).group(1))
+
+
+@pytest.fixture
+def seeded(client, seed):
+    """Два специалиста по четыре слота, по две записи у каждого; заголовок read-your-writes последней записи"""
+    specialists = [seed(SLOTS_PER_SPECIALIST) for _ in range(SPECIALISTS)]
+    headers = {}
+    for data in specialists:
+        for slot_index in range(BOOKED_PER_SPECIALIST):
+            response = client.post("/bookings/", json=booking_payload(data, slot_index))
+            assert response.status_code == 200, response.text
+            if READ_YOUR_WRITES_HEADER in response.headers:
+                headers = {READ_YOUR_WRITES_HEADER: response.headers[READ_YOUR_WRITES_HEADER]}
+    return specialists, headers
+
+
+def test_read_all_slots(client, seeded):
+    specialists, headers = seeded
+    response = client.get("/admin/timeslots/", headers=headers)
+    assert response.status_code == 200
+    returned = {slot["id"] for slot in response.json()}
+    for data in specialists:
+        assert set(data["slot_ids"]) <= returned
+    assert query_count(response) == 1
+
+
+def test_read_slot(client, seeded):
+    specialists, headers = seeded
+    slot_id = specialists[0]["slot_ids"][0]
+    response = client.get(f"/admin/timeslots/{slot_id}/", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["time_end"] == "11:00"
+
+
+def test_time_slots_by_date(client, seeded):
+    specialists, headers = seeded
+    day = specialists[0]["date"].isoformat()
+    response = client.get(f"/timeslots/{day}", headers=headers)
+    assert response.status_code == 200
+    returned = {slot["id"] for slot in response.json()}
+    for data in specialists:
+        booked = data["slot_ids"][:BOOKED_PER_SPECIALIST]
+        free = data["slot_ids"][BOOKED_PER_SPECIALIST:]
+        assert set(free) <= returned
+        assert not set(booked) & returned
+
+
+def test_booking_queries_do_not_grow_with_slots(client, seed):
+    small = seed(1)
+    large = seed(SLOTS_PER_SPECIALIST * 3)
+    first = client.post("/bookings/", json=booking_payload(small))
+    # Чужие записи на тот же день не должны добавлять запросов
+    client.post("/bookings/", json=booking_payload(large, 1))
+    second = client.post("/bookings/", json=booking_payload(large))
+    assert first.status_code == second.status_code == 200
+    assert query_count(first) == query_count(second)
+
+
+def test_repeated_booking_within_budget(client, seeded):
+    specialists, _ = seeded
+    response = client.post("/bookings/", json=booking_payload(specialists[0]))
+    assert response.status_code >= 400
+
+
+def test_admin_slot_crud(client, seeded):
+    specialists, _ = seeded
+    data = specialists[0]
+    day = data["date"].isoformat()
+
+    created = client.post(
+        "/admin/timeslots/",
+        json={
+            "id_category_service": data["category_id"],
+            "id_employer": data["employer_id"],
+            "date": day,
+            "time_start": "18:00",
+        },
+    )
+    assert created.status_code == 201, created.text
+    slot_id = created.json()["id"]
+
+    updated = client.put(f"/admin/timeslots/{slot_id}/", json={"time_start": "19:00"})
+    assert updated.status_code == 200, updated.text
+    assert updated.json()["time_end"] == "20:00"
+
+    # Забронированный слот: has_bookings находит запись
+    booked = client.put(f"/admin/timeslots/{data['slot_ids'][0]}/", json={"time_start": "20:00"})
+    assert booked.status_code == 200, booked.text
+
+    assert client.delete(f"/admin/timeslots/{slot_id}/").status_code == 204
+    assert client.delete(f"/admin/timeslots/{data['slot_ids'][1]}/").status_code == 400
+
+
+def test_exceeded_budget_fails(client, seeded, app_module, monkeypatch):
+    monkeypatch.setattr(app_module.read_all_slots, "__query_budget__", 0)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get("/admin/timeslots/")
@@ -0,0 +1,167 @@
+"""
+Счётчики слотов и записей по специалисту и дню (availability_day_counter).
+
+Счётчики ведут триггеры на time_slot и online_registration, поэтому они
+учитывают всех, кто пишет в эти таблицы: генерацию слотов этого сервиса,
+COPY-загрузку synthetic.py, бронирования и CRUD слотов календаря. Перенос
+слота в другой день (в том числе между секциями) учитывается как удаление
+и добавление.
+
+booked считается по online_registration.id_employer и slot_date — так же,
+как при сверке в reconcile_day_counters. Сверка с исходными таблицами
+запускается задачей горизонта слотов и исправляет расхождения (например,
+после ручных правок в обход триггеров).
+
+Сверка идёт по одному дню в отдельной короткой транзакции. День
+защищается транзакционной advisory-блокировкой (DAY_LOCK_CLASS, номер
+дня): сверка берёт её монопольно, триггер — разделяемо. Так пересчёт
+видит все приращения, закоммиченные до него, а приращение, пришедшее во
+время пересчёта, ждёт его окончания и не затирается — при этом запись
+в другие дни, в том числе бронирования, сверка не задерживает.
+"""
+
+import logging
+from datetime import date, timedelta
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+# Первый ключ pg_advisory_xact_lock(int, int) блокировок дней; второй — номер дня от DAY_LOCK_EPOCH
+DAY_LOCK_CLASS = 7_340_003
+DAY_LOCK_EPOCH = date(2000, 1, 1)
+
+TRIGGERS_SQL = f"""
+CREATE OR REPLACE FUNCTION availability_day_counter_add(p_employer INTEGER, p_date DATE, p_total INTEGER, p_booked INTEGER)
+RETURNS void AS $$
+BEGIN
+    IF p_employer IS NULL OR p_date IS NULL THEN
+        RETURN;
+    END IF;
+    PERFORM pg_advisory_xact_lock_shared({DAY_LOCK_CLASS}, p_date - DATE '{DAY_LOCK_EPOCH.isoformat()}');
+    INSERT INTO availability_day_counter AS c (id_employer, date, total, booked)
+    VALUES (p_employer, p_date, p_total, p_booked)
+    ON CONFLICT (id_employer, date)
+    DO UPDATE SET total = c.total + EXCLUDED.total, booked = c.booked + EXCLUDED.booked;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION time_slot_day_counter() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.id_employer IS NOT DISTINCT FROM NEW.id_employer AND OLD.date = NEW.date THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM availability_day_counter_add(OLD.id_employer, OLD.date, -1, 0);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM availability_day_counter_add(NEW.id_employer, NEW.date, 1, 0);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION online_registration_day_counter() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.id_employer IS NOT DISTINCT FROM NEW.id_employer AND OLD.slot_date = NEW.slot_date THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM availability_day_counter_add(OLD.id_employer, OLD.slot_date, 0, -1);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'INSERT') THEN
+        PERFORM availability_day_counter_add(NEW.id_employer, NEW.slot_date, 0, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS time_slot_day_counter ON time_slot;
+CREATE TRIGGER time_slot_day_counter
+    AFTER INSERT OR UPDATE OF id_employer, date OR DELETE ON time_slot
+    FOR EACH ROW EXECUTE FUNCTION time_slot_day_counter();
+
+DROP TRIGGER IF EXISTS online_registration_day_counter ON online_registration;
+CREATE TRIGGER online_registration_day_counter
+    AFTER INSERT OR UPDATE OF id_employer, slot_date OR DELETE ON online_registration
+    FOR EACH ROW EXECUTE FUNCTION online_registration_day_counter();
+"""
+
+
+def install_triggers(conn):
+    """Создаёт (или обновляет) функции и триггеры счётчиков"""
+    conn.exec_driver_sql(TRIGGERS_SQL)
+
+
+def recompute_day_counters(conn, date_from: date, date_to: date) -> Tuple[int, int]:
+    """
+    Пересчитывает счётчики дней [date_from, date_to] по time_slot и
+    online_registration; возвращает (исправлено строк, удалено строк).
+    Сам ничего не блокирует: вызывается под блокировкой дня или когда
+    параллельной записи нет (начальное заполнение в миграции).
+    """
+    return conn.exec_driver_sql(
+        """
+        WITH actual AS (
+            SELECT id_employer, date, SUM(total) AS total, SUM(booked) AS booked
+            FROM (
+                SELECT id_employer, date, COUNT(*) AS total, 0 AS booked
+                FROM time_slot
+                WHERE date BETWEEN %(date_from)s AND %(date_to)s AND id_employer IS NOT NULL
+                GROUP BY id_employer, date
+                UNION ALL
+                SELECT id_employer, slot_date, 0, COUNT(*)
+                FROM online_registration
+                WHERE slot_date BETWEEN %(date_from)s AND %(date_to)s AND id_employer IS NOT NULL
+                GROUP BY id_employer, slot_date
+            ) counts
+            GROUP BY id_employer, date
+        ),
+        fixed AS (
+            INSERT INTO availability_day_counter AS c (id_employer, date, total, booked)
+            SELECT id_employer, date, total, booked FROM actual
+            ON CONFLICT (id_employer, date) DO UPDATE
+            SET total = EXCLUDED.total, booked = EXCLUDED.booked
+            WHERE (c.total, c.booked) IS DISTINCT FROM (EXCLUDED.total, EXCLUDED.booked)
+            RETURNING 1
+        ),
+        removed AS (
+            DELETE FROM availability_day_counter c
+            WHERE c.date BETWEEN %(date_from)s AND %(date_to)s
+              AND NOT EXISTS (SELECT 1 FROM actual a WHERE a.id_employer = c.id_employer AND a.date = c.date)
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM fixed), (SELECT COUNT(*) FROM removed)
+        """,
+        {"date_from": date_from, "date_to": date_to},
+    ).one()
+
+
+def reconcile_day_counters(engine, date_from: date, date_to: date) -> Tuple[int, int]:
+    """
+    Сверяет счётчики дней [date_from, date_to] по одному дню за транзакцию,
+    под монопольной блокировкой этого дня; возвращает (исправлено, удалено).
+    """
+    fixed = removed = 0
+    day = date_from
+    while day <= date_to:
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "SELECT pg_advisory_xact_lock(%(lock_class)s, %(day)s)",
+                {"lock_class": DAY_LOCK_CLASS, "day": (day - DAY_LOCK_EPOCH).days},
+            )
+            day_fixed, day_removed = recompute_day_counters(conn, day, day)
+        fixed += day_fixed
+        removed += day_removed
+        day += timedelta(days=1)
+    if fixed or removed:
+        logger.info(
+            f"Сверка счётчиков дней {date_from}..{date_to}: исправлено {fixed}, удалено {removed}"
+        )
+    return fixed, removed
+
+
+def drop_day_counters_before(conn, before: date) -> int:
+    """Удаляет счётчики дней до before — вместе с архивированными месяцами слотов"""
+    return conn.exec_driver_sql(
+        "DELETE FROM availability_day_counter WHERE date < %(before)s", {"before": before}
+    ).rowcount
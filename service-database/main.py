@@ -1,5 +1,5 @@
 import logging
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
 from dotenv import load_dotenv
@@ -7,8 +7,12 @@ import os
 import time
 import bcrypt
 from datetime import datetime, date, time as dt_time, timedelta
-from models import Base, User, CategoryService, TimeSlot, Client, CompanyDescription
+from models import User, CategoryService, TimeSlot, Client, CompanyDescription, SlotGeneration
 from apscheduler.schedulers.background import BackgroundScheduler
+from synthetic import already_seeded, options_from_env, seed_synthetic_data
+from partitioning import add_months, archive_partitions, ensure_partitions, month_start
+from migrate import run_migrations
+from day_counters import drop_day_counters_before, reconcile_day_counters
 
 # Настройка логгера
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +29,20 @@ DATABASE_URL = (
 logger.info(f"Подключение к базе данных по URL: {DATABASE_URL}")
 engine = create_engine(DATABASE_URL)
 
+# demo — базовые данные create_initial_data; synthetic — плюс большой синтетический набор (synthetic.py)
+SEED_MODE = os.getenv("SEED_MODE", "demo")
+
+# Горизонт слотов: на сколько недель вперёд они должны существовать и как часто это проверять
+SLOT_HORIZON_WEEKS = int(os.getenv("SLOT_HORIZON_WEEKS", "4"))
+SLOT_HORIZON_INTERVAL_MINUTES = int(os.getenv("SLOT_HORIZON_INTERVAL_MINUTES", "60"))
+# Ключ pg_advisory_xact_lock генерации слотов (произвольная константа, общая для всех экземпляров)
+SLOT_HORIZON_LOCK_KEY = 7_340_001
+
+# Месячные секции time_slot/online_registration создаются с запасом на столько месяцев
+# после горизонта; месяцы старше PARTITION_ARCHIVE_AFTER_MONTHS уходят в *_history (0 — не архивировать)
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_ARCHIVE_AFTER_MONTHS = int(os.getenv("PARTITION_ARCHIVE_AFTER_MONTHS", "12"))
+
 # График работы специалистов
 WORK_SCHEDULE = {
     "Гадисов Ренат Фамильевич": {
@@ -233,123 +251,143 @@ def create_initial_data(session):
     session.commit()
 
 
-def generate_week_slots(session, start_date: date):
+def schedule_assignments(session):
+    """
+    Специалисты с графиком из WORK_SCHEDULE: [(id, id категории, график)].
+    Ключ графика — "Фамилия Имя Отчество" специалиста.
+    """
+    assignments = []
+    for user in session.query(User).order_by(User.id).all():
+        schedule = WORK_SCHEDULE.get(f"{user.last_name} {user.name} {user.sur_name}")
+        if schedule:
+            assignments.append((user.id, user.id_category_service, schedule))
+    return assignments
+
+
+def generate_missing_slots(session, date_from: date, date_to: date) -> int:
     """
-    Генерирует и сохраняет временные слоты для заданной недели, начиная со start_date (понедельник).
-    Если слоты на какую-либо дату уже существуют, они не дублируются.
+    Генерирует слоты на даты [date_from, date_to] для каждого специалиста,
+    у которого на эту дату ещё нет слотов, и сохраняет их одной пачкой.
+    Возвращает число добавленных слотов.
+
+    Даты не позже отметки специалиста в slot_generation пропускаются, даже если
+    слотов на них нет: день, очищенный администратором (отпуск, больничный),
+    должен остаться пустым. После генерации отметка сдвигается на date_to.
     """
-    owner = session.query(User).filter(User.role == "owner").first()
-    workers = session.query(User).filter(User.role == "worker").all()
-    categories = session.query(CategoryService).all()
+    generated_through = dict(session.query(SlotGeneration.id_employer, SlotGeneration.generated_through))
+    existing = {
+        (slot_date, employer_id)
+        for slot_date, employer_id in session.query(TimeSlot.date, TimeSlot.id_employer)
+        .filter(TimeSlot.date >= date_from, TimeSlot.date <= date_to)
+        .distinct()
+    }
+    assignments = schedule_assignments(session)
 
     all_time_slots = []
-    for day_offset in range(7):
-        current_date = start_date + timedelta(days=day_offset)
-        weekday_num = current_date.weekday()  # 0-ПН, 6-ВС
-        weekday_name = WEEKDAYS[weekday_num]
-
-        existing_for_day = session.query(TimeSlot).filter(TimeSlot.date == current_date).first()
-        if existing_for_day:
-            continue
-
-        if weekday_name in WORK_SCHEDULE["Гадисов Ренат Фамильевич"]["days"]:
-            slots = generate_time_slots(
-                WORK_SCHEDULE["Гадисов Ренат Фамильевич"]["hours"][0],
-                WORK_SCHEDULE["Гадисов Ренат Фамильевич"]["hours"][1],
-                WORK_SCHEDULE["Гадисов Ренат Фамильевич"]["duration"],
-                current_date,
-                workers[0].id,
-                categories[0].id
-            )
-            all_time_slots.extend(slots)
-
-        if weekday_name in WORK_SCHEDULE["Сергеев Ринат Леонидович"]["days"]:
-            slots = generate_time_slots(
-                WORK_SCHEDULE["Сергеев Ринат Леонидович"]["hours"][0],
-                WORK_SCHEDULE["Сергеев Ринат Леонидович"]["hours"][1],
-                WORK_SCHEDULE["Сергеев Ринат Леонидович"]["duration"],
-                current_date,
-                owner.id,
-                categories[1].id
-            )
-            all_time_slots.extend(slots)
-
-        if weekday_name in WORK_SCHEDULE["Бареева Светлана Геннадьевна"]["days"]:
-            slots = generate_time_slots(
-                WORK_SCHEDULE["Бареева Светлана Геннадьевна"]["hours"][0],
-                WORK_SCHEDULE["Бареева Светлана Геннадьевна"]["hours"][1],
-                WORK_SCHEDULE["Бареева Светлана Геннадьевна"]["duration"],
-                current_date,
-                workers[1].id,
-                categories[2].id
-            )
-            all_time_slots.extend(slots)
-
-        if weekday_name in WORK_SCHEDULE["Шарипова Альфия Маратовна"]["days"]:
-            slots = generate_time_slots(
-                WORK_SCHEDULE["Шарипова Альфия Маратовна"]["hours"][0],
-                WORK_SCHEDULE["Шарипова Альфия Маратовна"]["hours"][1],
-                WORK_SCHEDULE["Шарипова Альфия Маратовна"]["duration"],
+    current_date = date_from
+    while current_date <= date_to:
+        weekday_name = WEEKDAYS[current_date.weekday()]
+        for employer_id, category_id, schedule in assignments:
+            if weekday_name not in schedule["days"] or (current_date, employer_id) in existing:
+                continue
+            if employer_id in generated_through and current_date <= generated_through[employer_id]:
+                continue
+            all_time_slots.extend(generate_time_slots(
+                schedule["hours"][0],
+                schedule["hours"][1],
+                schedule["duration"],
                 current_date,
-                workers[2].id,
-                categories[2].id
-            )
-            all_time_slots.extend(slots)
+                employer_id,
+                category_id
+            ))
+        current_date += timedelta(days=1)
 
     if all_time_slots:
-        session.add_all(all_time_slots)
-        session.commit()
-        logger.info(f"Добавлены временные слоты для недели, начинающейся {start_date}")
+        session.bulk_save_objects(all_time_slots)
+    for employer_id, _, _ in assignments:
+        session.execute(
+            text(
+                """
+                INSERT INTO slot_generation (id_employer, generated_through) VALUES (:employer, :date_to)
+                ON CONFLICT (id_employer) DO UPDATE
+                SET generated_through = GREATEST(slot_generation.generated_through, EXCLUDED.generated_through)
+                """
+            ),
+            {"employer": employer_id, "date_to": date_to},
+        )
+    return len(all_time_slots)
+
 
+def horizon_end(today: date, weeks: int) -> date:
+    """Последний день горизонта: воскресенье через weeks недель, считая текущую (в воскресенье — следующую)"""
+    if today.weekday() == 6:
+        current_monday = today + timedelta(days=1)
+    else:
+        current_monday = today - timedelta(days=today.weekday())
+    return current_monday + timedelta(weeks=weeks, days=-1)
 
-def refresh_weekly_slots():
+
+def maintain_slot_horizon():
     """
-    Функция, запускаемая раз в неделю по расписанию (каждое воскресенье),
-    чтобы сгенерировать временные слоты на следующую неделю.
+    Поддерживает слоты на SLOT_HORIZON_WEEKS недель вперёд. Запускается при старте
+    и каждые SLOT_HORIZON_INTERVAL_MINUTES минут; пропущенные запуски (сервис был
+    остановлен) догоняются одним проходом. Заодно создаёт месячные секции впрок,
+    архивирует старые и сверяет счётчики дней с текущего месяца до конца горизонта.
+    Транзакционная advisory-блокировка не даёт двум экземплярам сервиса делать
+    это одновременно.
     """
     Session = sessionmaker(bind=engine)
     session = Session()
     try:
+        locked = session.execute(
+            text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": SLOT_HORIZON_LOCK_KEY}
+        ).scalar()
+        if not locked:
+            logger.info("Горизонт слотов обслуживает другой экземпляр, пропускаем")
+            return
+
         today = date.today()
-        # Если сегодня воскресенье, то хотим именно следующий понедельник:
-        # next_monday = сегодня + 1 день
-        if today.weekday() == 6:
-            next_monday = today + timedelta(days=1)
-        else:
-            # Иначе: найти ближайший следующий понедельник
-            next_monday = today + timedelta(days=(7 - today.weekday()))
-        logger.info(f"Запуск еженедельного создания слотов. Следующий понедельник: {next_monday}")
-        generate_week_slots(session, next_monday)
+        date_to = horizon_end(today, SLOT_HORIZON_WEEKS)
+        conn = session.connection()
+        ensure_partitions(conn, month_start(today), add_months(date_to, PARTITION_MONTHS_AHEAD))
+        added = generate_missing_slots(session, today, date_to)
+        if PARTITION_ARCHIVE_AFTER_MONTHS > 0:
+            archive_before = add_months(month_start(today), -PARTITION_ARCHIVE_AFTER_MONTHS)
+            if archive_partitions(conn, archive_before):
+                drop_day_counters_before(conn, archive_before)
+        session.commit()
+        if added:
+            logger.info(f"Горизонт слотов до {date_to}: добавлено {added} слотов")
+
+        # Вне транзакции горизонта: сверка идёт своими короткими транзакциями по дню
+        reconcile_day_counters(engine, month_start(today), date_to)
     except Exception as e:
-        logger.error(f"Ошибка при еженедельном обновлении слотов: {e}")
+        session.rollback()
+        logger.error(f"Ошибка при обновлении горизонта слотов: {e}")
+        raise
     finally:
         session.close()
 
 
 def initialize_db_and_slots():
     """
-    Вызывается при старте сервиса: создаёт базовые данные,
-    затем генерирует либо текущую неделю, либо следующую (если сегодня воскресенье),
-    а потом запускает планировщик.
+    Вызывается при старте сервиса: применяет миграции схемы (migrations/),
+    создаёт базовые данные, затем догоняет горизонт слотов
+    на SLOT_HORIZON_WEEKS недель вперёд.
     """
     wait_for_db(engine)
-    Base.metadata.create_all(bind=engine)
-    logger.info("Таблицы созданы успешно!")
+    run_migrations(engine)
 
     Session = sessionmaker(bind=engine)
     session = Session()
     try:
         create_initial_data(session)
 
-        today = date.today()
-        # Если сегодня воскресенье, формируем сразу слоты на следующую неделю
-        if today.weekday() == 6:
-            current_monday = today + timedelta(days=1)
-        else:
-            # иначе — понедельник текущей недели
-            current_monday = today - timedelta(days=today.weekday())
-        logger.info(f"Создание слотов для недели (понедельник = {current_monday})")
-        generate_week_slots(session, current_monday)
+        if SEED_MODE == "synthetic":
+            if already_seeded(engine):
+                logger.info("Синтетические данные уже загружены, пропускаем")
+            else:
+                seed_synthetic_data(engine, WORK_SCHEDULE, WEEKDAYS, **options_from_env())
 
     except Exception as e:
         logger.error(f"Ошибка при инициализации базы данных: {e}")
@@ -358,22 +396,28 @@ def initialize_db_and_slots():
     finally:
         session.close()
 
+    maintain_slot_horizon()
+
 
 if __name__ == "__main__":
     # Инициализация БД и данных (включая слоты)
     initialize_db_and_slots()
 
-    # Планировщик: каждое воскресенье в 00:00
+    # Планировщик: периодическая проверка горизонта вместо разового запуска по воскресеньям,
+    # чтобы пропущенное окно (сервис был выключен) не оставляло неделю без слотов
     scheduler = BackgroundScheduler()
     scheduler.add_job(
-        refresh_weekly_slots,
-        trigger='cron',
-        day_of_week='sun',
-        hour=0,
-        minute=0
+        maintain_slot_horizon,
+        trigger='interval',
+        minutes=SLOT_HORIZON_INTERVAL_MINUTES,
+        max_instances=1,
+        coalesce=True
     )
     scheduler.start()
-    logger.info("Планировщик запущен. Слоты будут обновляться каждое воскресенье.")
+    logger.info(
+        f"Планировщик запущен: горизонт слотов {SLOT_HORIZON_WEEKS} нед., "
+        f"проверка каждые {SLOT_HORIZON_INTERVAL_MINUTES} мин."
+    )
 
     try:
         while True:
@@ -0,0 +1,190 @@
+"""
+Версионированные миграции схемы.
+
+Миграции — файлы migrations/NNNN_описание.py с функцией upgrade(conn) и
+флагом TRANSACTIONAL (по умолчанию True). Транзакционная миграция выполняется
+в одной транзакции вместе с отметкой в schema_migrations. Нетранзакционная
+(CREATE INDEX CONCURRENTLY и т.п.) получает соединение в режиме autocommit,
+отмечается после успешного завершения и должна быть идемпотентной:
+при сбое она будет запущена заново целиком.
+
+run_migrations(engine) вызывается при старте service-database. Сессионная
+advisory-блокировка гарантирует, что миграции применяет один экземпляр;
+остальные ждут её освобождения опросом pg_try_advisory_lock, а не
+блокирующим вызовом — ожидающий запрос держал бы снимок, и CREATE INDEX
+CONCURRENTLY ждал бы его завершения.
+"""
+
+import importlib.util
+import logging
+import os
+import re
+import time
+from typing import List, Sequence
+
+from partitioning import is_partitioned
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+# Ключ pg_advisory_lock миграций (произвольная константа, общая для всех экземпляров)
+MIGRATION_LOCK_KEY = 7_340_002
+
+_MIGRATION_FILE_RE = re.compile(r"^(?P<version>\d{4})_(?P<name>\w+)\.py$")
+
+
+class Migration:
+    def __init__(self, version: str, name: str, path: str):
+        self.version = version
+        self.name = name
+        self.path = path
+        self._module = None
+
+    @property
+    def module(self):
+        if self._module is None:
+            spec = importlib.util.spec_from_file_location(f"migration_{self.version}", self.path)
+            self._module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(self._module)
+        return self._module
+
+    @property
+    def transactional(self) -> bool:
+        return getattr(self.module, "TRANSACTIONAL", True)
+
+    def __str__(self):
+        return f"{self.version}_{self.name}"
+
+
+def discover(directory: str = MIGRATIONS_DIR) -> List[Migration]:
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = _MIGRATION_FILE_RE.match(filename)
+        if match:
+            migrations.append(Migration(match["version"], match["name"], os.path.join(directory, filename)))
+    versions = [m.version for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Повторяющиеся номера миграций в {directory}")
+    return migrations
+
+
+def _acquire_lock(conn, timeout: float):
+    deadline = time.monotonic() + timeout
+    waiting_logged = False
+    while not conn.exec_driver_sql("SELECT pg_try_advisory_lock(%(key)s)", {"key": MIGRATION_LOCK_KEY}).scalar():
+        if time.monotonic() >= deadline:
+            raise TimeoutError("Не дождались блокировки миграций: их применяет другой экземпляр")
+        if not waiting_logged:
+            logger.info("Миграции применяет другой экземпляр, ждём...")
+            waiting_logged = True
+        time.sleep(1)
+
+
+def run_migrations(engine, lock_timeout: float = 1800) -> List[str]:
+    """Применяет недостающие миграции по порядку; возвращает применённые версии"""
+    applied_now = []
+    autocommit = engine.execution_options(isolation_level="AUTOCOMMIT")
+    lock_conn = autocommit.connect()
+    try:
+        _acquire_lock(lock_conn, lock_timeout)
+
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version VARCHAR(16) PRIMARY KEY,
+                    name VARCHAR(255) NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    duration_ms INTEGER NOT NULL
+                )
+                """
+            )
+            applied = {row[0] for row in conn.exec_driver_sql("SELECT version FROM schema_migrations")}
+
+        for migration in discover():
+            if migration.version in applied:
+                continue
+            logger.info(f"Миграция {migration}...")
+            started = time.perf_counter()
+            if migration.transactional:
+                with engine.begin() as conn:
+                    migration.module.upgrade(conn)
+                    _record(conn, migration, started)
+            else:
+                with autocommit.connect() as conn:
+                    migration.module.upgrade(conn)
+                with engine.begin() as conn:
+                    _record(conn, migration, started)
+            logger.info(f"Миграция {migration} применена за {time.perf_counter() - started:.1f} с")
+            applied_now.append(migration.version)
+    finally:
+        lock_conn.exec_driver_sql("SELECT pg_advisory_unlock(%(key)s)", {"key": MIGRATION_LOCK_KEY})
+        lock_conn.close()
+
+    if not applied_now:
+        logger.info("Схема базы данных актуальна")
+    return applied_now
+
+
+def _record(conn, migration: Migration, started: float):
+    conn.exec_driver_sql(
+        "INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%(version)s, %(name)s, %(ms)s)",
+        {"version": migration.version, "name": migration.name, "ms": int((time.perf_counter() - started) * 1000)},
+    )
+
+
+# ----------------------------
+# Помощники для миграций
+# ----------------------------
+def _index_valid(conn, name: str):
+    """True/False — индекс есть и валиден/невалиден (прерванная сборка), None — индекса нет"""
+    row = conn.exec_driver_sql(
+        "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(%(name)s)", {"name": name}
+    ).first()
+    return None if row is None else row[0]
+
+
+def _build_index_concurrently(conn, name: str, table: str, columns_sql: str, using: str):
+    valid = _index_valid(conn, name)
+    if valid:
+        return
+    if valid is False:
+        logger.warning(f"Индекс {name} невалиден (прерванная сборка), пересоздаём")
+        conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"')
+    conn.exec_driver_sql(f'CREATE INDEX CONCURRENTLY "{name}" ON "{table}" USING {using} ({columns_sql})')
+
+
+def create_index_concurrently(conn, name: str, table: str, columns: Sequence[str], using: str = "btree"):
+    """
+    Строит индекс без блокировки записи в таблицу; повторный вызов ничего не делает.
+    Соединение должно быть в режиме autocommit (миграция с TRANSACTIONAL = False).
+
+    Для секционированной таблицы CONCURRENTLY недоступен, поэтому родительский
+    индекс создаётся ON ONLY (мгновенно, пока невалиден), индексы секций —
+    CONCURRENTLY, после чего присоединяются к нему; с последней секцией
+    родительский индекс становится валидным, а новые секции получают индекс
+    автоматически.
+    """
+    columns_sql = ", ".join(f'"{column}"' for column in columns)
+    if not is_partitioned(conn, table):
+        _build_index_concurrently(conn, name, table, columns_sql, using)
+        return
+
+    conn.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS "{name}" ON ONLY "{table}" USING {using} ({columns_sql})')
+    partitions = [
+        row[0] for row in conn.exec_driver_sql(
+            "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(%(table)s) ORDER BY c.relname",
+            {"table": table},
+        )
+    ]
+    for partition in partitions:
+        # Имя как у индекса, который Postgres создаёт сам для новой секции
+        child = f"{partition}_{'_'.join(columns)}_idx"
+        _build_index_concurrently(conn, child, partition, columns_sql, using)
+        attached = conn.exec_driver_sql(
+            "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%(child)s) AND inhparent = to_regclass(%(parent)s)",
+            {"child": child, "parent": name},
+        ).first()
+        if not attached:
+            conn.exec_driver_sql(f'ALTER INDEX "{name}" ATTACH PARTITION "{child}"')
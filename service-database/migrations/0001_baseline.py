@@ -0,0 +1,111 @@
+"""
+Исходная схема — таблицы в том виде, в каком их создавал create_all при
+старте до появления миграций, и однократный перенос time_slot и
+online_registration в секционированные таблицы для баз, созданных до
+секционирования.
+
+Схема описана здесь же и заморожена: models.py меняется вместе с
+последующими миграциями, и новая база, созданная по нему, разошлась бы
+с базой, прошедшей миграции по порядку. Всё, что добавлено позже
+(индексы 0002-0003, таблицы 0004-0005 и т.д.), создают сами миграции.
+"""
+
+from datetime import date
+
+from sqlalchemy import (
+    ARRAY, Boolean, Column, Date, DateTime, ForeignKey, ForeignKeyConstraint, Integer, MetaData, String, Table, Time,
+)
+
+from partitioning import convert_to_partitioned
+
+metadata = MetaData()
+
+Table(
+    "category_service", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("name_category", String, nullable=False),
+    Column("time_width_minutes_end", Integer, nullable=False),
+    Column("services_array", ARRAY(String), nullable=True),
+)
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("role", String, nullable=False),
+    Column("email", String, unique=True, nullable=True),
+    Column("password", String, nullable=True),
+    Column("name", String, nullable=False),
+    Column("last_name", String, nullable=False),
+    Column("sur_name", String, nullable=True),
+    Column("phone_number", String, nullable=False),
+    Column("date_time_created", DateTime),
+    Column("date_time_edited", DateTime),
+    Column("id_category_service", Integer, ForeignKey("category_service.id"), nullable=True),
+    Column("google_api_key", String, nullable=True),
+    Column("google_client_id", String, nullable=True),
+    Column("google_calendar_id", String, nullable=True),
+    Column("google_token_autorization", String, nullable=True),
+    Column("chat_id", String, nullable=True),
+    Column("tg_name", String, nullable=True),
+)
+
+Table(
+    "clients", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("email", String, nullable=True),
+    Column("password", String, nullable=True),
+    Column("name", String, nullable=False),
+    Column("last_name", String, nullable=True),
+    Column("sur_name", String, nullable=True),
+    Column("phone_number", String, nullable=False),
+    Column("whatsapp", String, nullable=True),
+    Column("tg_name", String, nullable=True),
+    Column("chat_id", String, nullable=True),
+)
+
+Table(
+    "company_description", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("company_name", String, nullable=False),
+    Column("company_description", String, nullable=True),
+    Column("company_adress_country", String, nullable=False),
+    Column("company_adress_city", String, nullable=False),
+    Column("company_adress_street", String, nullable=False),
+    Column("company_adress_house_number", String, nullable=False),
+    Column("company_adress_house_number_index", String, nullable=False),
+    Column("time_work_start", Time, nullable=False),
+    Column("time_work_end", Time, nullable=False),
+    *(Column(f"weekdays_work_{day}", Boolean) for day in range(1, 8)),
+)
+
+Table(
+    "time_slot", metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("id_category_service", Integer, ForeignKey("category_service.id")),
+    Column("id_employer", Integer, ForeignKey("users.id")),
+    Column("date", Date, primary_key=True),
+    Column("time_start", Time, nullable=False),
+    Column("id_time_width_minutes_end", Integer, ForeignKey("category_service.id")),
+    postgresql_partition_by="RANGE (date)",
+)
+
+Table(
+    "online_registration", metadata,
+    Column("id", Integer, primary_key=True, index=True, autoincrement=True),
+    Column("slot_date", Date, primary_key=True),
+    Column("id_client", Integer, ForeignKey("clients.id")),
+    Column("id_employer", Integer, ForeignKey("users.id")),
+    Column("id_time_slot", Integer),
+    Column("date_time_create", DateTime),
+    Column("date_time_edit", DateTime),
+    Column("id_adress_company", Integer, ForeignKey("company_description.id")),
+    ForeignKeyConstraint(["id_time_slot", "slot_date"], ["time_slot.id", "time_slot.date"], onupdate="CASCADE"),
+    postgresql_partition_by="RANGE (slot_date)",
+)
+
+
+def upgrade(conn):
+    # На базе, созданной до миграций, таблицы уже есть, и create_all их не трогает
+    metadata.create_all(bind=conn)
+    # Секции дальше горизонта создаст maintain_slot_horizon
+    convert_to_partitioned(conn, metadata, date.today())
@@ -0,0 +1,17 @@
+"""
+Индексы горячих запросов: слоты по дате, записи по слоту, поиск специалиста
+по телефону и клиента по имени в Telegram. Строятся CONCURRENTLY — запись
+в таблицы во время сборки не блокируется; на новой базе таблицы ещё пусты,
+и сборка мгновенна.
+"""
+
+from migrate import create_index_concurrently
+
+TRANSACTIONAL = False
+
+
+def upgrade(conn):
+    create_index_concurrently(conn, "ix_time_slot_date", "time_slot", ["date"])
+    create_index_concurrently(conn, "ix_online_registration_id_time_slot", "online_registration", ["id_time_slot"])
+    create_index_concurrently(conn, "ix_users_phone_number", "users", ["phone_number"])
+    create_index_concurrently(conn, "ix_clients_tg_name", "clients", ["tg_name"])
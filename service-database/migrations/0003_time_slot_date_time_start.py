@@ -0,0 +1,13 @@
+"""
+Индекс (date, time_start) для поиска ближайших свободных слотов
+(/timeslots/next-available/ в service-calendar): слоты читаются в порядке
+времени начала, и запрос с LIMIT останавливается на первых найденных.
+"""
+
+from migrate import create_index_concurrently
+
+TRANSACTIONAL = False
+
+
+def upgrade(conn):
+    create_index_concurrently(conn, "ix_time_slot_date_time_start", "time_slot", ["date", "time_start"])
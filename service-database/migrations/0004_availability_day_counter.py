@@ -0,0 +1,30 @@
+"""
+Таблица availability_day_counter, триггеры, которые её ведут
+(day_counters.py), и начальное заполнение по всем имеющимся данным.
+"""
+
+from day_counters import install_triggers, recompute_day_counters
+
+
+def upgrade(conn):
+    conn.exec_driver_sql(
+        """
+        CREATE TABLE availability_day_counter (
+            id_employer INTEGER NOT NULL,
+            date DATE NOT NULL,
+            total INTEGER NOT NULL,
+            booked INTEGER NOT NULL,
+            PRIMARY KEY (id_employer, date)
+        )
+        """
+    )
+    install_triggers(conn)
+    date_from, date_to = conn.exec_driver_sql(
+        """
+        SELECT LEAST((SELECT MIN(date) FROM time_slot), (SELECT MIN(slot_date) FROM online_registration)),
+               GREATEST((SELECT MAX(date) FROM time_slot), (SELECT MAX(slot_date) FROM online_registration))
+        """
+    ).one()
+    if date_from is not None:
+        # Триггеры ещё не видны другим транзакциям — блокировки не нужны
+        recompute_day_counters(conn, date_from, date_to)
@@ -0,0 +1,25 @@
+"""
+Таблица slot_generation: до какой даты слоты специалиста уже сгенерированы.
+Начальная отметка — последний день, на который у специалиста есть слоты,
+чтобы уже очищенные дни внутри горизонта не заполнились заново.
+"""
+
+
+def upgrade(conn):
+    conn.exec_driver_sql(
+        """
+        CREATE TABLE slot_generation (
+            id_employer INTEGER NOT NULL PRIMARY KEY,
+            generated_through DATE NOT NULL
+        )
+        """
+    )
+    conn.exec_driver_sql(
+        """
+        INSERT INTO slot_generation (id_employer, generated_through)
+        SELECT id_employer, MAX(date) FROM time_slot
+        WHERE id_employer IS NOT NULL
+        GROUP BY id_employer
+        ON CONFLICT (id_employer) DO NOTHING
+        """
+    )
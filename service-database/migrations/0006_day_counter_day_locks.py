@@ -0,0 +1,11 @@
+"""
+Триггеры счётчиков дней берут разделяемую блокировку дня (day_counters.py):
+сверка больше не блокирует таблицу счётчиков целиком, а пересчитывает по
+одному дню под монопольной блокировкой этого дня.
+"""
+
+from day_counters import install_triggers
+
+
+def upgrade(conn):
+    install_triggers(conn)
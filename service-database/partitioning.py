@@ -0,0 +1,209 @@
+"""
+Помесячное секционирование time_slot и online_registration.
+
+Обе таблицы секционированы по дате слота (time_slot.date и
+online_registration.slot_date), поэтому запись лежит в секции того же месяца,
+что и её слот. Составной внешний ключ (id_time_slot, slot_date) проверяется
+внутри пары секций, а запросы с фильтром по дате читают только нужные месяцы.
+
+- ensure_partitions(conn, date_from, date_to) — создаёт недостающие месячные
+  секции; вызывается задачей горизонта слотов с запасом вперёд;
+- convert_to_partitioned(conn, metadata, date_to) — однократный перенос
+  обычных таблиц, созданных до секционирования;
+- archive_partitions(conn, before) — переносит месяцы до before в таблицы
+  *_history и удаляет их секции, чтобы горячие таблицы и их индексы не росли
+  годами.
+"""
+
+import logging
+import re
+from datetime import date
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+# (таблица, ключ секционирования); порядок — как у внешнего ключа: сначала слоты
+PARTITIONED_TABLES = (("time_slot", "date"), ("online_registration", "slot_date"))
+
+_PARTITION_RE = re.compile(r"^(?P<table>\w+)_(?P<year>\d{4})_(?P<month>\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    """Первое число месяца, отстоящего от day на months (может быть отрицательным)"""
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def _regclass(conn, name: str):
+    return conn.exec_driver_sql("SELECT to_regclass(%(name)s)", {"name": name}).scalar()
+
+
+def is_partitioned(conn, table: str) -> bool:
+    return conn.exec_driver_sql(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass(%(name)s)", {"name": table}
+    ).scalar() == "p"
+
+
+def list_partitions(conn, table: str) -> List[date]:
+    """Месяцы, для которых у таблицы есть секция (по имени вида time_slot_2025_01)"""
+    rows = conn.exec_driver_sql(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%(name)s)
+        """,
+        {"name": table},
+    )
+    months = []
+    for (name,) in rows:
+        match = _PARTITION_RE.match(name)
+        if match and match["table"] == table:
+            months.append(date(int(match["year"]), int(match["month"]), 1))
+    return sorted(months)
+
+
+def ensure_partitions(conn, date_from: date, date_to: date) -> List[str]:
+    """Создаёт месячные секции обеих таблиц для всех месяцев [date_from, date_to]"""
+    created = []
+    for table, _ in PARTITIONED_TABLES:
+        existing = set(list_partitions(conn, table))
+        month = month_start(date_from)
+        while month <= date_to:
+            if month not in existing:
+                name = partition_name(table, month)
+                conn.exec_driver_sql(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{table}" '
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+                )
+                created.append(name)
+            month = add_months(month, 1)
+    if created:
+        logger.info(f"Созданы секции: {', '.join(created)}")
+    return created
+
+
+# ----------------------------
+# Перенос существующих таблиц
+# ----------------------------
+def _rename_to_legacy(conn, table: str):
+    """Переименовывает таблицу вместе с индексами и последовательностью, освобождая имена"""
+    sequence = conn.exec_driver_sql("SELECT pg_get_serial_sequence(%(name)s, 'id')", {"name": table}).scalar()
+    indexes = [
+        name for (name,) in conn.exec_driver_sql(
+            "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+            "WHERE i.indrelid = to_regclass(%(name)s)",
+            {"name": table},
+        )
+    ]
+    conn.exec_driver_sql(f'ALTER TABLE "{table}" RENAME TO "{table}_legacy"')
+    for name in indexes:
+        # Переименование индекса ограничения (pkey) переименовывает и само ограничение
+        conn.exec_driver_sql(f'ALTER INDEX "{name}" RENAME TO "{name}_legacy"')
+    if sequence:
+        conn.exec_driver_sql(f'ALTER SEQUENCE {sequence} RENAME TO "{table}_legacy_id_seq"')
+
+
+def convert_to_partitioned(conn, metadata, date_to: date) -> bool:
+    """
+    Переносит обычные time_slot и online_registration в секционированные таблицы
+    той же структуры, что описана в models.py. Выполняется в транзакции conn:
+    при ошибке база остаётся как была. Возвращает True, если перенос был.
+    """
+    if _regclass(conn, "time_slot") is None:
+        return False  # таблиц ещё нет — create_all сразу создаст секционированные
+    if is_partitioned(conn, "time_slot") and is_partitioned(conn, "online_registration"):
+        return False
+
+    logger.info("Перенос time_slot и online_registration в секционированные таблицы...")
+    for table in ("online_registration", "time_slot"):
+        _rename_to_legacy(conn, table)
+    for table, _ in PARTITIONED_TABLES:
+        metadata.tables[table].create(conn)
+
+    date_from, last_slot = conn.exec_driver_sql(
+        """
+        SELECT LEAST(
+                   (SELECT MIN(date) FROM time_slot_legacy),
+                   (SELECT MIN(date_time_create)::date FROM online_registration_legacy),
+                   CURRENT_DATE
+               ),
+               (SELECT MAX(date) FROM time_slot_legacy)
+        """
+    ).one()
+    ensure_partitions(conn, date_from, max(date_to, last_slot or date_to))
+
+    conn.exec_driver_sql(
+        """
+        INSERT INTO time_slot (id, id_category_service, id_employer, date, time_start, id_time_width_minutes_end)
+        SELECT id, id_category_service, id_employer, date, time_start, id_time_width_minutes_end
+        FROM time_slot_legacy
+        """
+    )
+    # Записи без слота (слот удалён) кладём в месяц создания записи
+    conn.exec_driver_sql(
+        """
+        INSERT INTO online_registration (id, slot_date, id_client, id_employer, id_time_slot,
+                                         date_time_create, date_time_edit, id_adress_company)
+        SELECT r.id, COALESCE(t.date, r.date_time_create::date, CURRENT_DATE), r.id_client, r.id_employer,
+               t.id, r.date_time_create, r.date_time_edit, r.id_adress_company
+        FROM online_registration_legacy r
+        LEFT JOIN time_slot_legacy t ON t.id = r.id_time_slot
+        """
+    )
+    for table, _ in PARTITIONED_TABLES:
+        conn.exec_driver_sql(
+            f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)"
+        )
+    conn.exec_driver_sql("DROP TABLE online_registration_legacy")
+    conn.exec_driver_sql("DROP TABLE time_slot_legacy")
+    logger.info("Перенос в секционированные таблицы завершён")
+    return True
+
+
+# ----------------------------
+# Архивирование
+# ----------------------------
+def ensure_history_tables(conn):
+    """
+    Таблицы истории: та же структура без ограничений, только добавление строк.
+    Вместо B-дерева — BRIN по дате: строки лежат в порядке месяцев,
+    и индекс за годы занимает несколько страниц.
+    """
+    for table, key in PARTITIONED_TABLES:
+        conn.exec_driver_sql(f'CREATE TABLE IF NOT EXISTS "{table}_history" (LIKE "{table}") WITH (fillfactor = 100)')
+        conn.exec_driver_sql(
+            f'CREATE INDEX IF NOT EXISTS "ix_{table}_history_{key}" ON "{table}_history" USING brin ("{key}")'
+        )
+
+
+def archive_partitions(conn, before: date) -> List[date]:
+    """
+    Переносит месяцы, целиком лежащие раньше before, в таблицы *_history:
+    секция отсоединяется, её строки копируются в историю, секция удаляется.
+    Записи обрабатываются раньше слотов — иначе отсоединение секции слотов
+    нарушило бы внешний ключ.
+    """
+    months = [month for month in list_partitions(conn, "time_slot") if add_months(month, 1) <= before]
+    if not months:
+        return []
+    ensure_history_tables(conn)
+    for month in months:
+        for table, _ in reversed(PARTITIONED_TABLES):
+            name = partition_name(table, month)
+            if _regclass(conn, name) is None:
+                continue
+            conn.exec_driver_sql(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"')
+            conn.exec_driver_sql(f'INSERT INTO "{table}_history" SELECT * FROM "{name}"')
+            conn.exec_driver_sql(f'DROP TABLE "{name}"')
+        logger.info(f"Месяц {month:%Y-%m} перенесён в историю")
+    return months
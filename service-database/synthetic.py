@@ -0,0 +1,298 @@
+"""
+Синтетические данные большого объёма для нагрузочных тестов и оценки ёмкости.
+
+    python synthetic.py --clients 300000 --specialists 300 --weeks-back 26 \
+        --weeks-ahead 12 --booking-density 0.6 --seed 42
+
+или при старте сервиса: SEED_MODE=synthetic, параметры — переменные
+SYNTHETIC_CLIENTS, SYNTHETIC_SPECIALISTS, SYNTHETIC_WEEKS_BACK,
+SYNTHETIC_WEEKS_AHEAD, SYNTHETIC_BOOKING_DENSITY, SYNTHETIC_SEED.
+
+Данные дополняют create_initial_data: специалисты — копии базовых с их
+графиками из WORK_SCHEDULE, слоты — по этим графикам, записи — доля
+booking-density слотов со случайными клиентами. Идентификаторы назначаются
+заранее, поэтому внешние ключи согласованы без обращений к базе; все таблицы
+загружаются через COPY в одной транзакции. Хэши паролей bcrypt считаются
+по одному разу. При одинаковом --seed на пустой базе данные совпадают.
+"""
+
+import logging
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import bcrypt
+
+from partitioning import ensure_partitions
+
+logger = logging.getLogger(__name__)
+
+SYNTHETIC_EMAIL_DOMAIN = "synthetic.local"
+
+FIRST_NAMES = ["Иван", "Елена", "Алексей", "Мария", "Дмитрий", "Анна", "Артур", "Гульнара",
+               "Олег", "Наталья", "Ильдар", "Светлана", "Рустам", "Алия", "Павел", "Ольга"]
+LAST_NAMES = ["Иванов", "Петрова", "Сидоров", "Хасанова", "Смирнов", "Гарипова", "Кузнецов",
+              "Орлова", "Валиев", "Зайцева", "Морозов", "Нуриева"]
+
+
+class _CopyStream:
+    """Файлоподобный объект для copy_expert: строки формата COPY text генерируются по мере чтения"""
+
+    def __init__(self, rows: Iterable[Sequence], lines_per_chunk: int = 2000):
+        self._rows = iter(rows)
+        self._lines_per_chunk = lines_per_chunk
+        self._buffer = ""
+        self.rows = 0
+
+    @staticmethod
+    def _format(value) -> str:
+        if value is None:
+            return "\\N"
+        text = value if isinstance(value, str) else str(value)
+        if "\\" in text or "\t" in text or "\n" in text:
+            text = text.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+        return text
+
+    def _next_chunk(self) -> str:
+        lines = []
+        for row in self._rows:
+            lines.append("\t".join(self._format(v) for v in row))
+            if len(lines) >= self._lines_per_chunk:
+                break
+        self.rows += len(lines)
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self._buffer) < size:
+            chunk = self._next_chunk()
+            if not chunk:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, ""
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _copy(cursor, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    stream = _CopyStream(rows)
+    started = time.perf_counter()
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", stream)
+    logger.info(f"COPY {table}: {stream.rows} строк за {time.perf_counter() - started:.1f} с")
+    return stream.rows
+
+
+def _next_id(cursor, table: str) -> int:
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {table}")
+    return cursor.fetchone()[0]
+
+
+def _slot_times(hours: Tuple[str, str], duration: int) -> List[str]:
+    """Начала слотов рабочего дня — та же сетка, что у generate_time_slots"""
+    start = datetime.strptime(hours[0], "%H:%M")
+    end = datetime.strptime(hours[1], "%H:%M")
+    times = []
+    while start + timedelta(minutes=duration) <= end:
+        times.append(start.strftime("%H:%M"))
+        start += timedelta(minutes=duration)
+    return times
+
+
+def already_seeded(engine) -> bool:
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT 1 FROM clients WHERE email LIKE %(pattern)s LIMIT 1",
+            {"pattern": f"%@{SYNTHETIC_EMAIL_DOMAIN}"},
+        ).first() is not None
+
+
+def seed_synthetic_data(
+    engine,
+    work_schedule: Dict[str, dict],
+    weekdays: Dict[int, str],
+    clients: int = 300000,
+    specialists: int = 300,
+    weeks_back: int = 26,
+    weeks_ahead: int = 12,
+    booking_density: float = 0.6,
+    seed: int = 42,
+    today: Optional[date] = None,
+) -> dict:
+    """
+    Загружает синтетических клиентов, специалистов, слоты и записи поверх
+    create_initial_data. Возвращает сводку: число строк и диапазоны идентификаторов.
+    """
+    rng = random.Random(seed)
+    today = today or date.today()
+    date_from = today - timedelta(weeks=weeks_back)
+    date_to = today + timedelta(weeks=weeks_ahead)
+    started = time.perf_counter()
+
+    # Хэши один раз на весь набор: bcrypt на каждую строку занял бы часы
+    client_password = bcrypt.hashpw(b"synthetic-client", bcrypt.gensalt()).decode("utf-8")
+    specialist_password = bcrypt.hashpw(b"synthetic-specialist", bcrypt.gensalt()).decode("utf-8")
+
+    # Секции на весь диапазон дат: горизонт слотов создаёт их только вперёд
+    with engine.begin() as conn:
+        ensure_partitions(conn, date_from, date_to)
+
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+
+        # Шаблоны — специалисты create_initial_data, у которых есть график в WORK_SCHEDULE
+        cursor.execute("SELECT id, name, last_name, sur_name, id_category_service FROM users ORDER BY id")
+        templates = []
+        for user_id, name, last_name, sur_name, category_id in cursor.fetchall():
+            schedule = work_schedule.get(f"{last_name} {name} {sur_name}")
+            if schedule:
+                templates.append((name, last_name, sur_name, category_id, schedule))
+        if not templates:
+            raise RuntimeError("Нет специалистов с графиком из WORK_SCHEDULE — сначала create_initial_data")
+        cursor.execute("SELECT id FROM company_description ORDER BY id LIMIT 1")
+        company_id = cursor.fetchone()[0]
+
+        # 1. Специалисты
+        first_user = _next_id(cursor, "users")
+        created_at = datetime.combine(date_from, datetime.min.time())
+        staff = []  # (id, категория, график)
+        user_rows = []
+        for i in range(specialists):
+            name, last_name, sur_name, category_id, schedule = templates[i % len(templates)]
+            user_id = first_user + i
+            staff.append((user_id, category_id, schedule))
+            user_rows.append((
+                user_id, "worker", f"specialist{user_id}@{SYNTHETIC_EMAIL_DOMAIN}", specialist_password,
+                name, f"{last_name}-{user_id}", sur_name, f"7900{user_id:07d}", created_at, category_id,
+            ))
+        _copy(cursor, "users", ("id", "role", "email", "password", "name", "last_name", "sur_name",
+                                "phone_number", "date_time_created", "id_category_service"), user_rows)
+
+        # 2. Клиенты
+        first_client = _next_id(cursor, "clients")
+        last_client = first_client + clients - 1
+        _copy(cursor, "clients", ("id", "email", "password", "name", "last_name", "phone_number"), (
+            (client_id, f"client{client_id}@{SYNTHETIC_EMAIL_DOMAIN}", client_password,
+             rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"7911{client_id:07d}")
+            for client_id in range(first_client, last_client + 1)
+        ))
+
+        # 3. Слоты и записи: сетка времени считается один раз на график
+        times_by_schedule = {
+            id(schedule): _slot_times(schedule["hours"], schedule["duration"])
+            for _, _, schedule in staff
+        }
+        first_slot = _next_id(cursor, "time_slot")
+        slot_rows, registration_rows = [], []
+        slot_id = first_slot
+        current = date_from
+        while current <= date_to:
+            weekday = weekdays[current.weekday()]
+            day_start = datetime.combine(current, datetime.min.time())
+            for employer_id, category_id, schedule in staff:
+                if weekday not in schedule["days"]:
+                    continue
+                for time_start in times_by_schedule[id(schedule)]:
+                    slot_rows.append((slot_id, category_id, employer_id, current, time_start, category_id))
+                    if rng.random() < booking_density:
+                        registration_rows.append((
+                            current, rng.randint(first_client, last_client), employer_id, slot_id, company_id,
+                            day_start - timedelta(days=rng.randint(1, 14), minutes=rng.randrange(1440)),
+                        ))
+                    slot_id += 1
+            current += timedelta(days=1)
+        _copy(cursor, "time_slot", ("id", "id_category_service", "id_employer", "date", "time_start",
+                                    "id_time_width_minutes_end"), slot_rows)
+        _copy(cursor, "online_registration", ("slot_date", "id_client", "id_employer", "id_time_slot",
+                                              "id_adress_company", "date_time_create"), registration_rows)
+
+        # Последовательности отстают от явно заданных id — догоняем
+        for table in ("users", "clients", "time_slot"):
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT MAX(id) FROM {table}))"
+            )
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    # ANALYZE вне транзакции загрузки: планировщику нужны свежие статистики
+    with engine.begin() as conn:
+        for table in ("users", "clients", "time_slot", "online_registration"):
+            conn.exec_driver_sql(f"ANALYZE {table}")
+
+    summary = {
+        "seed": seed,
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "company_id": company_id,
+        "specialist_ids": [first_user, first_user + specialists - 1] if specialists else [],
+        "client_ids": [first_client, last_client] if clients else [],
+        "slots": len(slot_rows),
+        "registrations": len(registration_rows),
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+    logger.info(
+        f"Синтетические данные загружены за {summary['seconds']} с: {specialists} специалистов, "
+        f"{clients} клиентов, {summary['slots']} слотов, {summary['registrations']} записей"
+    )
+    return summary
+
+
+def options_from_env() -> dict:
+    return {
+        "clients": int(os.getenv("SYNTHETIC_CLIENTS", "300000")),
+        "specialists": int(os.getenv("SYNTHETIC_SPECIALISTS", "300")),
+        "weeks_back": int(os.getenv("SYNTHETIC_WEEKS_BACK", "26")),
+        "weeks_ahead": int(os.getenv("SYNTHETIC_WEEKS_AHEAD", "12")),
+        "booking_density": float(os.getenv("SYNTHETIC_BOOKING_DENSITY", "0.6")),
+        "seed": int(os.getenv("SYNTHETIC_SEED", "42")),
+    }
+
+
+def main():
+    import argparse
+
+    from sqlalchemy.orm import sessionmaker
+
+    from main import WEEKDAYS, WORK_SCHEDULE, create_initial_data, engine, wait_for_db
+    from migrate import run_migrations
+
+    defaults = options_from_env()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=defaults["clients"])
+    parser.add_argument("--specialists", type=int, default=defaults["specialists"])
+    parser.add_argument("--weeks-back", type=int, default=defaults["weeks_back"])
+    parser.add_argument("--weeks-ahead", type=int, default=defaults["weeks_ahead"])
+    parser.add_argument("--booking-density", type=float, default=defaults["booking_density"])
+    parser.add_argument("--seed", type=int, default=defaults["seed"])
+    args = parser.parse_args()
+
+    wait_for_db(engine)
+    run_migrations(engine)
+    session = sessionmaker(bind=engine)()
+    try:
+        create_initial_data(session)
+    finally:
+        session.close()
+    if already_seeded(engine):
+        parser.error("Синтетические данные уже загружены; пересоздайте базу")
+
+    seed_synthetic_data(
+        engine, WORK_SCHEDULE, WEEKDAYS,
+        clients=args.clients,
+        specialists=args.specialists,
+        weeks_back=args.weeks_back,
+        weeks_ahead=args.weeks_ahead,
+        booking_density=args.booking_density,
+        seed=args.seed,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+logger = logging.getLogger("telegram-ai-bot")
+
+# handler(update, context, text) — обработка одного (возможно, объединённого) вопроса
+Handler = Callable[[object, object, str], Awaitable[None]]
+
+
+class TokenBucket:
+    """Классический token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class _Job:
+    __slots__ = ("chat_id", "update", "context", "texts", "chars", "created_at", "enqueued_at", "started", "timer")
+
+    def __init__(self, chat_id: int, update, context, text: str):
+        self.chat_id = chat_id
+        self.update = update
+        self.context = context
+        self.texts: List[str] = [text]
+        self.chars = len(text)
+        self.created_at = time.monotonic()
+        self.enqueued_at: Optional[float] = None
+        self.started = False
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class AdmissionScheduler:
+    """
+    Планировщик запросов к модели перед ai_handler.
+
+    - не более max_concurrency одновременных запросов к GigaChat;
+    - token bucket на каждый чат (rate сообщений в секунду, burst подряд);
+      токен списывается за каждое сообщение, в том числе объединённое;
+    - сообщения одного чата, пришедшие в течение coalesce_window или пока
+      запрос ждёт в очереди, объединяются в один вопрос — не больше
+      max_merged_messages сообщений и max_merged_chars символов; каждое
+      новое сообщение продлевает ожидание, но не дольше max_coalesce_wait
+      от первого;
+    - запросы одного чата выполняются строго по очереди: сообщения, пришедшие
+      во время ответа, копятся в следующем запросе, и он встаёт в очередь
+      только после завершения текущего — ответы не перемешиваются, а история
+      диалога (memory.py) дописывается последовательно;
+    - очередь ограничена queue_size, при переполнении — вежливый отказ;
+    - фоновые запросы к модели (сводки истории, memory.py) идут через
+      run_background и занимают слоты того же лимита max_concurrency.
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        max_concurrency: int = 4,
+        queue_size: int = 50,
+        user_rate: float = 0.2,
+        user_burst: float = 3,
+        coalesce_window: float = 1.0,
+        max_coalesce_wait: float = 3.0,
+        max_merged_messages: int = 5,
+        max_merged_chars: int = 4000,
+        max_buckets: int = 10000,
+        overload_reply: str = "Сейчас очень много обращений. Пожалуйста, повторите вопрос через минуту.",
+        rate_limited_reply: str = "Вы отправляете сообщения слишком часто. Пожалуйста, подождите немного.",
+    ):
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.coalesce_window = coalesce_window
+        self.max_coalesce_wait = max(max_coalesce_wait, coalesce_window)
+        self.max_merged_messages = max_merged_messages
+        self.max_merged_chars = max_merged_chars
+        self.max_buckets = max_buckets
+        self.overload_reply = overload_reply
+        self.rate_limited_reply = rate_limited_reply
+
+        self.queue_size = queue_size
+        # Очередь создаётся в start(), внутри работающего event loop
+        self._queue: Optional["asyncio.Queue[_Job]"] = None
+        # Слоты обращений к модели: общие для обработчиков очереди и фоновых запросов
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pending: Dict[int, _Job] = {}
+        # Чаты, запрос которых сейчас выполняется
+        self._running: Set[int] = set()
+        self._buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+        self._workers: List[asyncio.Task] = []
+
+        self.in_flight = 0
+        self.admitted = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.shed = 0
+        self.completed = 0
+        self.failed = 0
+        self.background = 0
+        self._queue_waits: Deque[float] = deque(maxlen=1000)
+
+    # ----------------------------
+    # Жизненный цикл
+    # ----------------------------
+    def start(self):
+        if self._workers:
+            return
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._workers = [loop.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def stop(self):
+        for job in self._pending.values():
+            if job.timer is not None:
+                job.timer.cancel()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ----------------------------
+    # Приём сообщений
+    # ----------------------------
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._buckets[chat_id] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(chat_id)
+        return bucket
+
+    async def submit(self, update, context):
+        chat_id = update.effective_chat.id
+        text = update.message.text[:self.max_merged_chars]
+
+        job = self._pending.get(chat_id)
+        merge = job is not None and not job.started
+        if merge and (len(job.texts) >= self.max_merged_messages or job.chars + len(text) > self.max_merged_chars):
+            # Объединённый вопрос уже достиг предела — лишнее не копится в памяти
+            self.rate_limited += 1
+            await update.message.reply_text(self.rate_limited_reply)
+            return
+
+        if not self._bucket(chat_id).take():
+            self.rate_limited += 1
+            await update.message.reply_text(self.rate_limited_reply)
+            return
+
+        # Запрос этого чата ещё не начал выполняться — дописываем к нему
+        if merge:
+            job.texts.append(text)
+            job.chars += len(text)
+            job.update = update
+            job.context = context
+            self.coalesced += 1
+            if job.timer is not None:
+                job.timer.cancel()
+                delay = min(self.coalesce_window, job.created_at + self.max_coalesce_wait - time.monotonic())
+                if delay > 0:
+                    job.timer = asyncio.get_running_loop().call_later(delay, self._enqueue, job)
+                else:
+                    self._enqueue(job)
+            return
+
+        job = _Job(chat_id, update, context, text)
+        self._pending[chat_id] = job
+        if self.coalesce_window > 0:
+            job.timer = asyncio.get_running_loop().call_later(self.coalesce_window, self._enqueue, job)
+        else:
+            self._enqueue(job)
+
+    def _enqueue(self, job: _Job):
+        job.timer = None
+        if job.chat_id in self._running:
+            # Ответ на предыдущий вопрос ещё не готов: поставим в очередь после него
+            return
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.shed += 1
+            if self._pending.get(job.chat_id) is job:
+                del self._pending[job.chat_id]
+            logger.warning("Очередь запросов переполнена, отказ для чата %s", job.chat_id)
+            asyncio.get_running_loop().create_task(self._reply_overloaded(job))
+            return
+        job.enqueued_at = time.monotonic()
+        self.admitted += 1
+
+    async def _reply_overloaded(self, job: _Job):
+        try:
+            await job.update.message.reply_text(self.overload_reply)
+        except Exception:
+            logger.exception("Не удалось отправить сообщение о перегрузке:")
+
+    # ----------------------------
+    # Обработка
+    # ----------------------------
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            job.started = True
+            if self._pending.get(job.chat_id) is job:
+                del self._pending[job.chat_id]
+            self._running.add(job.chat_id)
+            self._queue_waits.append(time.monotonic() - job.enqueued_at)
+
+            try:
+                async with self._slots:
+                    self.in_flight += 1
+                    try:
+                        await self.handler(job.update, job.context, "\n".join(job.texts))
+                        self.completed += 1
+                    finally:
+                        self.in_flight -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.failed += 1
+                logger.exception("Ошибка при обработке сообщения чата %s:", job.chat_id)
+            finally:
+                self._running.discard(job.chat_id)
+                self._queue.task_done()
+                self._enqueue_follow_up(job.chat_id)
+
+    async def run_background(self, func: Callable[..., Awaitable], *args, **kwargs):
+        """Фоновый запрос к модели вне очереди чатов: ждёт свободного слота общего лимита"""
+        async with self._slots:
+            self.in_flight += 1
+            self.background += 1
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.in_flight -= 1
+
+    def _enqueue_follow_up(self, chat_id: int):
+        """Ставит в очередь вопрос, отложенный до завершения предыдущего запроса чата"""
+        job = self._pending.get(chat_id)
+        if job is not None and job.timer is None and job.enqueued_at is None:
+            self._enqueue(job)
+
+    def stats(self) -> dict:
+        waits = sorted(self._queue_waits)
+
+        def percentile(p: float) -> float:
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 1)
+
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "coalesced": self.coalesced,
+            "rate_limited": self.rate_limited,
+            "shed": self.shed,
+            "completed": self.completed,
+            "failed": self.failed,
+            "background": self.background,
+            "queue_wait_p50_ms": percentile(0.5),
+            "queue_wait_p95_ms": percentile(0.95),
+        }
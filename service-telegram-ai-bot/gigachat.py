@@ -0,0 +1,277 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from metrics import observe_outbound, track_outbound
+
+logger = logging.getLogger("telegram-ai-bot")
+
+# Адреса можно переопределить, например, на локальную заглушку API
+GIGACHAT_OAUTH_URL = os.getenv("GIGACHAT_OAUTH_URL", "https://ngw.devices.sberbank.ru:9443/api/v2/oauth")
+GIGACHAT_API_URL = os.getenv("GIGACHAT_API_URL", "https://gigachat.devices.sberbank.ru/api/v1")
+
+
+class GigaChatError(Exception):
+    """Ошибка обращения к GigaChat API"""
+
+
+class GigaChatAuthError(GigaChatError):
+    """Не удалось получить или обновить access_token"""
+
+
+class GigaChatResponseError(GigaChatError):
+    """Ответ GigaChat пришёл, но его не удалось разобрать"""
+
+
+class GigaChatTokenManager:
+    """
+    Асинхронное управление access_token GigaChat.
+
+    - токен обновляется заранее в фоновой задаче, до истечения срока;
+    - одновременные запросы на обновление объединяются в один (single-flight);
+    - сетевые вызовы идут через общий httpx.AsyncClient и не блокируют event loop.
+    """
+
+    def __init__(
+        self,
+        http: httpx.AsyncClient,
+        auth_key: str,
+        scope: str,
+        refresh_margin: float = 60.0,
+        retry_delay: float = 10.0,
+    ):
+        self._http = http
+        self._auth_key = auth_key
+        self._scope = scope
+        self._refresh_margin = refresh_margin
+        self._retry_delay = retry_delay
+
+        self._token: Optional[str] = None
+        self._expires_at: float = 0.0  # UNIX-время в секундах
+        self._inflight: Optional[asyncio.Future] = None
+        self._refresher: Optional[asyncio.Task] = None
+
+    def _is_fresh(self) -> bool:
+        return bool(self._token) and time.time() + self._refresh_margin < self._expires_at
+
+    async def get_token(self) -> str:
+        """Возвращает действующий токен, при необходимости дожидаясь обновления"""
+        if self._is_fresh():
+            return self._token
+        return await self.refresh()
+
+    def invalidate(self, token: str):
+        """Помечает токен недействительным (например, после ответа 401)"""
+        if token == self._token:
+            self._token = None
+            self._expires_at = 0.0
+
+    async def refresh(self) -> str:
+        """Запускает обновление токена или присоединяется к уже идущему"""
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.ensure_future(self._fetch())
+        # shield: отмена одного ожидающего не должна отменять общий запрос
+        return await asyncio.shield(self._inflight)
+
+    async def _fetch(self) -> str:
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept": "application/json",
+            "RqUID": str(uuid.uuid4()),
+            "Authorization": f"Basic {self._auth_key}",
+        }
+        try:
+            with track_outbound("gigachat-oauth") as call:
+                resp = await self._http.post(
+                    GIGACHAT_OAUTH_URL,
+                    headers=headers,
+                    data={"scope": self._scope},
+                    timeout=10.0,
+                )
+                call.status(resp.status_code)
+            resp.raise_for_status()
+            resp_json = resp.json()
+        except Exception as e:
+            logger.exception("Не удалось получить access_token от GigaChat:")
+            raise GigaChatAuthError("Не удалось получить access_token") from e
+
+        token = resp_json.get("access_token")
+        if not token:
+            logger.error("Не удалось извлечь access_token из ответа GigaChat API")
+            raise GigaChatAuthError("Пустой access_token в ответе GigaChat")
+
+        expires_at = float(resp_json.get("expires_at", 0))
+        # GigaChat отдаёт expires_at в миллисекундах
+        if expires_at > 1e12:
+            expires_at /= 1000.0
+        if expires_at <= 0:
+            expires_at = time.time() + 30 * 60
+
+        self._token = token
+        self._expires_at = expires_at
+        logger.info("Получили новый GigaChat token, expires_at=%s", int(expires_at))
+        return token
+
+    async def _refresh_loop(self):
+        while True:
+            if self._is_fresh():
+                delay = self._expires_at - self._refresh_margin - time.time()
+            else:
+                try:
+                    await self.refresh()
+                    continue
+                except GigaChatAuthError:
+                    delay = self._retry_delay
+            await asyncio.sleep(max(delay, 1.0))
+
+    def start(self):
+        """Запускает фоновое упреждающее обновление токена"""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
+
+
+class GigaChatClient:
+    """Клиент GigaChat с общим пулом соединений для OAuth и chat-запросов"""
+
+    def __init__(self, auth_key: str, scope: str, timeout: float = 30.0):
+        self.http = httpx.AsyncClient(
+            verify=False,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+        self.tokens = GigaChatTokenManager(self.http, auth_key, scope)
+
+    async def start(self):
+        self.tokens.start()
+
+    async def close(self):
+        await self.tokens.stop()
+        await self.http.aclose()
+
+    async def _post(self, path: str, payload: dict) -> httpx.Response:
+        """POST к API с токеном; при 401/403 обновляет токен и повторяет один раз"""
+        token = await self.tokens.get_token()
+        for attempt in range(2):
+            try:
+                with track_outbound("gigachat") as call:
+                    resp = await self.http.post(
+                        f"{GIGACHAT_API_URL}{path}",
+                        headers={
+                            "Content-Type": "application/json",
+                            "Authorization": f"Bearer {token}",
+                        },
+                        json=payload,
+                    )
+                    call.status(resp.status_code)
+                resp.raise_for_status()
+                return resp
+            except httpx.HTTPStatusError as http_err:
+                status = http_err.response.status_code
+                if status in (401, 403) and attempt == 0:
+                    logger.info("Получен %s, пробуем обновить токен и повторить...", status)
+                    self.tokens.invalidate(token)
+                    token = await self.tokens.get_token()
+                    continue
+                logger.exception("HTTP ошибка при обращении к GigaChat:")
+                raise GigaChatError(f"HTTP {status}") from http_err
+            except httpx.HTTPError as e:
+                logger.exception("Ошибка при обращении к GigaChat:")
+                raise GigaChatError(str(e)) from e
+        raise GigaChatError("Не удалось выполнить запрос к GigaChat")
+
+    async def complete(self, messages: List[dict], max_tokens: int = 200) -> str:
+        """Возвращает текст ответа модели на список сообщений"""
+        resp = await self._post(
+            "/chat/completions",
+            {"model": "GigaChat", "messages": messages, "max_tokens": max_tokens},
+        )
+        try:
+            data = resp.json()
+            choices = data.get("choices") or []
+            if not choices or "message" not in choices[0]:
+                raise ValueError("Неправильный формат ответа GigaChat")
+            content = choices[0]["message"].get("content", "").strip()
+            if not content:
+                raise ValueError("Пустой результат от GigaChat")
+            return content
+        except Exception as e:
+            logger.exception("Не удалось разобрать ответ от GigaChat:")
+            raise GigaChatResponseError(str(e)) from e
+
+    async def stream(self, messages: List[dict], max_tokens: int = 200) -> AsyncIterator[str]:
+        """
+        Потоковый ответ модели (SSE): отдаёт фрагменты текста по мере генерации.
+        При 401/403 до получения первого фрагмента токен обновляется и запрос повторяется.
+        """
+        payload = {"model": "GigaChat", "messages": messages, "max_tokens": max_tokens, "stream": True}
+        token = await self.tokens.get_token()
+        for attempt in range(2):
+            # Для потока замеряем время до заголовков ответа: длительность генерации зависит от длины ответа
+            started = time.perf_counter()
+            connected = False
+            try:
+                async with self.http.stream(
+                    "POST",
+                    f"{GIGACHAT_API_URL}/chat/completions",
+                    headers={
+                        "Content-Type": "application/json",
+                        "Accept": "text/event-stream",
+                        "Authorization": f"Bearer {token}",
+                    },
+                    json=payload,
+                ) as resp:
+                    connected = True
+                    observe_outbound("gigachat-stream", time.perf_counter() - started, resp.status_code)
+                    if resp.status_code in (401, 403) and attempt == 0:
+                        logger.info("Получен %s, пробуем обновить токен и повторить...", resp.status_code)
+                        self.tokens.invalidate(token)
+                        token = await self.tokens.get_token()
+                        continue
+                    resp.raise_for_status()
+
+                    async for line in resp.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            return
+                        try:
+                            chunk = json.loads(data)
+                            delta = chunk["choices"][0].get("delta", {}).get("content")
+                        except Exception as e:
+                            logger.exception("Не удалось разобрать фрагмент ответа GigaChat:")
+                            raise GigaChatResponseError(str(e)) from e
+                        if delta:
+                            yield delta
+                    return
+            except httpx.HTTPStatusError as http_err:
+                logger.exception("HTTP ошибка при обращении к GigaChat:")
+                raise GigaChatError(f"HTTP {http_err.response.status_code}") from http_err
+            except httpx.HTTPError as e:
+                if not connected:
+                    observe_outbound("gigachat-stream", time.perf_counter() - started, error=e)
+                logger.exception("Ошибка при обращении к GigaChat:")
+                raise GigaChatError(str(e)) from e
+
+    async def embed(self, text: str) -> List[float]:
+        """Эмбеддинг текста (модель Embeddings)"""
+        resp = await self._post("/embeddings", {"model": "Embeddings", "input": [text]})
+        try:
+            return resp.json()["data"][0]["embedding"]
+        except Exception as e:
+            raise GigaChatResponseError(str(e)) from e
@@ -0,0 +1,307 @@
+import asyncio
+import logging
+import math
+import re
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set
+from zoneinfo import ZoneInfo
+
+import httpx
+
+from metrics import track_outbound
+
+logger = logging.getLogger("telegram-ai-bot")
+
+MOSCOW_TZ = ZoneInfo("Europe/Moscow")
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_DATE_RE = re.compile(r"\b(\d{1,2})[./](\d{1,2})(?:[./](\d{2,4}))?\b")
+
+STOP_WORDS = {
+    "в", "во", "на", "и", "а", "у", "к", "с", "по", "о", "об", "за", "из", "до", "ли", "же",
+    "как", "что", "это", "есть", "мне", "вы", "вас", "вам", "я", "можно", "какой", "какие",
+}
+
+# Признаки вопроса о свободном времени (префиксы слов)
+AVAILABILITY_PREFIXES = ("свобод", "окош", "окн", "слот", "ближайш")
+BOOKING_PREFIXES = ("запис", "попаст", "прием", "приём")
+
+WEEKDAY_STEMS = {
+    "понед": 0, "вторн": 1, "среда": 2, "среду": 2, "среды": 2, "четве": 3, "пятни": 4, "суббо": 5, "воскр": 6,
+}
+
+WEEKDAY_NAMES = ["понедельник", "вторник", "среда", "четверг", "пятница", "суббота", "воскресенье"]
+
+
+def stem(word: str) -> str:
+    """Грубый стемминг для русского: первые 5 букв слова"""
+    return word.lower().replace("ё", "е")[:5]
+
+
+def tokenize(text: str) -> List[str]:
+    return [stem(w) for w in _WORD_RE.findall(text.lower()) if w not in STOP_WORDS and len(w) > 1]
+
+
+class Snippet:
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text: str, keywords: str = ""):
+        self.text = text
+        self.tokens: Set[str] = set(tokenize(text + " " + keywords))
+
+
+class ClinicKnowledge:
+    """
+    Локальный снимок данных клиники из service-calendar.
+
+    Периодически загружает услуги, специалистов, описание компании и свободные
+    слоты на ближайшие дни, строит по ним инвертированный индекс фрагментов
+    и отвечает на вопросы о свободном времени без обращения к модели.
+    """
+
+    def __init__(self, calendar_url: Optional[str], days_ahead: int = 14, refresh_seconds: float = 300):
+        self.calendar_url = calendar_url
+        self.days_ahead = days_ahead
+        self.refresh_seconds = refresh_seconds
+
+        self._http = httpx.AsyncClient(timeout=10.0)
+        self._task: Optional[asyncio.Task] = None
+
+        self.snippets: List[Snippet] = []
+        self._index: Dict[str, List[int]] = {}
+        self.specialists: List[dict] = []
+        # {дата: [слот из /timeslots/{date}]}
+        self.slots: Dict[date, List[dict]] = {}
+        self.loaded_at: Optional[datetime] = None
+
+    # ----------------------------
+    # Загрузка снимка
+    # ----------------------------
+    async def _get(self, path: str):
+        with track_outbound("calendar") as call:
+            resp = await self._http.get(f"http://{self.calendar_url}{path}")
+            call.status(resp.status_code)
+        resp.raise_for_status()
+        return resp.json()
+
+    async def refresh(self):
+        today = datetime.now(MOSCOW_TZ).date()
+        days = [today + timedelta(days=i) for i in range(self.days_ahead)]
+        services, specialists, company, *day_slots = await asyncio.gather(
+            self._get("/services/"),
+            self._get("/specialists/"),
+            self._get("/company/"),
+            *(self._get(f"/timeslots/{d.strftime('%Y-%m-%d')}") for d in days),
+        )
+        slots = {d: sorted(items, key=lambda s: s["time_start"]) for d, items in zip(days, day_slots)}
+        self._build(services, specialists, company, slots)
+        self.loaded_at = datetime.now(MOSCOW_TZ)
+        logger.info(
+            "Снимок данных клиники обновлён: %s фрагментов, %s свободных слотов",
+            len(self.snippets), sum(len(v) for v in slots.values()),
+        )
+
+    def _build(self, services: List[dict], specialists: List[dict], company: dict, slots: Dict[date, List[dict]]):
+        snippets = [
+            Snippet(
+                f"Клиника {company['company_name']}: {company.get('company_description') or ''}".strip(),
+                "клиника о вас",
+            ),
+            Snippet(f"Адрес клиники: {company['company_adress_full']}.", "где находитесь адрес доехать"),
+            Snippet(
+                f"Часы работы: {company['time_work_start']}–{company['time_work_end']}, "
+                f"рабочие дни: {', '.join(company['work_days'])}.",
+                "часы работы график режим открыты выходные когда работаете",
+            ),
+        ]
+
+        by_category = defaultdict(list)
+        for spec in specialists:
+            full_name = " ".join(filter(None, [spec["last_name"], spec["name"], spec.get("sur_name")]))
+            by_category[spec.get("category_id")].append(full_name)
+            snippets.append(Snippet(
+                f"Специалист: {full_name} — {spec.get('category_name') or 'специалист клиники'}.",
+                "врач доктор специалист",
+            ))
+
+        for svc in services:
+            names = ", ".join(svc.get("services_array") or [])
+            doctors = ", ".join(by_category.get(svc["id"], []))
+            text = f"Направление «{svc['name_category']}»: {names}. Длительность приёма {svc['time_width_minutes_end']} мин."
+            if doctors:
+                text += f" Ведут приём: {doctors}."
+            snippets.append(Snippet(text, "услуга цена стоимость прием"))
+
+        for spec_name, first in self._nearest_by_specialist(slots).items():
+            snippets.append(Snippet(
+                f"Ближайшее свободное время у специалиста {spec_name}: "
+                f"{first['date']} в {first['time_start']} ({first['service_name']}).",
+                "свободно ближайшее запись время",
+            ))
+
+        index = defaultdict(list)
+        for i, snippet in enumerate(snippets):
+            for token in snippet.tokens:
+                index[token].append(i)
+
+        # Подмена целиком — читатели всегда видят согласованный снимок
+        self.snippets = snippets
+        self._index = dict(index)
+        self.specialists = specialists
+        self.slots = slots
+
+    @staticmethod
+    def _nearest_by_specialist(slots: Dict[date, List[dict]]) -> Dict[str, dict]:
+        nearest = {}
+        for d in sorted(slots):
+            for slot in slots[d]:
+                nearest.setdefault(slot["specialist_name"], slot)
+        return nearest
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Не удалось обновить снимок данных клиники:")
+            await asyncio.sleep(self.refresh_seconds)
+
+    def start(self):
+        if not self.calendar_url:
+            logger.warning("SERVICE_CALENDAR_URL не задан — данные клиники в подсказки не подставляются")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._http.aclose()
+
+    # ----------------------------
+    # Поиск фрагментов
+    # ----------------------------
+    def retrieve(self, question: str, k: int = 4) -> List[str]:
+        """Возвращает до k фрагментов, наиболее релевантных вопросу (по IDF совпавших слов)"""
+        if not self.snippets:
+            return []
+        total = len(self.snippets)
+        scores: Dict[int, float] = defaultdict(float)
+        for token in set(tokenize(question)):
+            postings = self._index.get(token)
+            if not postings:
+                continue
+            idf = math.log(1 + total / len(postings))
+            for i in postings:
+                scores[i] += idf
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [self.snippets[i].text for i, _ in best]
+
+    # ----------------------------
+    # Ответы о свободном времени без модели
+    # ----------------------------
+    def _requested_dates(self, question: str, today: date) -> List[date]:
+        text = question.lower()
+        dates = []
+        if "послезавтра" in text:
+            dates.append(today + timedelta(days=2))
+        elif "завтра" in text:
+            dates.append(today + timedelta(days=1))
+        if "сегодня" in text:
+            dates.append(today)
+
+        for word in _WORD_RE.findall(text):
+            weekday = WEEKDAY_STEMS.get(stem(word))
+            if weekday is not None:
+                dates.append(today + timedelta(days=(weekday - today.weekday()) % 7))
+
+        for day, month, year in _DATE_RE.findall(text):
+            try:
+                year_num = int(year) if year else today.year
+                if year_num < 100:
+                    year_num += 2000
+                requested = date(year_num, int(month), int(day))
+            except ValueError:
+                continue
+            if not year and requested < today:
+                requested = requested.replace(year=requested.year + 1)
+            dates.append(requested)
+        return sorted(set(dates))
+
+    def _matches_filter(self, slot: dict, question_tokens: Set[str]) -> bool:
+        slot_tokens = set(tokenize(f"{slot['specialist_name']} {slot['service_name']}"))
+        return bool(slot_tokens & question_tokens)
+
+    def answer_availability(self, question: str, per_day_limit: int = 8) -> Optional[str]:
+        """
+        Отвечает на вопрос о свободном времени по снимку. Возвращает None,
+        если это не вопрос о свободном времени или снимок его не покрывает.
+        """
+        if self.loaded_at is None:
+            return None
+        words = _WORD_RE.findall(question.lower())
+        today = datetime.now(MOSCOW_TZ).date()
+        dates = self._requested_dates(question, today)
+
+        asks_free = any(w.startswith(AVAILABILITY_PREFIXES) for w in words)
+        asks_booking = any(w.startswith(BOOKING_PREFIXES) for w in words)
+        if not (asks_free or (asks_booking and dates)):
+            return None
+
+        horizon = today + timedelta(days=self.days_ahead - 1)
+        if any(d < today or d > horizon for d in dates):
+            return None
+
+        # Фильтр по специалисту или направлению, если они упомянуты в вопросе
+        all_slots = [s for d in sorted(self.slots) for s in self.slots[d]]
+        filter_tokens = set(tokenize(" ".join(
+            w for w in words if not w.startswith(AVAILABILITY_PREFIXES + BOOKING_PREFIXES)
+        )))
+        filtered = any(self._matches_filter(s, filter_tokens) for s in all_slots)
+
+        def select(day: date) -> List[dict]:
+            day_slots = self.slots.get(day, [])
+            if filtered:
+                day_slots = [s for s in day_slots if self._matches_filter(s, filter_tokens)]
+            return day_slots
+
+        lines = []
+        if dates:
+            for day in dates:
+                day_slots = select(day)
+                title = f"{WEEKDAY_NAMES[day.weekday()].capitalize()}, {day.strftime('%d.%m.%Y')}"
+                if day_slots:
+                    lines.append(f"{title}:")
+                    lines.extend(self._format_slots(day_slots, per_day_limit))
+                else:
+                    lines.append(f"{title}: свободного времени нет.")
+        if not dates or all(not select(d) for d in dates):
+            nearest_days = [d for d in sorted(self.slots) if d >= today and select(d)][:2]
+            if not nearest_days:
+                return None
+            lines.append("Ближайшее свободное время:")
+            for day in nearest_days:
+                lines.append(f"{WEEKDAY_NAMES[day.weekday()].capitalize()}, {day.strftime('%d.%m.%Y')}:")
+                lines.extend(self._format_slots(select(day), per_day_limit))
+
+        lines.append("")
+        lines.append("Записаться можно онлайн на сайте app.denta-rell.ru.")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format_slots(day_slots: List[dict], limit: int) -> List[str]:
+        by_specialist = defaultdict(list)
+        for slot in day_slots:
+            by_specialist[(slot["specialist_name"], slot["service_name"])].append(slot["time_start"])
+        lines = []
+        for (spec_name, service_name), times in by_specialist.items():
+            shown = ", ".join(times[:limit])
+            more = f" и ещё {len(times) - limit}" if len(times) > limit else ""
+            lines.append(f"• {spec_name} ({service_name}): {shown}{more}")
+        return lines
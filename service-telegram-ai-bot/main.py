@@ -1,10 +1,11 @@
 import os
-import uuid
 import time
+import asyncio
 import logging
-import requests
-import httpx
+from typing import Optional
 from telegram import Update
+from telegram.constants import ChatAction
+from telegram.error import BadRequest, RetryAfter, TelegramError
 from telegram.ext import (
     ApplicationBuilder,
     CommandHandler,
@@ -12,6 +13,13 @@ from telegram.ext import (
     filters,
     ContextTypes
 )
+from telegram.request import HTTPXRequest
+from gigachat import GigaChatClient, GigaChatError, GigaChatAuthError, GigaChatResponseError
+from response_cache import ResponseCache
+from admission import AdmissionScheduler
+from knowledge import ClinicKnowledge
+from memory import ConversationMemory, clip
+from metrics import register_stats, start_loop_lag_monitor, start_metrics_server, track_outbound
 
 # ----------------------------
 # Настройка логгера
@@ -34,150 +42,301 @@ TELEGRAM_BOT_TOKEN_AI = os.getenv("TELEGRAM_BOT_TOKEN_AI")
 if not TELEGRAM_BOT_TOKEN_AI:
     logger.error("Переменная окружения TELEGRAM_BOT_TOKEN_AI не задана")
 
-# ----------------------------
-# Глобальные переменные для хранения access_token GigaChat
-# ----------------------------
-_current_token = None
-_token_expires_at = 0  # UNIX-метка, когда токен истекает
+# Общий клиент GigaChat: пул соединений и токен живут всё время работы бота
+gigachat = GigaChatClient(GIGACHAT_AUTH_KEY, GIGACHAT_SCOPE)
 
-def fetch_gigachat_access_token() -> str:
-    global _current_token, _token_expires_at
-
-    token_url = "https://ngw.devices.sberbank.ru:9443/api/v2/oauth"
-    rq_uuid = str(uuid.uuid4())
+# Кэш ответов на типовые вопросы (цены, часы работы, адрес, запись)
+response_cache = ResponseCache(
+    max_size=int(os.getenv("AI_CACHE_MAX_SIZE", "1000")),
+    ttl_seconds=float(os.getenv("AI_CACHE_TTL_SECONDS", "3600")),
+    embedder=gigachat.embed if os.getenv("AI_CACHE_SEMANTIC", "0") == "1" else None,
+    similarity_threshold=float(os.getenv("AI_CACHE_SIMILARITY", "0.92")),
+)
 
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded",
-        "Accept": "application/json",
-        "RqUID": rq_uuid,
-        "Authorization": f"Basic {GIGACHAT_AUTH_KEY}"
-    }
-    data = {"scope": GIGACHAT_SCOPE}
+# Снимок данных клиники из service-calendar для подсказок модели и ответов о свободном времени
+knowledge = ClinicKnowledge(
+    os.getenv("SERVICE_CALENDAR_URL"),
+    days_ahead=int(os.getenv("AI_KNOWLEDGE_DAYS", "14")),
+    refresh_seconds=float(os.getenv("AI_KNOWLEDGE_REFRESH_SECONDS", "300")),
+)
 
-    try:
-        resp = requests.post(token_url, headers=headers, data=data, timeout=10, verify=False)
-        resp.raise_for_status()
-    except Exception:
-        logger.exception("Не удалось получить access_token от GigaChat:")
-        return ""
-
-    resp_json = resp.json()
-    token = resp_json.get("access_token")
-    expires_at = resp_json.get("expires_at", 0)
-
-    if token:
-        _current_token = token
-        _token_expires_at = expires_at
-        logger.info("Получили новый GigaChat token, expires_at=%s", expires_at)
-        return token
-    else:
-        logger.error("Не удалось извлечь access_token из ответа GigaChat API")
-        return ""
+async def summarize_history(previous_summary: Optional[str], turns: list) -> str:
+    """Сворачивает вытесненные из окна реплики в краткую сводку"""
+    dialog = "\n".join(
+        f"{'Клиент' if turn['role'] == 'user' else 'Администратор'}: {turn['content']}" for turn in turns
+    )
+    if previous_summary:
+        dialog = f"Ранее: {previous_summary}\n{dialog}"
+    # Через планировщик: сводка занимает слот общего лимита обращений к GigaChat
+    return await scheduler.run_background(
+        gigachat.complete,
+        [
+            {
+                "role": "system",
+                "content": "Кратко, в одном-двух предложениях, перескажи суть диалога клиента "
+                           "с администратором стоматологической клиники: что клиент хотел и что ему ответили."
+            },
+            {"role": "user", "content": dialog}
+        ],
+        max_tokens=120
+    )
 
-def get_valid_token() -> str:
-    global _current_token, _token_expires_at
+# Память диалогов: ограниченное число чатов, окно реплик в пределах бюджета токенов
+memory = ConversationMemory(
+    max_chats=int(os.getenv("AI_MEMORY_MAX_CHATS", "20000")),
+    ttl_seconds=float(os.getenv("AI_MEMORY_TTL_SECONDS", "1800")),
+    token_budget=int(os.getenv("AI_MEMORY_TOKEN_BUDGET", "600")),
+    summarizer=summarize_history if os.getenv("AI_MEMORY_SUMMARIZE", "0") == "1" else None,
+)
+# Ограничение длины вопроса (в том числе склеенного из нескольких сообщений)
+MAX_QUESTION_TOKENS = int(os.getenv("AI_MAX_QUESTION_TOKENS", "300"))
 
-    now_ts = int(time.time())
-    if _current_token and now_ts + 30 < _token_expires_at:
-        return _current_token
+# Потоковый режим: ответ появляется по мере генерации и дописывается правками сообщения
+STREAMING_ENABLED = os.getenv("AI_STREAMING", "1") == "1"
+# Минимальный интервал между правками сообщения (ограничения Telegram на edit)
+STREAM_EDIT_INTERVAL = float(os.getenv("AI_STREAM_EDIT_INTERVAL", "1.0"))
+STREAM_PLACEHOLDER = "✍️ Печатаю ответ…"
+STREAM_CURSOR = " ▌"
 
-    return fetch_gigachat_access_token()
+# Chat ID администраторов, которым доступна команда /stats
+ADMIN_CHAT_IDS = {
+    int(chat_id) for chat_id in os.getenv("AI_BOT_ADMIN_CHAT_IDS", "").split(",") if chat_id.strip()
+}
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Здравствуйте! Я виртуальный администратор стоматологической клиники Denta Rell."
     )
 
-async def ai_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    user_text = update.message.text
-    token = get_valid_token()
-    if not token:
-        await update.message.reply_text("Сервис временно недоступен (не удалось получить токен).")
+SYSTEM_PROMPT = (
+    "Ты — виртуальный администратор стоматологической клиники Denta Rell (сайт: app.denta-rell.ru). "
+    "Отвечай только на вопросы, связанные с услугами, акциями, расписанием, специалистами и записью в клинику. "
+    "Запрещено отвечать на любые вопросы о себе, о своих технологиях, устройстве, происхождении, личности, компании Sber, GigaChat, Telegram или искусственном интеллекте. "
+    "Не упоминай слова 'я бот', 'я ИИ', 'я модель', 'я ассистент', 'GigaChat', 'искусственный интеллект' и всё подобное. "
+    "Если клиент задаёт вопрос не по теме стоматологии, услуг или записи — мягко перенаправь его, например: «Пожалуйста, уточните, чем мы можем помочь вам в рамках стоматологической клиники Denta Rell». "
+    "Твоя задача — помогать как администратор: кратко, профессионально, вежливо и только по теме. "
+    "В каждом подходящем случае предлагай записаться онлайн на сайте app.denta-rell.ru."
+)
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_chat.id not in ADMIN_CHAT_IDS:
         return
+    sections = [
+        ("Кэш ответов", response_cache.stats()),
+        ("Очередь запросов", scheduler.stats()),
+        ("Память диалогов", memory.stats()),
+    ]
+    text = "\n\n".join(
+        title + ":\n" + "\n".join(f"{name}: {value}" for name, value in stats.items())
+        for title, stats in sections
+    )
+    await update.message.reply_text(text)
+
+async def complete_reply(update: Update, messages: list) -> Optional[str]:
+    """Ответ целиком одним сообщением"""
+    try:
+        content = await gigachat.complete(messages, max_tokens=200)
+    except GigaChatAuthError:
+        await update.message.reply_text("Сервис временно недоступен (не удалось получить токен).")
+        return None
+    except GigaChatResponseError:
+        await update.message.reply_text("Не удалось получить ответ от GigaChat.")
+        return None
+    except GigaChatError:
+        await update.message.reply_text("Ошибка при обращении к GigaChat.")
+        return None
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {token}"
-    }
+    await update.message.reply_text(content)
+    return content
 
-    payload = {
-        "model": "GigaChat",
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "Ты — виртуальный администратор стоматологической клиники Denta Rell (сайт: app.denta-rell.ru). "
-                    "Отвечай только на вопросы, связанные с услугами, акциями, расписанием, специалистами и записью в клинику. "
-                    "Запрещено отвечать на любые вопросы о себе, о своих технологиях, устройстве, происхождении, личности, компании Sber, GigaChat, Telegram или искусственном интеллекте. "
-                    "Не упоминай слова 'я бот', 'я ИИ', 'я модель', 'я ассистент', 'GigaChat', 'искусственный интеллект' и всё подобное. "
-                    "Если клиент задаёт вопрос не по теме стоматологии, услуг или записи — мягко перенаправь его, например: «Пожалуйста, уточните, чем мы можем помочь вам в рамках стоматологической клиники Denta Rell». "
-                    "Твоя задача — помогать как администратор: кратко, профессионально, вежливо и только по теме. "
-                    "В каждом подходящем случае предлагай записаться онлайн на сайте app.denta-rell.ru."
-                )
-            },
-            {"role": "user", "content": user_text}
-        ],
-        "max_tokens": 200
-    }
+async def keep_typing(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показывает «печатает…», пока не придёт первый фрагмент ответа"""
+    while True:
+        try:
+            await context.bot.send_chat_action(chat_id=update.effective_chat.id, action=ChatAction.TYPING)
+        except Exception:
+            logger.debug("Не удалось отправить индикатор набора", exc_info=True)
+        # Индикатор в Telegram гаснет примерно через 5 секунд
+        await asyncio.sleep(4)
 
+async def edit_message(message, text: str, wait: bool = False) -> bool:
+    """Правка сообщения; при wait=True после ограничения Telegram ждёт и повторяет"""
     try:
-        async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-            resp = await client.post(
-                "https://gigachat.devices.sberbank.ru/api/v1/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            resp.raise_for_status()
-    except httpx.HTTPStatusError as http_err:
-        status = http_err.response.status_code
-        if status in (401, 403):
-            logger.info("Получен %s, пробуем обновить токен и повторить...", status)
-            token = fetch_gigachat_access_token()
-            if not token:
-                await update.message.reply_text("Не удалось обновить токен GigaChat.")
-                return
-            headers["Authorization"] = f"Bearer {token}"
-            try:
-                async with httpx.AsyncClient(verify=False, timeout=30.0) as client:
-                    resp = await client.post(
-                        "https://gigachat.devices.sberbank.ru/api/v1/chat/completions",
-                        headers=headers,
-                        json=payload
-                    )
-                    resp.raise_for_status()
-            except Exception:
-                logger.exception("Повторный запрос к GigaChat тоже упал:")
-                await update.message.reply_text("Ошибка при обращении к GigaChat.")
-                return
-        else:
-            logger.exception("HTTP ошибка при обращении к GigaChat:")
-            await update.message.reply_text("Ошибка при обращении к GigaChat.")
-            return
-    except Exception:
-        logger.exception("Ошибка при обращении к GigaChat:")
-        await update.message.reply_text("Ошибка при обращении к GigaChat.")
-        return
+        await message.edit_text(text)
+        return True
+    except RetryAfter as e:
+        delay = e.retry_after
+        delay = delay.total_seconds() if hasattr(delay, "total_seconds") else float(delay)
+        logger.info("Telegram ограничил правки сообщения, пауза %s с", delay)
+        if not wait:
+            return False
+        await asyncio.sleep(delay)
+        return await edit_message(message, text)
+    except BadRequest as e:
+        # Текст не изменился — не ошибка
+        if "not modified" in str(e).lower():
+            return True
+        logger.warning("Не удалось обновить сообщение: %s", e)
+        return False
 
+async def stream_reply(update: Update, context: ContextTypes.DEFAULT_TYPE, messages: list) -> Optional[str]:
+    """
+    Потоковый ответ: заглушка, затем правки сообщения по мере генерации.
+    Если заглушку отправить не удалось, ответ приходит целиком одним сообщением.
+    """
+    started = time.monotonic()
     try:
-        data = resp.json()
-        choices = data.get("choices") or []
-        if not choices or "message" not in choices[0]:
-            raise ValueError("Неправильный формат ответа GigaChat")
-        content = choices[0]["message"].get("content", "").strip()
-        if not content:
-            raise ValueError("Пустой результат от GigaChat")
-        await update.message.reply_text(content)
-    except Exception:
-        logger.exception("Не удалось разобрать ответ от GigaChat:")
-        await update.message.reply_text("Не удалось получить ответ от GigaChat.")
+        placeholder = await update.message.reply_text(STREAM_PLACEHOLDER)
+    except TelegramError as e:
+        logger.warning("Не удалось отправить заглушку потокового ответа: %s", e)
+        return await complete_reply(update, messages)
+    # Индикатор набора запускается только после заглушки: finally ниже гарантированно его остановит
+    typing_task = asyncio.create_task(keep_typing(update, context))
+
+    text = ""
+    shown = ""
+    last_edit = 0.0
+    first_token_at = None
+    try:
+        async for delta in gigachat.stream(messages, max_tokens=200):
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+                typing_task.cancel()
+                logger.info("GigaChat: время до первого фрагмента %.0f мс", (first_token_at - started) * 1000)
+            text += delta
+            now = time.monotonic()
+            if now - last_edit >= STREAM_EDIT_INTERVAL and text.strip() != shown:
+                last_edit = now
+                if await edit_message(placeholder, text.strip() + STREAM_CURSOR):
+                    shown = text.strip()
+    except GigaChatAuthError:
+        await edit_message(placeholder, "Сервис временно недоступен (не удалось получить токен).", wait=True)
+        return None
+    except GigaChatResponseError:
+        await edit_message(placeholder, "Не удалось получить ответ от GigaChat.", wait=True)
+        return None
+    except GigaChatError:
+        await edit_message(placeholder, "Ошибка при обращении к GigaChat.", wait=True)
+        return None
+    finally:
+        typing_task.cancel()
+
+    content = text.strip()
+    if not content:
+        await edit_message(placeholder, "Не удалось получить ответ от GigaChat.", wait=True)
+        return None
+
+    await edit_message(placeholder, content, wait=True)
+    logger.info("GigaChat: потоковый ответ получен за %.0f мс", (time.monotonic() - started) * 1000)
+    return content
+
+def build_system_prompt(snippets: list) -> str:
+    """Системный промпт с фрагментами актуальных данных клиники, относящимися к вопросу"""
+    if not snippets:
+        return SYSTEM_PROMPT
+    return SYSTEM_PROMPT + "\n\nАктуальные данные клиники:\n" + "\n".join(f"- {s}" for s in snippets)
+
+async def answer_question(update: Update, context: ContextTypes.DEFAULT_TYPE, user_text: str):
+    chat_id = update.effective_chat.id
+    user_text = clip(user_text, MAX_QUESTION_TOKENS)
+    # Кэш подходит только для первого вопроса: уточнения зависят от контекста диалога
+    first_turn = not memory.has_history(chat_id)
+
+    # Вопросы о свободном времени отвечаются прямо по снимку расписания
+    availability = knowledge.answer_availability(user_text)
+    if availability is not None:
+        await update.message.reply_text(availability)
+        memory.append(chat_id, user_text, availability)
+        return
+
+    # Ответ зависит от подставленных фрагментов снимка: кэш учитывает их версию,
+    # чтобы не выдавать ответ по устаревшему расписанию
+    snippets = knowledge.retrieve(user_text)
+    cache_context = "\n".join(snippets)
+
+    if first_turn:
+        cached = await response_cache.get(user_text, cache_context)
+        if cached is not None:
+            await update.message.reply_text(cached)
+            memory.append(chat_id, user_text, cached)
+            return
+
+    messages = [
+        {"role": "system", "content": build_system_prompt(snippets)},
+        *memory.messages(chat_id),
+        {"role": "user", "content": user_text}
+    ]
+
+    if STREAMING_ENABLED:
+        content = await stream_reply(update, context, messages)
+    else:
+        content = await complete_reply(update, messages)
+
+    if content:
+        if first_turn:
+            await response_cache.put(user_text, content, cache_context)
+        memory.append(chat_id, user_text, content)
+
+# Планировщик перед обращением к модели: общий лимит параллельности,
+# token bucket на чат, склейка подряд идущих сообщений и ограниченная очередь
+scheduler = AdmissionScheduler(
+    answer_question,
+    max_concurrency=int(os.getenv("AI_MAX_CONCURRENCY", "4")),
+    queue_size=int(os.getenv("AI_QUEUE_SIZE", "50")),
+    user_rate=float(os.getenv("AI_USER_RATE_PER_MIN", "12")) / 60,
+    user_burst=float(os.getenv("AI_USER_BURST", "3")),
+    coalesce_window=float(os.getenv("AI_COALESCE_WINDOW", "1.0")),
+    max_coalesce_wait=float(os.getenv("AI_COALESCE_MAX_WAIT", "3.0")),
+    max_merged_messages=int(os.getenv("AI_MAX_MERGED_MESSAGES", "5")),
+)
+
+async def ai_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await scheduler.submit(update, context)
+
+# Метрики Prometheus (бот работает через polling, поэтому /metrics отдаёт отдельный HTTP-сервер)
+METRICS_PORT = int(os.getenv("AI_METRICS_PORT", "10000"))
+register_stats("ai_response_cache", response_cache.stats)
+register_stats("ai_admission", scheduler.stats)
+register_stats("ai_memory", memory.stats)
+
+class TrackedRequest(HTTPXRequest):
+    """HTTP-клиент PTB с замером вызовов Telegram Bot API (кроме long polling getUpdates)"""
+
+    async def do_request(self, *args, **kwargs):
+        with track_outbound("telegram-api") as call:
+            code, payload = await super().do_request(*args, **kwargs)
+            call.status(code)
+        return code, payload
+
+async def on_startup(app):
+    await gigachat.start()
+    knowledge.start()
+    scheduler.start()
+    start_loop_lag_monitor()
+
+async def on_shutdown(app):
+    await memory.stop()
+    await scheduler.stop()
+    await knowledge.stop()
+    await gigachat.close()
 
 def main():
     if not TELEGRAM_BOT_TOKEN_AI:
         logger.error("Переменная окружения TELEGRAM_BOT_TOKEN_AI не задана")
         return
 
-    app = ApplicationBuilder().token(TELEGRAM_BOT_TOKEN_AI).build()
+    start_metrics_server(METRICS_PORT)
+
+    app = (
+        ApplicationBuilder()
+        .token(TELEGRAM_BOT_TOKEN_AI)
+        .request(TrackedRequest())
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+        .build()
+    )
     app.add_handler(CommandHandler("start", start_command))
+    app.add_handler(CommandHandler("stats", stats_command))
     app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, ai_handler))
 
     logger.info("Telegram AI Bot с GigaChat запущен (polling)...")
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, List, Optional, Set, Tuple
+
+logger = logging.getLogger("telegram-ai-bot")
+
+# summarizer(предыдущая сводка, вытесненные реплики) -> новая сводка
+Summarizer = Callable[[Optional[str], List[dict]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка числа токенов: для русского текста ~3 символа на токен"""
+    return len(text) // 3 + 1
+
+
+def clip(text: str, max_tokens: int) -> str:
+    """Обрезает текст так, чтобы он укладывался в max_tokens"""
+    max_chars = max_tokens * 3
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "…"
+
+
+class _ChatHistory:
+    __slots__ = ("turns", "tokens", "summary", "updated_at", "summarizing", "unsummarized")
+
+    def __init__(self):
+        # (role, content, tokens)
+        self.turns: Deque[Tuple[str, str, int]] = deque()
+        self.tokens = 0
+        self.summary: Optional[str] = None
+        self.updated_at = time.monotonic()
+        self.summarizing = False
+        # Вытесненные реплики, ещё не попавшие в сводку
+        self.unsummarized: List[dict] = []
+
+
+class ConversationMemory:
+    """
+    Память диалогов по чатам.
+
+    - не больше max_chats чатов (LRU), чат забывается через ttl_seconds без сообщений;
+    - история чата — скользящее окно реплик, урезаемое до token_budget;
+    - при заданном summarizer вытесненные реплики сворачиваются в краткую сводку
+      (не длиннее summary_tokens), которая идёт в начало истории. Реплики,
+      вытесненные, пока сводка чата уже готовится, копятся и попадают
+      в следующую.
+    """
+
+    def __init__(
+        self,
+        max_chats: int = 20000,
+        ttl_seconds: float = 1800,
+        token_budget: int = 600,
+        max_turn_tokens: int = 300,
+        summarizer: Optional[Summarizer] = None,
+        summary_tokens: int = 150,
+    ):
+        self.max_chats = max_chats
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self.max_turn_tokens = max_turn_tokens
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+        self._chats: "OrderedDict[int, _ChatHistory]" = OrderedDict()
+        # Ссылки на фоновые задачи сводок: задачу без ссылок может собрать сборщик мусора
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _get(self, chat_id: int) -> Optional[_ChatHistory]:
+        history = self._chats.get(chat_id)
+        if history is None:
+            return None
+        if time.monotonic() - history.updated_at > self.ttl_seconds:
+            del self._chats[chat_id]
+            return None
+        return history
+
+    def _expire_oldest(self):
+        """Удаляет просроченные чаты с головы LRU и лишние сверх max_chats"""
+        now = time.monotonic()
+        while self._chats:
+            chat_id, history = next(iter(self._chats.items()))
+            if len(self._chats) > self.max_chats or now - history.updated_at > self.ttl_seconds:
+                del self._chats[chat_id]
+            else:
+                break
+
+    def has_history(self, chat_id: int) -> bool:
+        return self._get(chat_id) is not None
+
+    def messages(self, chat_id: int) -> List[dict]:
+        """История чата в формате сообщений chat completions"""
+        history = self._get(chat_id)
+        if history is None:
+            return []
+        result = []
+        if history.summary:
+            result.append({"role": "system", "content": f"Краткое содержание предыдущего диалога: {history.summary}"})
+        result.extend({"role": role, "content": content} for role, content, _ in history.turns)
+        return result
+
+    def append(self, chat_id: int, user_text: str, answer: str):
+        history = self._get(chat_id)
+        if history is None:
+            history = _ChatHistory()
+            self._chats[chat_id] = history
+        self._chats.move_to_end(chat_id)
+        history.updated_at = time.monotonic()
+
+        for role, content in (("user", user_text), ("assistant", answer)):
+            content = clip(content, self.max_turn_tokens)
+            tokens = estimate_tokens(content)
+            history.turns.append((role, content, tokens))
+            history.tokens += tokens
+
+        while history.tokens > self.token_budget and len(history.turns) > 2:
+            role, content, tokens = history.turns.popleft()
+            history.tokens -= tokens
+            if self.summarizer is not None:
+                history.unsummarized.append({"role": role, "content": content})
+
+        self._start_summary(history)
+        self._expire_oldest()
+
+    def _start_summary(self, history: _ChatHistory):
+        if not history.unsummarized or history.summarizing:
+            return
+        evicted, history.unsummarized = history.unsummarized, []
+        history.summarizing = True
+        task = asyncio.get_running_loop().create_task(self._summarize(history, evicted))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, history: _ChatHistory, evicted: List[dict]):
+        try:
+            summary = await self.summarizer(history.summary, evicted)
+            if summary:
+                history.summary = clip(summary.strip(), self.summary_tokens)
+        except Exception:
+            # Без сводки диалог продолжается на скользящем окне
+            logger.warning("Не удалось свернуть историю диалога", exc_info=True)
+        finally:
+            history.summarizing = False
+        # Реплики, вытесненные за время этой сводки
+        self._start_summary(history)
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "chats": len(self._chats),
+            "max_chats": self.max_chats,
+            "tokens_total": sum(h.tokens for h in self._chats.values()),
+            "summaries_running": len(self._tasks),
+        }
@@ -0,0 +1,171 @@
+import hashlib
+import math
+import re
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Слова, которые не меняют смысл вопроса к администратору
+FILLER_WORDS = {
+    "здравствуйте", "здравствуй", "привет", "пожалуйста", "подскажите", "скажите",
+    "а", "ну", "вот", "спасибо",
+}
+
+_GREETING_RE = re.compile(r"\bдобр(ый|ое|ой) (день|утро|вечер|ночи)\b")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACES_RE = re.compile(r"\s+")
+
+Embedder = Callable[[str], Awaitable[List[float]]]
+
+
+def normalize_question(text: str) -> str:
+    """Приводит вопрос к каноническому виду: регистр, ё, пунктуация, слова-паразиты"""
+    text = text.lower().replace("ё", "е")
+    text = _PUNCTUATION_RE.sub(" ", text)
+    text = _GREETING_RE.sub(" ", text)
+    words = [w for w in _SPACES_RE.split(text) if w and w not in FILLER_WORDS]
+    return " ".join(words)
+
+
+def context_version(context: str) -> str:
+    """Короткий отпечаток данных, на которых построен ответ"""
+    return hashlib.sha1(context.encode("utf-8")).hexdigest()[:16] if context else ""
+
+
+def _unit(vector: List[float]) -> Tuple[float, ...]:
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return tuple(x / norm for x in vector)
+
+
+class ResponseCache:
+    """
+    Кэш ответов на типовые вопросы (LRU с TTL).
+
+    Сначала ищется точное совпадение нормализованного вопроса. Если задан
+    embedder, при промахе выполняется поиск ближайшего вопроса по косинусной
+    близости эмбеддингов в локальном индексе.
+
+    context — данные, подставленные в промпт (фрагменты снимка клиники).
+    Ответ, построенный на других данных, не выдаётся: когда меняется, например,
+    ближайшее свободное время, закэшированный ответ устаревает сразу, а не
+    через ttl_seconds.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl_seconds: float = 3600,
+        embedder: Optional[Embedder] = None,
+        similarity_threshold: float = 0.92,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.embedder = embedder
+        self.similarity_threshold = similarity_threshold
+
+        # {нормализованный вопрос: (ответ, время истечения, версия контекста)}
+        self._entries: "OrderedDict[str, Tuple[str, float, str]]" = OrderedDict()
+        # Локальный индекс эмбеддингов для закэшированных вопросов
+        self._vectors: Dict[str, Tuple[float, ...]] = {}
+        # Эмбеддинги, посчитанные при промахе, чтобы не запрашивать их повторно в put()
+        self._pending_vectors: "OrderedDict[str, Tuple[float, ...]]" = OrderedDict()
+
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+
+    def _drop(self, key: str):
+        self._entries.pop(key, None)
+        self._vectors.pop(key, None)
+
+    def _lookup_exact(self, key: str, now: float, version: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        answer, expires_at, entry_version = entry
+        if expires_at <= now:
+            self._drop(key)
+            self.expirations += 1
+            return None
+        if entry_version != version:
+            return None
+        self._entries.move_to_end(key)
+        return answer
+
+    async def _embed(self, key: str) -> Optional[Tuple[float, ...]]:
+        try:
+            return _unit(await self.embedder(key))
+        except Exception:
+            # Семантический поиск — оптимизация, его ошибки не должны ломать ответ
+            return None
+
+    async def get(self, question: str, context: str = "") -> Optional[str]:
+        key = normalize_question(question)
+        if not key:
+            return None
+        now = time.time()
+        version = context_version(context)
+
+        answer = self._lookup_exact(key, now, version)
+        if answer is not None:
+            self.hits_exact += 1
+            return answer
+        if key in self._entries:
+            # Тот же вопрос, но данные клиники с тех пор изменились
+            self._drop(key)
+            self.stale += 1
+
+        if self.embedder is not None and self._vectors:
+            vector = await self._embed(key)
+            if vector is not None:
+                self._pending_vectors[key] = vector
+                while len(self._pending_vectors) > 100:
+                    self._pending_vectors.popitem(last=False)
+
+                best_key, best_score = None, 0.0
+                for other_key, other_vector in self._vectors.items():
+                    score = sum(a * b for a, b in zip(vector, other_vector))
+                    if score > best_score:
+                        best_key, best_score = other_key, score
+                if best_key is not None and best_score >= self.similarity_threshold:
+                    answer = self._lookup_exact(best_key, now, version)
+                    if answer is not None:
+                        self.hits_semantic += 1
+                        return answer
+
+        self.misses += 1
+        return None
+
+    async def put(self, question: str, answer: str, context: str = ""):
+        key = normalize_question(question)
+        if not key or not answer:
+            return
+        self._entries[key] = (answer, time.time() + self.ttl_seconds, context_version(context))
+        self._entries.move_to_end(key)
+
+        if self.embedder is not None:
+            vector = self._pending_vectors.pop(key, None) or await self._embed(key)
+            if vector is not None and key in self._entries:
+                self._vectors[key] = vector
+
+        while len(self._entries) > self.max_size:
+            old_key, _ = self._entries.popitem(last=False)
+            self._vectors.pop(old_key, None)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits_exact + self.hits_semantic + self.misses
+        hits = self.hits_exact + self.hits_semantic
+        return {
+            "size": len(self._entries),
+            "hits_exact": self.hits_exact,
+            "hits_semantic": self.hits_semantic,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "stale": self.stale,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,70 @@
+"""
+Локальная заглушка GigaChat API: OAuth и /embeddings на http://127.0.0.1.
+Адреса подставляются через GIGACHAT_OAUTH_URL / GIGACHAT_API_URL до импорта
+gigachat.py, так что тесты идут через настоящий GigaChatClient.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+EMBEDDING_SIZE = 256
+
+
+def stub_embedding(text: str) -> list:
+    """Мешок слов в хэшированном пространстве: косинус = доля общих слов"""
+    vector = [0.0] * EMBEDDING_SIZE
+    for word in text.split():
+        vector[zlib.crc32(word.encode("utf-8")) % EMBEDDING_SIZE] += 1.0
+    return vector
+
+
+class GigaChatStub(BaseHTTPRequestHandler):
+    calls = {"oauth": 0, "embeddings": 0}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/oauth":
+            self.calls["oauth"] += 1
+            self._reply(200, {"access_token": "stub-token", "expires_at": int((time.time() + 1800) * 1000)})
+        elif self.path == "/api/v1/embeddings":
+            if self.headers.get("Authorization") != "Bearer stub-token":
+                self._reply(401, {"message": "Unauthorized"})
+                return
+            self.calls["embeddings"] += 1
+            texts = json.loads(body)["input"]
+            self._reply(200, {"data": [{"embedding": stub_embedding(text), "index": i} for i, text in enumerate(texts)]})
+        else:
+            self._reply(404, {"message": "Not found"})
+
+
+_server = ThreadingHTTPServer(("127.0.0.1", 0), GigaChatStub)
+threading.Thread(target=_server.serve_forever, daemon=True).start()
+os.environ["GIGACHAT_OAUTH_URL"] = f"http://127.0.0.1:{_server.server_port}/oauth"
+os.environ["GIGACHAT_API_URL"] = f"http://127.0.0.1:{_server.server_port}/api/v1"
+
+
+@pytest.fixture
+def gigachat_calls():
+    for key in GigaChatStub.calls:
+        GigaChatStub.calls[key] = 0
+    return GigaChatStub.calls
@@ -0,0 +1,101 @@
+import asyncio
+from types import SimpleNamespace
+
+from admission import AdmissionScheduler
+
+
+class FakeMessage:
+    def __init__(self, text: str, replies: list):
+        self.text = text
+        self._replies = replies
+
+    async def reply_text(self, text: str):
+        self._replies.append(text)
+
+
+def make_update(chat_id: int, text: str, replies: list):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), message=FakeMessage(text, replies))
+
+
+def run_scenario(scheduler_kwargs: dict, messages: list, gap: float, settle: float = 0.3):
+    """Отправляет сообщения одного чата с интервалом gap; возвращает (вопросы, ответы-отказы, scheduler)"""
+    handled, replies = [], []
+
+    async def handler(update, context, text):
+        handled.append((asyncio.get_running_loop().time(), text))
+
+    async def scenario():
+        scheduler = AdmissionScheduler(handler, **scheduler_kwargs)
+        scheduler.start()
+        started = asyncio.get_running_loop().time()
+        for text in messages:
+            await scheduler.submit(make_update(1, text, replies), None)
+            await asyncio.sleep(gap)
+        await asyncio.sleep(settle)
+        await scheduler.stop()
+        return scheduler, [(at - started, text) for at, text in handled]
+
+    scheduler, handled_rel = asyncio.run(scenario())
+    return handled_rel, replies, scheduler
+
+
+def test_coalesce_wait_is_capped_from_first_message():
+    # Сообщения каждые 0.05 с при окне 0.1 с без предела ждали бы бесконечно
+    handled, replies, _ = run_scenario(
+        dict(coalesce_window=0.1, max_coalesce_wait=0.2, user_rate=100, user_burst=100, max_merged_messages=100),
+        [f"m{i}" for i in range(10)], gap=0.05,
+    )
+    assert handled, "вопрос так и не ушёл в очередь"
+    assert handled[0][0] < 0.35
+    assert not replies
+
+
+def test_merged_messages_are_charged_to_bucket():
+    handled, replies, scheduler = run_scenario(
+        dict(coalesce_window=0.2, user_rate=0.001, user_burst=3),
+        ["a", "b", "c", "d", "e"], gap=0.01,
+    )
+    assert [text for _, text in handled] == ["a\nb\nc"]
+    assert len(replies) == 2
+    assert scheduler.stats()["rate_limited"] == 2
+
+
+def test_merged_texts_are_bounded_at_append():
+    handled, replies, scheduler = run_scenario(
+        dict(coalesce_window=0.2, user_rate=100, user_burst=100, max_merged_messages=3, max_merged_chars=10),
+        ["aaaa", "bbbb", "cccc", "d", "e"], gap=0.01,
+    )
+    # «cccc» не помещается по символам, «e» — по числу сообщений
+    assert [text for _, text in handled] == ["aaaa\nbbbb\nd"]
+    assert scheduler.stats()["coalesced"] == 2
+    assert len(replies) == 2
+
+
+def test_chat_requests_run_one_at_a_time():
+    running, max_running, handled, replies = [0], [0], [], []
+
+    async def handler(update, context, text):
+        running[0] += 1
+        max_running[0] = max(max_running[0], running[0])
+        await asyncio.sleep(0.1)
+        handled.append(text)
+        running[0] -= 1
+
+    async def scenario():
+        scheduler = AdmissionScheduler(
+            handler, max_concurrency=4, coalesce_window=0.01, user_rate=100, user_burst=100
+        )
+        scheduler.start()
+        await scheduler.submit(make_update(1, "a", replies), None)
+        await asyncio.sleep(0.05)
+        # Первый ответ ещё готовится: второй вопрос ждёт, а не уходит свободному обработчику
+        await scheduler.submit(make_update(1, "b", replies), None)
+        await asyncio.sleep(0.05)
+        await scheduler.submit(make_update(1, "c", replies), None)
+        await asyncio.sleep(0.4)
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+    assert max_running[0] == 1
+    assert handled == ["a", "b\nc"]
+    assert not replies
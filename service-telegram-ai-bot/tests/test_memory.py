@@ -0,0 +1,70 @@
+import asyncio
+import gc
+
+from admission import AdmissionScheduler
+from memory import ConversationMemory
+from test_admission import make_update
+
+
+def test_turns_evicted_during_summary_go_into_next_summary():
+    calls = []
+    release = None
+
+    async def summarizer(previous, turns):
+        calls.append((previous, [turn["content"] for turn in turns]))
+        if len(calls) == 1:
+            await release.wait()
+        return f"сводка {len(calls)}"
+
+    async def scenario():
+        nonlocal release
+        release = asyncio.Event()
+        memory = ConversationMemory(token_budget=10, max_turn_tokens=10, summarizer=summarizer)
+        memory.append(1, "q1" * 9, "a1" * 9)
+        memory.append(1, "q2" * 9, "a2" * 9)
+        await asyncio.sleep(0)
+        # Первая сводка ещё готовится: вытесненные сейчас реплики не теряются
+        memory.append(1, "q3" * 9, "a3" * 9)
+        memory.append(1, "q4" * 9, "a4" * 9)
+        gc.collect()
+        release.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        return memory
+
+    memory = asyncio.run(scenario())
+    assert calls == [
+        (None, ["q1" * 9, "a1" * 9]),
+        ("сводка 1", ["q2" * 9, "a2" * 9, "q3" * 9, "a3" * 9]),
+    ]
+    assert memory.messages(1)[0]["content"].endswith("сводка 2")
+    assert memory.stats()["summaries_running"] == 0
+
+
+def test_summaries_count_against_scheduler_concurrency():
+    running, max_running = [0], [0]
+
+    async def model_call(delay):
+        running[0] += 1
+        max_running[0] = max(max_running[0], running[0])
+        await asyncio.sleep(delay)
+        running[0] -= 1
+
+    async def handler(update, context, text):
+        await model_call(0.05)
+
+    async def scenario():
+        scheduler = AdmissionScheduler(handler, max_concurrency=2, coalesce_window=0, user_rate=100, user_burst=100)
+        scheduler.start()
+        background = [asyncio.create_task(scheduler.run_background(model_call, 0.05)) for _ in range(2)]
+        for chat_id in range(3):
+            await scheduler.submit(make_update(chat_id, "вопрос", []), None)
+        await asyncio.gather(*background)
+        await asyncio.sleep(0.3)
+        await scheduler.stop()
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert max_running[0] == 2
+    assert scheduler.stats()["completed"] == 3
+    assert scheduler.stats()["background"] == 2
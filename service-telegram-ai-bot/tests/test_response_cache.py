@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+import response_cache
+from gigachat import GigaChatClient
+from response_cache import ResponseCache, normalize_question
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("Сколько стоит чистка зубов?", "сколько стоит чистка зубов"),
+    ("Здравствуйте! Подскажите, пожалуйста, сколько стоит чистка зубов??", "сколько стоит чистка зубов"),
+    ("Добрый день, где вы находитесь", "где вы находитесь"),
+    ("Ёлки, а ВЫ работаете в субботу?", "елки вы работаете в субботу"),
+    ("Спасибо!", ""),
+])
+def test_normalize_question(question, expected):
+    assert normalize_question(question) == expected
+
+
+def test_exact_hit_ignores_greeting_and_punctuation():
+    cache = ResponseCache()
+
+    async def scenario():
+        await cache.put("Сколько стоит чистка зубов?", "3000 ₽")
+        return await cache.get("Здравствуйте, подскажите, сколько стоит чистка зубов")
+
+    assert run(scenario()) == "3000 ₽"
+    assert cache.stats()["hits_exact"] == 1
+
+
+def test_ttl_expiration(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache.time, "time", lambda: now[0])
+    cache = ResponseCache(ttl_seconds=60)
+
+    async def scenario():
+        await cache.put("Где вы находитесь?", "ул. Тестовая, 1")
+        now[0] += 59
+        first = await cache.get("где вы находитесь")
+        now[0] += 2
+        second = await cache.get("где вы находитесь")
+        return first, second
+
+    assert run(scenario()) == ("ул. Тестовая, 1", None)
+    stats = cache.stats()
+    assert stats["expirations"] == 1
+    assert stats["size"] == 0
+
+
+def test_lru_eviction_keeps_recently_used():
+    cache = ResponseCache(max_size=2)
+
+    async def scenario():
+        await cache.put("вопрос один", "1")
+        await cache.put("вопрос два", "2")
+        await cache.get("вопрос один")  # «один» становится самым свежим
+        await cache.put("вопрос три", "3")
+        return [await cache.get(q) for q in ("вопрос один", "вопрос два", "вопрос три")]
+
+    assert run(scenario()) == ["1", None, "3"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["size"] == 2
+
+
+def test_hit_rate_stats():
+    cache = ResponseCache()
+
+    async def scenario():
+        await cache.put("часы работы", "9–21")
+        for _ in range(3):
+            await cache.get("Часы работы?")
+        await cache.get("есть ли парковка")
+
+    run(scenario())
+    stats = cache.stats()
+    assert (stats["hits_exact"], stats["hits_semantic"], stats["misses"]) == (3, 0, 1)
+    assert stats["hit_rate"] == 0.75
+
+
+def test_changed_context_is_not_served():
+    cache = ResponseCache()
+
+    async def scenario():
+        await cache.put("когда ближайшая запись", "Завтра в 10:00", context="Ближайшее время: завтра 10:00")
+        same = await cache.get("когда ближайшая запись", context="Ближайшее время: завтра 10:00")
+        changed = await cache.get("когда ближайшая запись", context="Ближайшее время: завтра 12:00")
+        return same, changed
+
+    assert run(scenario()) == ("Завтра в 10:00", None)
+    assert cache.stats()["stale"] == 1
+    assert cache.stats()["size"] == 0
+
+
+def test_semantic_match_through_gigachat_stub(gigachat_calls):
+    async def scenario():
+        client = GigaChatClient("stub-key", "GIGACHAT_API_PERS")
+        try:
+            cache = ResponseCache(embedder=client.embed, similarity_threshold=0.8)
+            await cache.put("Сколько стоит чистка зубов?", "3000 ₽")
+            similar = await cache.get("сколько стоит чистка зубов у вас")
+            unrelated = await cache.get("где вы находитесь")
+            return cache, similar, unrelated
+        finally:
+            await client.close()
+
+    cache, similar, unrelated = run(scenario())
+    assert similar == "3000 ₽"
+    assert unrelated is None
+    stats = cache.stats()
+    assert (stats["hits_semantic"], stats["misses"]) == (1, 1)
+    # Один токен на все вызовы; эмбеддинг на put и на каждый промах точного поиска
+    assert gigachat_calls == {"oauth": 1, "embeddings": 3}
+
+
+def test_semantic_miss_embedding_is_reused_by_put(gigachat_calls):
+    async def scenario():
+        client = GigaChatClient("stub-key", "GIGACHAT_API_PERS")
+        try:
+            cache = ResponseCache(embedder=client.embed)
+            await cache.put("часы работы", "9–21")
+            assert await cache.get("есть ли парковка") is None
+            await cache.put("есть ли парковка", "Да")
+            return cache
+        finally:
+            await client.close()
+
+    cache = run(scenario())
+    assert gigachat_calls["embeddings"] == 2
+    assert cache.stats()["size"] == 2
+
+
+def test_semantic_match_respects_context(gigachat_calls):
+    async def scenario():
+        client = GigaChatClient("stub-key", "GIGACHAT_API_PERS")
+        try:
+            cache = ResponseCache(embedder=client.embed, similarity_threshold=0.8)
+            await cache.put("когда свободно у стоматолога", "Завтра в 10:00", context="v1")
+            return await cache.get("когда свободно у стоматолога завтра", context="v2")
+        finally:
+            await client.close()
+
+    assert run(scenario()) is None
+
+
+def test_embedder_failure_falls_back_to_miss():
+    async def failing_embedder(text):
+        raise RuntimeError("GigaChat недоступен")
+
+    cache = ResponseCache(embedder=failing_embedder)
+
+    async def scenario():
+        await cache.put("часы работы", "9–21")
+        return await cache.get("во сколько открываетесь"), await cache.get("часы работы")
+
+    assert run(scenario()) == (None, "9–21")
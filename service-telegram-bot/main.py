@@ -1,5 +1,6 @@
 import os
 import json
+import logging
 from dotenv import load_dotenv
 from telegram import Bot
 from fastapi import FastAPI, HTTPException, Request
@@ -9,9 +10,12 @@ from multiprocessing import Process, Manager
 from typing import Dict
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
+from metrics import instrument_app, track_outbound
+from tracing import install_tracing, start_span
 
 # Загрузка переменных окружения
 load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
 app = FastAPI()
 app.add_middleware(
@@ -20,6 +24,9 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument_app(app)
+# Трассировка: продолжает трассу календаря из заголовка traceparent
+install_tracing(app, "telegram-bot")
 
 BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN_INFO")
 bot = Bot(token=BOT_TOKEN)
@@ -52,6 +59,41 @@ def run_bot():
     updater.start_polling()
     updater.idle()
 
+REQUIRED_FIELDS = {
+    'client_name', 
+    'phone', 
+    'appointment_date',
+    'appointment_time',
+    'service_name',
+    'specialist_name'
+}
+
+def format_appointment_datetime(data: dict) -> str:
+    """Форматирует дату и время записи для сообщения"""
+    appointment_datetime = f"{data['appointment_date']} {data['appointment_time']}"
+    try:
+        dt = datetime.strptime(appointment_datetime, "%Y-%m-%d %H:%M")
+        return dt.strftime("%d.%m.%Y в %H:%M")
+    except ValueError:
+        return appointment_datetime
+
+def broadcast(message: str) -> int:
+    """Рассылает сообщение всем подписчикам, возвращает число успешных отправок"""
+    success_count = 0
+    for chat_id, user_data in users_db.items():
+        try:
+            with start_span("telegram.send_message"), track_outbound("telegram-api"):
+                bot.send_message(
+                    chat_id=chat_id,
+                    text=message,
+                    parse_mode="Markdown"
+                )
+            success_count += 1
+            print(f"Sent to {chat_id} ({user_data['username']})")
+        except Exception as e:
+            print(f"Ошибка отправки для chat_id {chat_id}: {str(e)}")
+    return success_count
+
 @app.post("/send-appointment")
 async def send_notification(request: Request):
     try:
@@ -62,17 +104,8 @@ async def send_notification(request: Request):
             raise HTTPException(status_code=400, detail="Invalid JSON format")
         
         # Проверяем наличие всех необходимых полей
-        required_fields = {
-            'client_name', 
-            'phone', 
-            'appointment_date',
-            'appointment_time',
-            'service_name',
-            'specialist_name'
-        }
-        
-        if not required_fields.issubset(data.keys()):
-            missing = required_fields - set(data.keys())
+        if not REQUIRED_FIELDS.issubset(data.keys()):
+            missing = REQUIRED_FIELDS - set(data.keys())
             raise HTTPException(
                 status_code=400,
                 detail=f"Missing required fields: {', '.join(missing)}"
@@ -85,41 +118,84 @@ async def send_notification(request: Request):
                 status_code=200
             )
         
-        success_count = 0
-        for chat_id, user_data in users_db.items():
-            try:
-                # Форматируем дату и время
-                appointment_datetime = f"{data['appointment_date']} {data['appointment_time']}"
-                try:
-                    dt = datetime.strptime(appointment_datetime, "%Y-%m-%d %H:%M")
-                    formatted_datetime = dt.strftime("%d.%m.%Y в %H:%M")
-                except ValueError:
-                    formatted_datetime = appointment_datetime
-                
-                # Формируем информативное сообщение
-                message = (
-                    "📅 *Новая запись в клинике*\n\n"
-                    f"👤 *Клиент:* {data['client_name']}\n"
-                    f"📞 *Телефон:* {data['phone']}\n"
-                    f"⏰ *Дата и время:* {formatted_datetime}\n"
-                    f"🏥 *Услуга:* {data['service_name']}\n"
-                    f"👨‍⚕️ *Специалист:* {data['specialist_name']}\n\n"
-                    "_Уведомление создано автоматически_"
-                )
-                
-                bot.send_message(
-                    chat_id=chat_id,
-                    text=message,
-                    parse_mode="Markdown"
-                )
-                success_count += 1
-                print(f"Sent to {chat_id} ({user_data['username']})")
-            except Exception as e:
-                print(f"Ошибка отправки для chat_id {chat_id}: {str(e)}")
+        # Формируем информативное сообщение
+        message = (
+            "📅 *Новая запись в клинике*\n\n"
+            f"👤 *Клиент:* {data['client_name']}\n"
+            f"📞 *Телефон:* {data['phone']}\n"
+            f"⏰ *Дата и время:* {format_appointment_datetime(data)}\n"
+            f"🏥 *Услуга:* {data['service_name']}\n"
+            f"👨‍⚕️ *Специалист:* {data['specialist_name']}\n\n"
+            "_Уведомление создано автоматически_"
+        )
+        with start_span("telegram.broadcast", subscribers=len(users_db)):
+            success_count = broadcast(message)
+        
+        return JSONResponse(
+            content={
+                "status": "success",
+                "notifications_sent": success_count,
+                "total_subscribers": len(users_db)
+            },
+            status_code=200
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@app.post("/send-appointment-digest")
+async def send_notification_digest(request: Request):
+    """Сводное уведомление о нескольких записях (к одному или нескольким специалистам)"""
+    try:
+        body = await request.body()
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid JSON format")
+        
+        bookings = data.get('bookings')
+        if not isinstance(bookings, list) or not bookings:
+            raise HTTPException(status_code=400, detail="Field 'bookings' must be a non-empty list")
+        for item in bookings:
+            if not isinstance(item, dict) or not REQUIRED_FIELDS.issubset(item.keys()):
+                raise HTTPException(status_code=400, detail="Each booking must contain all required fields")
+        
+        if not users_db:
+            print("No subscribers in users_db:", dict(users_db))
+            return JSONResponse(
+                content={"status": "No active subscribers"},
+                status_code=200
+            )
+        
+        # Сводка за окно содержит записи ко всем специалистам: группируем по specialist_name
+        by_specialist: Dict[str, list] = {}
+        for item in bookings:
+            by_specialist.setdefault(item['specialist_name'], []).append(item)
+        sections = []
+        for specialist_name, items in by_specialist.items():
+            lines = [
+                f"{i}. ⏰ {format_appointment_datetime(item)} — {item['client_name']} "
+                f"({item['phone']}), {item['service_name']}"
+                for i, item in enumerate(items, start=1)
+            ]
+            sections.append(f"👨‍⚕️ *Специалист:* {specialist_name}\n" + "\n".join(lines))
+        message = (
+            f"📅 *Новые записи в клинике: {len(bookings)}*\n\n"
+            + "\n\n".join(sections)
+            + "\n\n_Сводка создана автоматически_"
+        )
+        with start_span("telegram.broadcast", subscribers=len(users_db), bookings=len(bookings)):
+            success_count = broadcast(message)
         
         return JSONResponse(
             content={
                 "status": "success",
+                "bookings": len(bookings),
                 "notifications_sent": success_count,
                 "total_subscribers": len(users_db)
             },
@@ -5,6 +5,8 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import OperationalError
 from dotenv import load_dotenv
 from telegram_client import TelegramBot
+from metrics import instrument_app, register_db_pool, track_outbound
+from profiling import install_profiling
 import asyncio
 import logging
 import random
@@ -23,6 +25,7 @@ DATABASE_URL = f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@
 logger.info(f"Подключение к базе данных по URL: {DATABASE_URL}")
 engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+register_db_pool(engine, "api")
 
 # Настройка CORS
 app.add_middleware(
@@ -31,9 +34,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+instrument_app(app)
+install_profiling(app)
 
 # Инициализация бота
 bot = TelegramBot()
+register_db_pool(bot.db_engine, "bot")
 
 @app.on_event("startup")
 async def startup():
@@ -120,13 +126,14 @@ async def send_code_to_user(phone_number: str):
             code=code
         )
         
-        await bot.bot.send_message(
-            chat_id=user.chat_id,
-            text=f"🔐 Ваш код подтверждения: <b>{code}</b>\n\n"
-                 "Используйте этот код для входа в систему.\n"
-                 "⚠️ Никому не сообщайте этот код!",
-            parse_mode="HTML"
-        )
+        with track_outbound("telegram-api"):
+            await bot.bot.send_message(
+                chat_id=user.chat_id,
+                text=f"🔐 Ваш код подтверждения: <b>{code}</b>\n\n"
+                     "Используйте этот код для входа в систему.\n"
+                     "⚠️ Никому не сообщайте этот код!",
+                parse_mode="HTML"
+            )
         
         return {
             "status": "success",
@@ -188,13 +195,14 @@ async def send_code_to_client(phone_number: str):
             code=code
         )
         
-        await bot.bot.send_message(
-            chat_id=client.chat_id,
-            text=f"🔐 Ваш код подтверждения: <b>{code}</b>\n\n"
-                 "Используйте этот код для входа в систему.\n"
-                 "⚠️ Никому не сообщайте этот код!",
-            parse_mode="HTML"
-        )
+        with track_outbound("telegram-api"):
+            await bot.bot.send_message(
+                chat_id=client.chat_id,
+                text=f"🔐 Ваш код подтверждения: <b>{code}</b>\n\n"
+                     "Используйте этот код для входа в систему.\n"
+                     "⚠️ Никому не сообщайте этот код!",
+                parse_mode="HTML"
+            )
         
         return {
             "status": "success",
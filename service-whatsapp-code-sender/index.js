@@ -6,6 +6,7 @@ const { Client, LocalAuth } = require("whatsapp-web.js");
 const qrcode = require("qrcode-terminal");
 const { Pool } = require("pg");
 const path = require("path");
+const crypto = require("crypto");
 const cors = require("cors");
 const schedule = require("node-schedule");
 const moment = require("moment-timezone");
@@ -13,6 +14,30 @@ const app = express();
 app.use(express.json());
 app.use(cors());
 
+// Трассировка W3C Trace Context: продолжаем трассу из заголовка traceparent
+// (или начинаем новую) и пишем строку лога с trace_id каждого запроса
+const TRACEPARENT_RE = /^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$/;
+
+app.use((req, res, next) => {
+  const match = TRACEPARENT_RE.exec((req.headers.traceparent || "").trim().toLowerCase());
+  const traceId = match ? match[1] : crypto.randomBytes(16).toString("hex");
+  const parentId = match ? match[2] : null;
+  const flags = match ? match[3] : "01";
+  const spanId = crypto.randomBytes(8).toString("hex");
+  const started = process.hrtime.bigint();
+
+  req.traceId = traceId;
+  res.setHeader("traceparent", `00-${traceId}-${spanId}-${flags}`);
+  res.on("finish", () => {
+    const ms = Number(process.hrtime.bigint() - started) / 1e6;
+    console.log(
+      `trace=${traceId} span=${spanId} parent=${parentId || "-"} ` +
+        `${req.method} ${req.originalUrl} -> ${res.statusCode} ${ms.toFixed(1)} мс`
+    );
+  });
+  next();
+});
+
 // Настройка подключения к PostgreSQL
 const pool = new Pool({
   user: process.env.DB_USER,
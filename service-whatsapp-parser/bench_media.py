@@ -0,0 +1,86 @@
+# service-whatsapp-parser/bench_media.py
+"""
+Замер подготовки изображений для историй.
+
+    python bench_media.py [картинки...] [--repeat N]
+
+Без аргументов берёт story.JPEG и несколько синтетических картинок
+(большое фото, PNG с прозрачностью). Для каждой показывает размер до/после,
+время первой обработки (промах кэша) и повторной (попадание в кэш).
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+from PIL import Image
+
+from media import MediaCache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_samples(directory: str) -> List[str]:
+    samples = []
+    story = os.path.join(HERE, "story.JPEG")
+    if os.path.exists(story):
+        samples.append(story)
+
+    # Фото с современного телефона: 4032x3024 с шумом, чтобы JPEG не сжимался идеально
+    photo = Image.effect_noise((4032, 3024), 64).convert("RGB")
+    photo_path = os.path.join(directory, "photo-4032x3024.jpg")
+    photo.save(photo_path, "JPEG", quality=95)
+    samples.append(photo_path)
+
+    # Баннер из редактора: PNG с альфа-каналом
+    banner = Image.new("RGBA", (1440, 2560), (30, 120, 200, 0))
+    banner.paste(Image.effect_noise((1440, 1280), 40).convert("RGBA"), (0, 640))
+    banner_path = os.path.join(directory, "banner-1440x2560.png")
+    banner.save(banner_path, "PNG")
+    samples.append(banner_path)
+    return samples
+
+
+def bench(paths: List[str], repeat: int):
+    print(f"{'файл':<28} {'исходник':>10} {'результат':>10} {'размеры':>20} {'промах, мс':>11} {'кэш, мс':>8}")
+    for path in paths:
+        misses, hits = [], []
+        for _ in range(repeat):
+            # Новый каталог на каждый прогон — честный промах кэша
+            with tempfile.TemporaryDirectory() as cache_dir:
+                cache = MediaCache(cache_dir)
+                started = time.perf_counter()
+                output = cache.prepare(path)
+                misses.append(time.perf_counter() - started)
+
+                started = time.perf_counter()
+                cache.prepare(path)
+                hits.append(time.perf_counter() - started)
+
+                with Image.open(path) as src, Image.open(output) as dst:
+                    sizes = f"{src.width}x{src.height}->{dst.width}x{dst.height}"
+                output_size = os.path.getsize(output)
+
+        print(
+            f"{os.path.basename(path)[:28]:<28} "
+            f"{os.path.getsize(path) / 1024:>8.0f}КБ {output_size / 1024:>8.0f}КБ {sizes:>20} "
+            f"{statistics.median(misses) * 1000:>11.1f} {statistics.median(hits) * 1000:>8.2f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as samples_dir:
+        paths = args.images or make_samples(samples_dir)
+        bench(paths, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# service-whatsapp-parser/driver_manager.py
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Optional, TypeVar
+
+import psutil
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+
+logger = logging.getLogger("whatsapp-parser")
+
+# Пути к установленным через apt
+CHROMEDRIVER_PATH = "/usr/bin/chromedriver"
+CHROME_BINARY_PATH = "/usr/bin/chromium"
+WHATSAPP_URL = "https://web.whatsapp.com/"
+
+T = TypeVar("T")
+
+
+def build_chrome_options(profile_path: str) -> webdriver.ChromeOptions:
+    options = webdriver.ChromeOptions()
+    options.binary_location = CHROME_BINARY_PATH
+    options.add_argument("--headless=new")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+    options.add_argument("--window-size=1280,800")
+    options.add_argument(f"--user-data-dir={profile_path}")
+    return options
+
+
+class DriverManager:
+    """
+    Долгоживущий Chromium с открытым WhatsApp Web.
+
+    Все операции с браузером выполняются по очереди в одном рабочем потоке:
+    профиль Chrome нельзя открыть дважды, а WhatsApp Web не терпит параллельных
+    действий. Браузер перезапускается после max_operations операций, при росте
+    памяти выше max_memory_mb и если проверка здоровья не прошла. Проверки
+    состояния (count=False) в max_operations не входят: иначе частый опрос
+    сессии перезапускал бы браузер посреди сканирования QR-кода.
+    """
+
+    def __init__(
+        self,
+        profile_path: str,
+        max_operations: int = 50,
+        max_memory_mb: float = 1500,
+        health_interval: float = 60,
+    ):
+        self.profile_path = profile_path
+        self.max_operations = max_operations
+        self.max_memory_mb = max_memory_mb
+        self.health_interval = health_interval
+
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._driver: Optional[webdriver.Chrome] = None
+        self._operations = 0
+        self._dirty = False
+
+        self.launches = 0
+        self.recycles = 0
+
+    # ----------------------------
+    # Жизненный цикл
+    # ----------------------------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="whatsapp-driver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout=30)
+        self._thread = None
+
+    # ----------------------------
+    # Публичный API
+    # ----------------------------
+    def submit(self, operation: Callable[[webdriver.Chrome], T], count: bool = True) -> "Future[T]":
+        """
+        Ставит операцию в очередь; operation получает готовый драйвер.
+        count=False — проверка состояния, не приближающая перезапуск по max_operations.
+        """
+        self.start()
+        future: "Future[T]" = Future()
+        self._queue.put((operation, future, count))
+        return future
+
+    def run(
+        self, operation: Callable[[webdriver.Chrome], T], timeout: Optional[float] = None, count: bool = True
+    ) -> T:
+        return self.submit(operation, count=count).result(timeout=timeout)
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        return {
+            "running": self._driver is not None,
+            "operations_since_launch": self._operations,
+            "launches": self.launches,
+            "recycles": self.recycles,
+            "pending": self.pending,
+        }
+
+    # ----------------------------
+    # Рабочий поток
+    # ----------------------------
+    def _run(self):
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.health_interval)
+                except queue.Empty:
+                    # Простой: проверяем, что сессия жива, чтобы следующая операция не ждала запуска
+                    if self._driver is not None and not self._healthy():
+                        self._quit("проверка здоровья не прошла")
+                    continue
+                if item is None:
+                    return
+
+                operation, future, count = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    driver = self._ensure_driver()
+                    result = operation(driver)
+                except BaseException as e:
+                    # Страница могла остаться в неизвестном состоянии — перезагрузим перед следующей операцией
+                    self._dirty = True
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                finally:
+                    if count:
+                        self._operations += 1
+                    self._maybe_recycle()
+        finally:
+            self._quit("остановка сервиса")
+
+    def _launch(self) -> webdriver.Chrome:
+        logger.info("Запуск ChromeDriver с профилем %s...", self.profile_path)
+        service = ChromeService(executable_path=CHROMEDRIVER_PATH)
+        driver = webdriver.Chrome(service=service, options=build_chrome_options(self.profile_path))
+        driver.get(WHATSAPP_URL)
+        self.launches += 1
+        self._operations = 0
+        self._dirty = False
+        return driver
+
+    def _ensure_driver(self) -> webdriver.Chrome:
+        if self._driver is not None and not self._healthy():
+            self._quit("проверка здоровья не прошла")
+        if self._driver is None:
+            self._driver = self._launch()
+        elif self._dirty:
+            logger.info("Перезагружаем WhatsApp Web после ошибки операции")
+            self._driver.get(WHATSAPP_URL)
+            self._dirty = False
+        return self._driver
+
+    def _healthy(self) -> bool:
+        try:
+            ready = self._driver.execute_script("return document.readyState")
+            return ready == "complete" and self._driver.current_url.startswith(WHATSAPP_URL)
+        except Exception:
+            return False
+
+    def _memory_mb(self) -> float:
+        """Суммарный RSS chromedriver и всех процессов Chromium"""
+        try:
+            root = psutil.Process(self._driver.service.process.pid)
+            processes = [root] + root.children(recursive=True)
+            return sum(p.memory_info().rss for p in processes if p.is_running()) / (1024 * 1024)
+        except Exception:
+            return 0.0
+
+    def _maybe_recycle(self):
+        if self._driver is None:
+            return
+        if self._operations >= self.max_operations:
+            self.recycles += 1
+            self._quit(f"выполнено {self._operations} операций")
+            return
+        memory_mb = self._memory_mb()
+        if memory_mb > self.max_memory_mb:
+            self.recycles += 1
+            self._quit(f"память браузера {memory_mb:.0f} МБ")
+
+    def _quit(self, reason: str):
+        if self._driver is None:
+            return
+        logger.info("Перезапуск/остановка ChromeDriver: %s", reason)
+        try:
+            self._driver.quit()
+        except Exception as e:
+            logger.warning("Ошибка при закрытии ChromeDriver: %s", e)
+        self._driver = None
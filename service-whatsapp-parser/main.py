@@ -1,9 +1,19 @@
 # service-whatsapp-parser/main.py
 
 import os
+import uuid
+import shutil
 import logging
-from fastapi import FastAPI
-from whatsapp_parser import capture_and_save_qr
+from datetime import datetime
+from typing import Optional
+from zoneinfo import ZoneInfo
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.responses import FileResponse, JSONResponse
+from whatsapp_parser import get_driver_manager
+from session import WhatsAppSession, SessionState
+from story_jobs import StoryJobStore, StoryScheduler
+from media import MediaCache, MediaError
+from metrics import instrument_app, register_stats
 
 logging.basicConfig(
     level=logging.INFO,
@@ -13,16 +23,141 @@ logging.basicConfig(
 logger = logging.getLogger("whatsapp-parser")
 
 app = FastAPI(title="WhatsApp Parser Service")
+instrument_app(app)
+
+PROFILE_PATH = os.path.abspath("./chrome-data")
+os.makedirs(PROFILE_PATH, exist_ok=True)
+
+browser = get_driver_manager(PROFILE_PATH)
+session = WhatsAppSession(browser, PROFILE_PATH)
+
+# Очередь историй хранится на диске, чтобы переживать перезапуск сервиса
+STORIES_PATH = os.path.abspath(os.getenv("WHATSAPP_STORIES_DIR", "./stories-data"))
+UPLOADS_PATH = os.path.join(STORIES_PATH, "uploads")
+os.makedirs(UPLOADS_PATH, exist_ok=True)
+ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+
+story_store = StoryJobStore(os.path.join(STORIES_PATH, "jobs.sqlite3"))
+
+# Загруженные картинки пережимаются под размер статуса и кэшируются по хэшу содержимого;
+# файлы историй, ещё ждущих публикации, из кэша не вытесняются
+media_cache = MediaCache(
+    os.path.join(STORIES_PATH, "media"),
+    quality=int(os.getenv("STORY_JPEG_QUALITY", "85")),
+    max_bytes=int(float(os.getenv("STORY_MEDIA_CACHE_MB", "500")) * 1024 * 1024),
+    max_age_seconds=float(os.getenv("STORY_MEDIA_CACHE_DAYS", "30")) * 24 * 3600,
+    pinned=story_store.active_image_paths,
+)
+
+register_stats("whatsapp_browser", browser.stats)
+register_stats("whatsapp_session", lambda: {"ready": session.ready})
+register_stats("story_media_cache", media_cache.stats)
+
+story_scheduler = StoryScheduler(
+    story_store,
+    browser,
+    session,
+    poll_interval=float(os.getenv("STORY_POLL_INTERVAL", "10")),
+    batch_size=int(os.getenv("STORY_BATCH_SIZE", "10")),
+    max_attempts=int(os.getenv("STORY_MAX_ATTEMPTS", "5")),
+    backoff_base=float(os.getenv("STORY_BACKOFF_SECONDS", "60")),
+)
 
 @app.on_event("startup")
 def ensure_whatsapp_login():
-    profile_path = os.path.abspath("./chrome-data")
-    os.makedirs(profile_path, exist_ok=True)
+    # Вход в WhatsApp Web идёт в фоне — сервис доступен сразу
+    logger.info("Startup hook triggered — запускаем фоновую проверку сессии WhatsApp")
+    session.start()
+    story_scheduler.start()
 
-    logger.info("Startup hook triggered — готовимся к захвату QR-кода")
-    capture_and_save_qr(profile_path)
-    logger.info("QR-код сохранён и запрошен для сканирования")
+@app.on_event("shutdown")
+def stop_browser():
+    story_scheduler.stop()
+    session.stop()
+    browser.stop()
 
 @app.get("/health/")
 def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "session": session.state.value}
+
+@app.get("/ready/")
+def readiness_check():
+    """Готовность: сессия WhatsApp Web авторизована"""
+    status_code = 200 if session.ready else 503
+    return JSONResponse(content=session.status(), status_code=status_code)
+
+@app.get("/session/status")
+def session_status():
+    return session.status()
+
+@app.get("/session/qr")
+def session_qr():
+    """Текущий QR-код для входа (PNG), пока сессия ждёт сканирования"""
+    if session.state != SessionState.NEEDS_QR or not os.path.exists(session.qr_path):
+        raise HTTPException(status_code=404, detail=f"QR code is not available (state: {session.state.value})")
+    return FileResponse(
+        session.qr_path,
+        media_type="image/png",
+        headers={"Cache-Control": "no-store"}
+    )
+
+def parse_publish_at(value: Optional[str]) -> Optional[float]:
+    """ISO 8601; время без часового пояса считается московским"""
+    if not value:
+        return None
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid publish_at, expected ISO 8601 datetime")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=ZoneInfo("Europe/Moscow"))
+    return moment.timestamp()
+
+@app.post("/stories/", status_code=201)
+def enqueue_story(file: UploadFile = File(...), publish_at: Optional[str] = Form(None)):
+    """Ставит историю в очередь на публикацию (сразу или в publish_at)"""
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    if extension not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail=f"Unsupported file type, allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}")
+    publish_ts = parse_publish_at(publish_at)
+
+    upload_path = os.path.join(UPLOADS_PATH, f"{uuid.uuid4().hex}{extension}")
+    with open(upload_path, "wb") as f:
+        shutil.copyfileobj(file.file, f)
+    try:
+        image_path = media_cache.prepare(upload_path)
+    except MediaError as e:
+        logger.warning("%s", e)
+        raise HTTPException(status_code=400, detail="File is not a valid image")
+    finally:
+        # В очередь идёт подготовленный файл, исходник больше не нужен
+        os.remove(upload_path)
+
+    job = story_store.add(image_path, publish_ts)
+    story_scheduler.wakeup()
+    logger.info("История %s поставлена в очередь на %s", job["id"], job["publish_at"])
+    return job
+
+@app.get("/media/stats")
+def media_stats():
+    return media_cache.stats()
+
+@app.get("/stories/")
+def list_stories(status: Optional[str] = None, limit: int = 100):
+    return story_store.list(status=status, limit=min(limit, 1000))
+
+@app.get("/stories/{job_id}")
+def get_story(job_id: str):
+    job = story_store.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Story job not found")
+    return job
+
+@app.delete("/stories/{job_id}")
+def cancel_story(job_id: str):
+    if not story_store.cancel(job_id):
+        job = story_store.get(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Story job not found")
+        raise HTTPException(status_code=409, detail=f"Story job cannot be cancelled (status: {job['status']})")
+    return story_store.get(job_id)
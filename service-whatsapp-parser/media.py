@@ -0,0 +1,201 @@
+# service-whatsapp-parser/media.py
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger("whatsapp-parser")
+
+# Размер кадра статуса WhatsApp (9:16)
+STORY_SIZE: Tuple[int, int] = (1080, 1920)
+STORY_JPEG_QUALITY = 85
+
+# Меняется при изменении алгоритма обработки, чтобы не отдавать старые файлы из кэша
+PIPELINE_VERSION = 1
+
+
+class MediaError(Exception):
+    """Файл не удалось прочитать как изображение"""
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prepare_image(image: Image.Image, size: Tuple[int, int] = STORY_SIZE) -> Image.Image:
+    """
+    Поворачивает кадр по EXIF, уменьшает так, чтобы он вписался в size
+    (без увеличения), и приводит к RGB. Прозрачность заливается белым.
+    """
+    if image.format == "JPEG":
+        # Декодируем JPEG сразу в уменьшенном масштабе (DCT scaling) — для больших фото в разы быстрее.
+        # Квадрат по длинной стороне, т.к. ориентация из EXIF ещё не применена
+        longest = max(size)
+        image.draft("RGB", (longest, longest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.width > size[0] or image.height > size[1]:
+        image.thumbnail(size, Image.LANCZOS)
+    return image
+
+
+class MediaCache:
+    """
+    Подготовленные к публикации изображения на диске.
+
+    Результат адресуется sha256 исходного файла и параметров обработки,
+    поэтому повторная публикация той же картинки не пережимает её заново.
+
+    Кэш ограничен max_bytes и max_age_seconds: при превышении удаляются
+    давно не использованные файлы (LRU), кроме тех, что возвращает pinned —
+    например, файлов историй, ещё ждущих публикации. Список файлов и их
+    размеры держатся в памяти (заполняются при старте), поэтому stats()
+    не обходит каталог.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        size: Tuple[int, int] = STORY_SIZE,
+        quality: int = STORY_JPEG_QUALITY,
+        max_bytes: Optional[int] = 500 * 1024 * 1024,
+        max_age_seconds: Optional[float] = 30 * 24 * 3600,
+        pinned: Optional[Callable[[], Iterable[str]]] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.pinned = pinned
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # имя файла -> (размер, время последнего использования), от давних к свежим
+        self._files: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".tmp"):
+                # Недописанный файл прерванной обработки
+                os.remove(entry.path)
+            elif entry.name.endswith(".jpg"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for used_at, name, size in sorted(entries):
+            self._files[name] = (size, used_at)
+            self._bytes += size
+
+    def _touch(self, name: str, size: int):
+        now = time.time()
+        with self._lock:
+            previous = self._files.pop(name, None)
+            if previous is not None:
+                self._bytes -= previous[0]
+            self._files[name] = (size, now)
+            self._bytes += size
+        try:
+            # mtime — время последнего использования: по нему восстанавливается порядок LRU после перезапуска
+            os.utime(os.path.join(self.cache_dir, name), (now, now))
+        except OSError:
+            pass
+
+    def _evict(self, keep: str):
+        """Удаляет давно не использованные файлы сверх max_bytes и старше max_age_seconds"""
+        now = time.time()
+        with self._lock:
+            candidates = []
+            excess = self._bytes - self.max_bytes if self.max_bytes is not None else 0
+            for name, (size, used_at) in self._files.items():
+                expired = self.max_age_seconds is not None and now - used_at > self.max_age_seconds
+                if excess <= 0 and not expired:
+                    break
+                if name != keep:
+                    candidates.append(name)
+                    excess -= size
+        if not candidates:
+            return
+        pinned = {os.path.basename(path) for path in self.pinned()} if self.pinned is not None else set()
+        for name in candidates:
+            if name in pinned:
+                continue
+            with self._lock:
+                entry = self._files.pop(name, None)
+                if entry is None:
+                    continue
+                self._bytes -= entry[0]
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            self.evicted += 1
+
+    def _cache_key(self, content_hash: str) -> str:
+        params = f"v{PIPELINE_VERSION}:{self.size[0]}x{self.size[1]}:q{self.quality}"
+        return hashlib.sha256(f"{content_hash}:{params}".encode()).hexdigest()
+
+    def prepare(self, source_path: str) -> str:
+        """Возвращает путь к JPEG для публикации, обрабатывая исходник только при промахе кэша"""
+        key = self._cache_key(file_sha256(source_path))
+        name = f"{key}.jpg"
+        output_path = os.path.join(self.cache_dir, name)
+        if os.path.exists(output_path):
+            self.hits += 1
+            self._touch(name, os.path.getsize(output_path))
+            self._evict(keep=name)
+            return output_path
+
+        self.misses += 1
+        tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with Image.open(source_path) as image:
+                prepared = prepare_image(image, self.size)
+                # exif/icc не передаём — метаданные (в т.ч. геометки) в файл не попадают
+                prepared.save(tmp_path, "JPEG", quality=self.quality, optimize=True, progressive=True)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise MediaError(f"Не удалось обработать изображение {source_path}: {e}") from e
+        os.replace(tmp_path, output_path)
+        output_size = os.path.getsize(output_path)
+        self._touch(name, output_size)
+        self._evict(keep=name)
+
+        logger.info(
+            "Изображение подготовлено: %s (%.0f КБ) -> %s (%.0f КБ)",
+            os.path.basename(source_path), os.path.getsize(source_path) / 1024, name, output_size / 1024,
+        )
+        return output_path
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evicted": self.evicted,
+                "files": len(self._files),
+                "bytes": self._bytes,
+            }
@@ -0,0 +1,140 @@
+# service-whatsapp-parser/session.py
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from enum import Enum
+from typing import Optional
+
+from selenium import webdriver
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+
+from driver_manager import DriverManager
+from whatsapp_parser import QR_CANVAS_SELECTOR, STATUS_TAB_SELECTOR, save_qr
+
+logger = logging.getLogger("whatsapp-parser")
+
+
+class SessionState(str, Enum):
+    STARTING = "starting"
+    NEEDS_QR = "needs_qr"
+    LOGGED_IN = "logged_in"
+    FAILED = "failed"
+
+
+class WhatsAppSession:
+    """
+    Фоновая поддержка сессии WhatsApp Web.
+
+    Поток периодически проверяет страницу через DriverManager: если показан
+    QR-код — сохраняет его и переходит в needs_qr, если открыт список чатов —
+    в logged_in. Ошибки переводят сессию в failed с повтором через retry_delay.
+    """
+
+    def __init__(
+        self,
+        manager: DriverManager,
+        profile_path: str,
+        qr_poll_interval: float = 5,
+        logged_in_poll_interval: float = 60,
+        retry_delay: float = 30,
+    ):
+        self.manager = manager
+        self.profile_path = profile_path
+        self.qr_poll_interval = qr_poll_interval
+        self.logged_in_poll_interval = logged_in_poll_interval
+        self.retry_delay = retry_delay
+
+        self.state = SessionState.STARTING
+        self.error: Optional[str] = None
+        self.qr_path = os.path.join(profile_path, "qr.png")
+        self.qr_updated_at: Optional[datetime] = None
+        self.changed_at = datetime.utcnow()
+
+        self._stop = threading.Event()
+        self._logged_in = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----------------------------
+    # Жизненный цикл
+    # ----------------------------
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="whatsapp-session", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    # ----------------------------
+    # Публичный API
+    # ----------------------------
+    @property
+    def ready(self) -> bool:
+        return self.state == SessionState.LOGGED_IN
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        return self._logged_in.wait(timeout)
+
+    def status(self) -> dict:
+        return {
+            "state": self.state.value,
+            "ready": self.ready,
+            "error": self.error,
+            "changed_at": self.changed_at.isoformat(),
+            "qr_available": self.state == SessionState.NEEDS_QR and os.path.exists(self.qr_path),
+            "qr_updated_at": self.qr_updated_at.isoformat() if self.qr_updated_at else None,
+            "browser": self.manager.stats(),
+        }
+
+    # ----------------------------
+    # Фоновый поток
+    # ----------------------------
+    def _set_state(self, state: SessionState, error: Optional[str] = None):
+        if state != self.state:
+            logger.info("Сессия WhatsApp: %s -> %s", self.state.value, state.value)
+            self.changed_at = datetime.utcnow()
+        self.state = state
+        self.error = error
+        if state == SessionState.LOGGED_IN:
+            self._logged_in.set()
+        else:
+            self._logged_in.clear()
+
+    def _probe(self, driver: webdriver.Chrome) -> SessionState:
+        """Определяет состояние страницы; при показанном QR-коде сохраняет его"""
+        WebDriverWait(driver, 60).until(EC.any_of(
+            EC.presence_of_element_located((By.CSS_SELECTOR, QR_CANVAS_SELECTOR)),
+            EC.presence_of_element_located((By.CSS_SELECTOR, STATUS_TAB_SELECTOR)),
+        ))
+        if driver.find_elements(By.CSS_SELECTOR, STATUS_TAB_SELECTOR):
+            return SessionState.LOGGED_IN
+        save_qr(driver, self.profile_path)
+        self.qr_updated_at = datetime.utcnow()
+        return SessionState.NEEDS_QR
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                state = self.manager.run(self._probe, timeout=180, count=False)
+                self._set_state(state)
+            except Exception as e:
+                logger.error("Не удалось проверить сессию WhatsApp: %s", e)
+                self._set_state(SessionState.FAILED, str(e) or e.__class__.__name__)
+
+            if self.state == SessionState.NEEDS_QR:
+                delay = self.qr_poll_interval
+            elif self.state == SessionState.LOGGED_IN:
+                delay = self.logged_in_poll_interval
+            else:
+                delay = self.retry_delay
+            self._stop.wait(delay)
@@ -0,0 +1,284 @@
+# service-whatsapp-parser/story_jobs.py
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from selenium import webdriver
+
+from driver_manager import DriverManager, WHATSAPP_URL
+from metrics import track_outbound
+from session import WhatsAppSession
+from whatsapp_parser import publish_story
+
+logger = logging.getLogger("whatsapp-parser")
+
+STATUS_QUEUED = "queued"
+STATUS_PUBLISHING = "publishing"
+STATUS_PUBLISHED = "published"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    if ts is None:
+        return None
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat()
+
+
+class StoryJobStore:
+    """Задания на публикацию историй в локальной SQLite-базе"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS story_jobs (
+                    id TEXT PRIMARY KEY,
+                    image_path TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    publish_at REAL NOT NULL,
+                    next_attempt_at REAL NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    published_at REAL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_story_jobs_due ON story_jobs (status, next_attempt_at)"
+            )
+            # Задания, прерванные перезапуском сервиса, возвращаем в очередь
+            self._conn.execute(
+                "UPDATE story_jobs SET status = ? WHERE status = ?",
+                (STATUS_QUEUED, STATUS_PUBLISHING),
+            )
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        return {
+            "id": row["id"],
+            "image_path": row["image_path"],
+            "status": row["status"],
+            "publish_at": _iso(row["publish_at"]),
+            "next_attempt_at": _iso(row["next_attempt_at"]),
+            "attempts": row["attempts"],
+            "last_error": row["last_error"],
+            "created_at": _iso(row["created_at"]),
+            "published_at": _iso(row["published_at"]),
+        }
+
+    def add(self, image_path: str, publish_at: Optional[float] = None) -> dict:
+        now = time.time()
+        publish_at = publish_at if publish_at is not None else now
+        job_id = uuid.uuid4().hex
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO story_jobs (id, image_path, status, publish_at, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, image_path, STATUS_QUEUED, publish_at, publish_at, now),
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM story_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, status: Optional[str] = None, limit: int = 100) -> List[dict]:
+        query = "SELECT * FROM story_jobs"
+        params: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            params = (status,)
+        query += " ORDER BY publish_at LIMIT ?"
+        with self._lock:
+            rows = self._conn.execute(query, params + (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def active_image_paths(self) -> List[str]:
+        """Файлы заданий, которые ещё будут публиковаться (их нельзя удалять из кэша)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT DISTINCT image_path FROM story_jobs WHERE status IN (?, ?)",
+                (STATUS_QUEUED, STATUS_PUBLISHING),
+            ).fetchall()
+        return [row["image_path"] for row in rows]
+
+    def claim_due(self, limit: int) -> List[dict]:
+        """Забирает готовые к публикации задания и помечает их как publishing"""
+        now = time.time()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT * FROM story_jobs WHERE status = ? AND next_attempt_at <= ? "
+                "ORDER BY publish_at LIMIT ?",
+                (STATUS_QUEUED, now, limit),
+            ).fetchall()
+            self._conn.executemany(
+                "UPDATE story_jobs SET status = ? WHERE id = ?",
+                [(STATUS_PUBLISHING, row["id"]) for row in rows],
+            )
+        return [self._to_dict(row) for row in rows]
+
+    def mark_published(self, job_id: str):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE story_jobs SET status = ?, attempts = attempts + 1, last_error = NULL, published_at = ? "
+                "WHERE id = ?",
+                (STATUS_PUBLISHED, time.time(), job_id),
+            )
+
+    def mark_attempt_failed(self, job_id: str, error: str, next_attempt_at: Optional[float]):
+        """Неудачная попытка: повтор в next_attempt_at или окончательная ошибка, если None"""
+        with self._lock, self._conn:
+            if next_attempt_at is None:
+                self._conn.execute(
+                    "UPDATE story_jobs SET status = ?, attempts = attempts + 1, last_error = ? WHERE id = ?",
+                    (STATUS_FAILED, error, job_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE story_jobs SET status = ?, attempts = attempts + 1, last_error = ?, "
+                    "next_attempt_at = ? WHERE id = ?",
+                    (STATUS_QUEUED, error, next_attempt_at, job_id),
+                )
+
+    def release(self, job_ids: List[str]):
+        """Возвращает задания в очередь без учёта попытки (например, сессия не готова)"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE story_jobs SET status = ? WHERE id = ? AND status = ?",
+                [(STATUS_QUEUED, job_id, STATUS_PUBLISHING) for job_id in job_ids],
+            )
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE story_jobs SET status = ? WHERE id = ? AND status = ?",
+                (STATUS_CANCELLED, job_id, STATUS_QUEUED),
+            )
+        return cursor.rowcount > 0
+
+
+class StoryScheduler:
+    """
+    Публикация историй по расписанию.
+
+    Раз в poll_interval секунд забирает до batch_size готовых заданий и
+    публикует их подряд одной операцией в уже открытом браузере. Неудачные
+    попытки повторяются с экспоненциальной задержкой, после max_attempts
+    задание помечается как failed.
+    """
+
+    def __init__(
+        self,
+        store: StoryJobStore,
+        manager: DriverManager,
+        session: WhatsAppSession,
+        poll_interval: float = 10,
+        batch_size: int = 10,
+        max_attempts: int = 5,
+        backoff_base: float = 60,
+        backoff_max: float = 3600,
+    ):
+        self.store = store
+        self.manager = manager
+        self.session = session
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="story-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def wakeup(self):
+        """Проверить очередь сейчас, не дожидаясь следующего опроса"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Ошибка планировщика историй:")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def run_once(self) -> int:
+        if not self.session.ready:
+            return 0
+        jobs = self.store.claim_due(self.batch_size)
+        if not jobs:
+            return 0
+
+        logger.info("Публикуем пакет из %s историй в одной сессии браузера", len(jobs))
+        try:
+            results = self.manager.run(lambda driver: self._publish_batch(driver, jobs))
+        except Exception as e:
+            # Не удалось даже получить браузер — попытка не засчитывается
+            logger.error("Не удалось выполнить пакет публикаций: %s", e)
+            self.store.release([job["id"] for job in jobs])
+            return 0
+
+        for job, error in zip(jobs, results):
+            if error is None:
+                self.store.mark_published(job["id"])
+                continue
+            attempts = job["attempts"] + 1
+            if attempts >= self.max_attempts:
+                next_attempt_at = None
+                logger.error("История %s не опубликована после %s попыток: %s", job["id"], attempts, error)
+            else:
+                delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+                next_attempt_at = time.time() + delay
+                logger.warning("История %s: ошибка публикации, повтор через %.0f с: %s", job["id"], delay, error)
+            self.store.mark_attempt_failed(job["id"], error, next_attempt_at)
+        return len(jobs)
+
+    @staticmethod
+    def _publish_batch(driver: webdriver.Chrome, jobs: List[dict]) -> List[Optional[str]]:
+        results: List[Optional[str]] = []
+        for job in jobs:
+            if not os.path.exists(job["image_path"]):
+                results.append(f"Файл не найден: {job['image_path']}")
+                continue
+            try:
+                with track_outbound("whatsapp-web"):
+                    publish_story(driver, job["image_path"])
+                results.append(None)
+                logger.info("История %s опубликована", job["id"])
+            except Exception as e:
+                results.append(str(e) or e.__class__.__name__)
+                # Страница в неизвестном состоянии — начинаем следующую публикацию с чистого листа
+                try:
+                    driver.get(WHATSAPP_URL)
+                except Exception as reload_error:
+                    remaining = len(jobs) - len(results)
+                    results.extend([f"Браузер недоступен: {reload_error}"] * remaining)
+                    break
+        return results
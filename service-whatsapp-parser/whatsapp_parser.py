@@ -3,124 +3,117 @@
 import os
 import base64
 import logging
-from io import BytesIO
-from PIL import Image
+from typing import Dict, Optional
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-
-# Пути к установленным через apt
-CHROMEDRIVER_PATH = "/usr/bin/chromedriver"
-CHROME_BINARY_PATH = "/usr/bin/chromium"
+from driver_manager import DriverManager
+from media import MediaCache
 
 logger = logging.getLogger("whatsapp-parser")
 
+QR_CANVAS_SELECTOR = "canvas[aria-label='Scan this QR code to link a device!']"
+STATUS_TAB_SELECTOR = "button[data-tab='2']"
+
+# Один менеджер браузера на профиль Chrome
+_managers: Dict[str, DriverManager] = {}
+
+def get_driver_manager(profile_path: str = "./chrome-data") -> DriverManager:
+    """Возвращает (и при необходимости создаёт) менеджер браузера для профиля"""
+    key = os.path.abspath(profile_path)
+    manager = _managers.get(key)
+    if manager is None:
+        manager = DriverManager(
+            key,
+            max_operations=int(os.getenv("WHATSAPP_MAX_OPERATIONS", "50")),
+            max_memory_mb=float(os.getenv("WHATSAPP_MAX_MEMORY_MB", "1500")),
+        )
+        _managers[key] = manager
+    return manager
+
+def save_qr(driver: webdriver.Chrome, profile_path: str) -> str:
+    """Снимает скриншот показанного QR-кода и сохраняет его в qr.png профиля"""
+    qr_canvas = driver.find_element(By.CSS_SELECTOR, QR_CANVAS_SELECTOR)
+    qr_base64 = qr_canvas.screenshot_as_base64
+
+    # декодируем и сохраняем в файл
+    qr_data = base64.b64decode(qr_base64)
+    qr_path = os.path.join(profile_path, "qr.png")
+    # Пишем во временный файл и подменяем, чтобы /session/qr не отдал недописанный PNG
+    tmp_path = qr_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(qr_data)
+    os.replace(tmp_path, qr_path)
+    return qr_path
+
+def _capture_qr(driver: webdriver.Chrome, profile_path: str) -> str:
+    logger.info("Ждём появления QR-канвеса...")
+    WebDriverWait(driver, 60).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, QR_CANVAS_SELECTOR))
+    )
+
+    logger.info("Canvas найден, снимаем скриншот QR-кода...")
+    return save_qr(driver, profile_path)
+
 def capture_and_save_qr(profile_path: str):
     """
     Открывает WhatsApp Web в headless, ждёт появления QR-кода,
     сохраняет его в файл и логирует путь.
     """
-    logger.info("Запуск ChromeDriver для захвата QR-кода...")
-    options = webdriver.ChromeOptions()
-    options.binary_location = CHROME_BINARY_PATH
-    options.add_argument("--headless=new")
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1280,800")
-    options.add_argument(f"--user-data-dir={profile_path}")
-
-    try:
-        service = ChromeService(executable_path=CHROMEDRIVER_PATH)
-        driver = webdriver.Chrome(service=service, options=options)
-    except Exception as e:
-        logger.error("Не удалось запустить ChromeDriver: %s", e)
-        return
-
     try:
-        logger.info("Открываем WhatsApp Web...")
-        driver.get("https://web.whatsapp.com/")
-
-        logger.info("Ждём появления QR-канвеса...")
-        qr_canvas = WebDriverWait(driver, 60).until(
-            EC.presence_of_element_located(
-                (By.CSS_SELECTOR, "canvas[aria-label='Scan this QR code to link a device!']")
-            )
-        )
-
-        logger.info("Canvas найден, снимаем скриншот QR-кода...")
-        qr_base64 = qr_canvas.screenshot_as_base64
-
-        # декодируем и сохраняем в файл
-        qr_data = base64.b64decode(qr_base64)
-        qr_path = os.path.join(profile_path, "qr.png")
-        with open(qr_path, "wb") as f:
-            f.write(qr_data)
-
+        qr_path = get_driver_manager(profile_path).run(lambda driver: _capture_qr(driver, profile_path), count=False)
         logger.info("QR-код сохранён в файл: %s", qr_path)
         logger.info("Скопируйте и отсканируйте этот файл на телефоне для авторизации.")
-
     except Exception as e:
         logger.error("Ошибка при захвате или сохранении QR-кода: %s", e)
 
-    finally:
-        driver.quit()
-        logger.info("ChromeDriver завершил работу.")
-
-def send_story(image_path: str, profile_path: str = "./chrome-data"):
+def publish_story(driver: webdriver.Chrome, image_path: str):
+    """Публикует одну историю в уже открытом и авторизованном WhatsApp Web"""
+    WebDriverWait(driver, 60).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, STATUS_TAB_SELECTOR))
+    )
+
+    logger.info("Кликаем 'Статус' и готовимся к публикации...")
+    driver.find_element(By.CSS_SELECTOR, STATUS_TAB_SELECTOR).click()
+    WebDriverWait(driver, 30).until(
+        EC.element_to_be_clickable((
+            By.CSS_SELECTOR,
+            "div[role='button'][tabindex='-1'] > div[role='button'][tabindex='-1']"
+        ))
+    ).click()
+
+    WebDriverWait(driver, 30).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, "span[data-icon='plus']"))
+    ).click()
+
+    WebDriverWait(driver, 30).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, "span[data-icon='media-multiple']"))
+    ).click()
+
+    logger.info("Загружаем файл: %s", image_path)
+    WebDriverWait(driver, 30).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='file']"))
+    ).send_keys(os.path.abspath(image_path))
+
+    WebDriverWait(driver, 30).until(
+        EC.element_to_be_clickable((By.CSS_SELECTOR, "span[data-icon='send']"))
+    ).click()
+
+def send_story(image_path: str, profile_path: str = "./chrome-data", media_cache: Optional[MediaCache] = None):
     """
-    Публикует историю (статус) в WhatsApp Web, используя сохранённую сессию.
+    Публикует историю (статус) в WhatsApp Web, используя сохранённую сессию
+    в постоянно открытом браузере. С media_cache картинка сначала
+    пережимается под размер статуса.
     """
     if not os.path.exists(image_path):
         logger.error("Файл для истории не найден: %s", image_path)
         return
 
-    logger.info("Запуск ChromeDriver для публикации истории...")
-    options = webdriver.ChromeOptions()
-    options.binary_location = CHROME_BINARY_PATH
-    options.add_argument(f"--user-data-dir={profile_path}")
-
     try:
-        service = ChromeService(executable_path=CHROMEDRIVER_PATH)
-        driver = webdriver.Chrome(service=service, options=options)
-
-        logger.info("Открываем WhatsApp Web с сессией...")
-        driver.get("https://web.whatsapp.com/")
-        WebDriverWait(driver, 60).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "button[data-tab='2']"))
-        )
-
-        logger.info("Кликаем 'Статус' и готовимся к публикации...")
-        driver.find_element(By.CSS_SELECTOR, "button[data-tab='2']").click()
-        WebDriverWait(driver, 30).until(
-            EC.element_to_be_clickable((
-                By.CSS_SELECTOR,
-                "div[role='button'][tabindex='-1'] > div[role='button'][tabindex='-1']"
-            ))
-        ).click()
-
-        WebDriverWait(driver, 30).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "span[data-icon='plus']"))
-        ).click()
-
-        WebDriverWait(driver, 30).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "span[data-icon='media-multiple']"))
-        ).click()
-
-        logger.info("Загружаем файл: %s", image_path)
-        WebDriverWait(driver, 30).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "input[type='file']"))
-        ).send_keys(os.path.abspath(image_path))
-
-        WebDriverWait(driver, 30).until(
-            EC.element_to_be_clickable((By.CSS_SELECTOR, "span[data-icon='send']"))
-        ).click()
-
+        if media_cache is not None:
+            image_path = media_cache.prepare(image_path)
+        get_driver_manager(profile_path).run(lambda driver: publish_story(driver, image_path))
         logger.info("История успешно отправлена!")
     except Exception as e:
         logger.error("Ошибка при публикации истории: %s", e)
-    finally:
-        driver.quit()
-        logger.info("ChromeDriver закрыт после публикации.")
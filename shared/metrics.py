@@ -0,0 +1,271 @@
+"""
+Метрики Prometheus для Python-сервисов.
+
+Общий модуль пакета shared/ (clinic-observability): ставится в образ каждого
+сервиса при сборке, своих копий у сервисов нет.
+
+- instrument_app(app): гистограмма задержек по маршрутам, GET /metrics
+  и замер задержки event loop;
+- register_db_pool(engine, name): состояние пула соединений SQLAlchemy;
+- track_outbound(target) / observe_outbound(...): время и ошибки исходящих
+  вызовов по адресату;
+- register_stats(prefix, fn): числовые поля stats()-словаря как gauge;
+- start_metrics_server(port): /metrics для процессов без FastAPI.
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import start_http_server
+from prometheus_client.core import GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки входящего HTTP-запроса",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Входящие HTTP-запросы в обработке",
+    ["method", "route"],
+)
+
+OUTBOUND_DURATION = Histogram(
+    "outbound_request_duration_seconds",
+    "Время исходящего вызова по адресату",
+    ["target"],
+    buckets=LATENCY_BUCKETS,
+)
+OUTBOUND_REQUESTS = Counter(
+    "outbound_requests_total",
+    "Исходящие вызовы по адресату и результату",
+    ["target", "outcome"],
+)
+OUTBOUND_ERRORS = Counter(
+    "outbound_request_errors_total",
+    "Ошибки исходящих вызовов: исключения и ответы 4xx/5xx",
+    ["target", "reason"],
+)
+
+EVENT_LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "Опоздание пробуждения event loop относительно запланированного",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+EVENT_LOOP_LAG_LAST = Gauge(
+    "event_loop_lag_last_seconds",
+    "Последнее измеренное опоздание event loop",
+)
+
+# Запросы, не совпавшие ни с одним маршрутом, собираются под одной меткой,
+# чтобы сканеры не раздували число временных рядов
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+# ----------------------------
+# Входящие запросы
+# ----------------------------
+def find_route(scope):
+    """Маршрут приложения, которому соответствует запрос, или None"""
+    from starlette.routing import Match
+
+    app = scope.get("app")
+    for route in getattr(app, "routes", []):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+    return None
+
+
+def route_template(scope) -> str:
+    """Шаблон маршрута (/timeslots/{date}), а не конкретный путь"""
+    return getattr(find_route(scope), "path", UNMATCHED_ROUTE)
+
+
+class PrometheusMiddleware:
+    """ASGI-middleware: задержка и число запросов в обработке по маршрутам"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = route_template(scope)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            HTTP_REQUEST_DURATION.labels(method, route, str(status["code"])).observe(time.perf_counter() - started)
+
+
+async def metrics_endpoint(request):
+    from starlette.responses import Response
+
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+def instrument_app(app, loop_lag_interval: float = 0.5):
+    """Подключает метрики к FastAPI-приложению: middleware, GET /metrics и замер event loop"""
+    app.add_middleware(PrometheusMiddleware)
+    app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+
+    @app.on_event("startup")
+    async def start_loop_monitor():
+        start_loop_lag_monitor(loop_lag_interval)
+
+
+# ----------------------------
+# Event loop
+# ----------------------------
+async def _monitor_loop_lag(interval: float):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(loop.time() - started - interval, 0.0)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+
+
+def start_loop_lag_monitor(interval: float = 0.5) -> asyncio.Task:
+    """Запускает замер задержки текущего event loop; вызывать внутри работающего loop"""
+    return asyncio.get_running_loop().create_task(_monitor_loop_lag(interval))
+
+
+# ----------------------------
+# Исходящие вызовы
+# ----------------------------
+class OutboundCall:
+    __slots__ = ("target", "status_code")
+
+    def __init__(self, target: str):
+        self.target = target
+        self.status_code: Optional[int] = None
+
+    def status(self, status_code: int):
+        """Код ответа; 4xx/5xx считаются ошибкой вызова"""
+        self.status_code = status_code
+
+
+def observe_outbound(target: str, seconds: float, status_code: Optional[int] = None,
+                     error: Optional[BaseException] = None):
+    """Учёт одного исходящего вызова, когда замер удобнее сделать вручную (например, потоковый ответ)"""
+    OUTBOUND_DURATION.labels(target).observe(seconds)
+    if error is not None:
+        reason = error.__class__.__name__
+    elif status_code is not None and status_code >= 400:
+        reason = f"http_{status_code // 100}xx"
+    else:
+        OUTBOUND_REQUESTS.labels(target, "ok").inc()
+        return
+    OUTBOUND_ERRORS.labels(target, reason).inc()
+    OUTBOUND_REQUESTS.labels(target, "error").inc()
+
+
+@contextmanager
+def track_outbound(target: str) -> Iterator[OutboundCall]:
+    """
+    Замер исходящего вызова:
+
+        with track_outbound("telegram-bot") as call:
+            resp = client.post(...)
+            call.status(resp.status_code)
+
+    Исключение внутри блока считается ошибкой и пробрасывается дальше.
+    """
+    call = OutboundCall(target)
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException as e:
+        observe_outbound(target, time.perf_counter() - started, error=e)
+        raise
+    observe_outbound(target, time.perf_counter() - started, call.status_code)
+
+
+# ----------------------------
+# Состояние компонентов
+# ----------------------------
+class _DbPoolCollector:
+    """Все пулы сервиса в одном семействе метрик (по метке pool)"""
+
+    def __init__(self):
+        self.engines: Dict[str, object] = {}
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        family = GaugeMetricFamily("db_pool_connections", "Соединения пула SQLAlchemy", labels=["pool", "state"])
+        for name, engine in list(self.engines.items()):
+            pool = engine.pool
+            for state, method in (("size", "size"), ("checked_in", "checkedin"),
+                                  ("checked_out", "checkedout"), ("overflow", "overflow")):
+                getter = getattr(pool, method, None)
+                if getter is not None:
+                    family.add_metric([name, state], getter())
+        yield family
+
+
+_db_pools = _DbPoolCollector()
+REGISTRY.register(_db_pools)
+
+
+def register_db_pool(engine, name: str = "default"):
+    """Экспортирует размер и занятость пула соединений engine"""
+    _db_pools.engines[name] = engine
+
+
+class _StatsCollector:
+    def __init__(self, prefix: str, fn: Callable[[], dict]):
+        self.prefix = prefix
+        self.fn = fn
+
+    def describe(self):
+        return []
+
+    def collect(self):
+        try:
+            stats = self.fn()
+        except Exception:
+            logger.warning("Не удалось получить статистику %s", self.prefix, exc_info=True)
+            return
+        for key, value in stats.items():
+            if isinstance(value, bool):
+                value = int(value)
+            if isinstance(value, (int, float)):
+                yield GaugeMetricFamily(f"{self.prefix}_{key}", f"{self.prefix}: {key}", value=value)
+
+
+def register_stats(prefix: str, fn: Callable[[], dict]):
+    """Публикует числовые поля словаря fn() как gauge с именами {prefix}_{ключ}"""
+    REGISTRY.register(_StatsCollector(prefix, fn))
+
+
+def start_metrics_server(port: int):
+    """Отдельный HTTP-сервер с /metrics для сервисов без FastAPI"""
+    start_http_server(port)
+    logger.info("Метрики Prometheus доступны на порту %s", port)
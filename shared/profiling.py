@@ -0,0 +1,233 @@
+"""
+Профилирование отдельных запросов по требованию.
+
+Общий модуль пакета shared/ (clinic-observability), используется в
+service-calendar и service-telegram-code-sender.
+
+Включается переменной PROFILING_TOKEN. Запрос с заголовком
+X-Profile-Token: <токен> профилируется сэмплированием стеков потоков
+(sys._current_frames) каждые PROFILING_INTERVAL_MS миллисекунд.
+Идентификатор профиля возвращается в заголовке X-Profile-Id. Последние
+PROFILING_MAX_PROFILES профилей хранятся в памяти и скачиваются в формате
+folded stacks (flamegraph.pl, speedscope, inferno):
+
+    GET /debug/profiles             — список
+    GET /debug/profiles/{id}        — folded stacks
+
+Без PROFILING_TOKEN ни middleware, ни маршруты не подключаются.
+"""
+
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from typing import Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile-token"
+
+# Верхушки стеков простаивающих потоков: ожидание задач, select event loop
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class Profile:
+    __slots__ = ("id", "method", "path", "started_at", "duration_ms", "interval_ms", "samples", "stacks")
+
+    def __init__(self, method: str, path: str, interval_ms: float):
+        self.id = uuid.uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.started_at = time.time()
+        self.duration_ms = 0.0
+        self.interval_ms = interval_ms
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 1),
+            "interval_ms": self.interval_ms,
+            "samples": self.samples,
+        }
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+
+class _Sampler(threading.Thread):
+    """
+    Снимает стеки всех занятых потоков процесса, пока идёт запрос. Готовый
+    профиль поток сам передаёт в on_finish после остановки: stop() не ждёт
+    завершения потока и не блокирует event loop.
+    """
+
+    def __init__(self, profile: Profile, max_samples: int, on_finish: Callable[[Profile], None]):
+        super().__init__(name="request-profiler", daemon=True)
+        self.profile = profile
+        self.max_samples = max_samples
+        self.on_finish = on_finish
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        try:
+            self._sample()
+        finally:
+            self.on_finish(self.profile)
+
+    def _sample(self):
+        interval = self.profile.interval_ms / 1000
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop_event.wait(interval) and self.profile.samples < self.max_samples:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                code = frame.f_code
+                if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.profile.stacks[";".join(reversed(stack))] += 1
+            self.profile.samples += 1
+
+
+class RequestProfiler:
+    """Кольцевой буфер профилей и запуск сэмплера на время запроса"""
+
+    def __init__(self, token: str, interval_ms: float = 5, max_profiles: int = 20, max_samples: int = 20000):
+        self.token = token
+        self.interval_ms = interval_ms
+        self.max_samples = max_samples
+        self.profiles: Deque[Profile] = deque(maxlen=max_profiles)
+        self._lock = threading.Lock()
+
+    def authorized(self, value: Optional[str]) -> bool:
+        # Сравнение байтов: compare_digest для строк не принимает не-ASCII
+        return bool(value) and hmac.compare_digest(value.encode(), self.token.encode())
+
+    def start(self, method: str, path: str) -> _Sampler:
+        sampler = _Sampler(Profile(method, path, self.interval_ms), self.max_samples, self._store)
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler: _Sampler, started: float):
+        """Останавливает сэмплер; профиль появится в списке, когда поток сэмплера завершится (до interval_ms)"""
+        sampler.profile.duration_ms = (time.perf_counter() - started) * 1000
+        sampler.stop()
+
+    def _store(self, profile: Profile):
+        with self._lock:
+            self.profiles.append(profile)
+        logger.info(
+            f"Профиль {profile.id}: {profile.method} {profile.path}, "
+            f"{profile.duration_ms:.0f} мс, {profile.samples} сэмплов"
+        )
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def list(self) -> list:
+        with self._lock:
+            return [p.summary() for p in reversed(self.profiles)]
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers: Dict[bytes, bytes] = dict(scope.get("headers") or [])
+        token = headers.get(PROFILE_HEADER.encode())
+        if token is None or scope["path"].startswith("/debug/profiles"):
+            await self.app(scope, receive, send)
+            return
+        if not self.profiler.authorized(token.decode("latin-1")):
+            logger.warning(f"Неверный токен профилирования для {scope['path']}")
+            await self.app(scope, receive, send)
+            return
+
+        sampler = self.profiler.start(scope["method"], scope["path"])
+        profile_id = sampler.profile.id
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]}
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.profiler.finish(sampler, started)
+
+
+def install_profiling(app) -> Optional[RequestProfiler]:
+    """Подключает профилирование, если задан PROFILING_TOKEN; иначе ничего не делает"""
+    token = os.getenv("PROFILING_TOKEN")
+    if not token:
+        return None
+
+    from fastapi import Header, HTTPException
+    from fastapi.responses import PlainTextResponse
+
+    profiler = RequestProfiler(
+        token,
+        interval_ms=float(os.getenv("PROFILING_INTERVAL_MS", "5")),
+        max_profiles=int(os.getenv("PROFILING_MAX_PROFILES", "20")),
+    )
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    def check_token(token: Optional[str]):
+        if not profiler.authorized(token):
+            raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+    @app.get("/debug/profiles", include_in_schema=False)
+    def list_profiles(x_profile_token: Optional[str] = Header(None)):
+        check_token(x_profile_token)
+        return profiler.list()
+
+    @app.get("/debug/profiles/{profile_id}", include_in_schema=False)
+    def download_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)):
+        check_token(x_profile_token)
+        profile = profiler.get(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return PlainTextResponse(
+            profile.folded(),
+            headers={"Content-Disposition": f"attachment; filename=profile_{profile.id}.folded"},
+        )
+
+    logger.info("Профилирование запросов по заголовку X-Profile-Token включено")
+    return profiler
@@ -0,0 +1,280 @@
+"""
+Трассировка запросов по стандарту W3C Trace Context.
+
+Общий модуль пакета shared/ (clinic-observability), используется в
+service-calendar и service-telegram-bot.
+
+- TracingMiddleware продолжает трассу из входящего заголовка traceparent
+  (или начинает новую) и пишет строку лога с trace_id каждого запроса;
+- start_span(name) — вложенный участок (SQL, генерация ICS, отправка уведомления);
+- inject_traceparent(request) — event hook httpx, передающий трассу дальше;
+- завершённые участки складываются в кольцевой буфер (GET /debug/traces
+  при TRACING_DEBUG=1) и, если задан TRACE_EXPORT_FILE, дописываются туда
+  в формате JSON Lines.
+"""
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Deque, Dict, Iterator, List, Optional
+
+from metrics import route_template
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "unknown")
+
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool = True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[SpanContext]:
+    """Разбирает заголовок traceparent; при любой ошибке формата трасса начинается заново"""
+    if not value:
+        return None
+    parts = value.strip().lower().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or parts[0] == "ff":
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16), int(parts[3][:2], 16)
+    except ValueError:
+        return None
+    if set(parts[1]) == {"0"} or set(parts[2]) == {"0"}:
+        return None
+    return SpanContext(parts[1], parts[2], bool(int(parts[3][:2], 16) & 1))
+
+
+class Span:
+    __slots__ = ("name", "context", "parent_id", "links", "attributes", "start", "end", "status", "_started")
+
+    def __init__(self, name: str, parent: Optional[SpanContext], links: Optional[List[SpanContext]] = None):
+        trace_id = parent.trace_id if parent is not None else secrets.token_hex(16)
+        self.name = name
+        self.context = SpanContext(trace_id, secrets.token_hex(8), parent.sampled if parent is not None else True)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.links = links or []
+        self.attributes: Dict[str, object] = {}
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.status = "ok"
+        self._started = time.perf_counter()
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.end = self.start + (time.perf_counter() - self._started)
+        if error is not None:
+            self.status = "error"
+            self.attributes.setdefault("error", f"{error.__class__.__name__}: {error}")
+        exporter.export(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def to_dict(self) -> dict:
+        return {
+            "service": SERVICE_NAME,
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "links": [{"trace_id": link.trace_id, "span_id": link.span_id} for link in self.links],
+            "start": self.start,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class SpanExporter:
+    """Последние завершённые участки в памяти и, по желанию, в файле JSON Lines"""
+
+    def __init__(self, max_spans: int = 5000, path: Optional[str] = None):
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+            if self.path:
+                try:
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n")
+                except OSError as e:
+                    logger.warning(f"Не удалось записать участок трассы в {self.path}: {e}")
+
+    def trace(self, trace_id: str) -> List[dict]:
+        with self._lock:
+            spans = [s.to_dict() for s in self.spans if s.context.trace_id == trace_id]
+        return sorted(spans, key=lambda s: s["start"])
+
+    def recent(self, limit: int = 50) -> List[dict]:
+        """Последние трассы: самый ранний участок трассы в этом сервисе и число участков"""
+        with self._lock:
+            spans = list(self.spans)
+        traces: "OrderedDict[str, List[Span]]" = OrderedDict()
+        for span in reversed(spans):
+            traces.setdefault(span.context.trace_id, []).append(span)
+        result = []
+        for trace_id, items in list(traces.items())[:limit]:
+            root = min(items, key=lambda s: s.start)
+            result.append({
+                "trace_id": trace_id,
+                "root": root.name,
+                "start": root.start,
+                "duration_ms": round(root.duration_ms, 3),
+                "spans": len(items),
+            })
+        return result
+
+
+exporter = SpanExporter(
+    max_spans=int(os.getenv("TRACE_BUFFER_SIZE", "5000")),
+    path=os.getenv("TRACE_EXPORT_FILE") or None,
+)
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_context() -> Optional[SpanContext]:
+    """Контекст текущего участка — чтобы продолжить трассу в другом потоке"""
+    span = _current_span.get()
+    return span.context if span is not None else None
+
+
+@contextmanager
+def start_span(
+    name: str,
+    parent: Optional[SpanContext] = None,
+    links: Optional[List[SpanContext]] = None,
+    **attributes,
+) -> Iterator[Span]:
+    """Участок трассы; родитель — явно переданный контекст или текущий участок"""
+    span = Span(name, parent or current_context(), links)
+    span.attributes.update(attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(e)
+        raise
+    else:
+        span.finish()
+    finally:
+        _current_span.reset(token)
+
+
+def inject_traceparent(request):
+    """Event hook httpx (request): передаёт текущую трассу в заголовке traceparent"""
+    context = current_context()
+    if context is not None:
+        request.headers["traceparent"] = context.traceparent()
+
+
+# ----------------------------
+# SQLAlchemy
+# ----------------------------
+def instrument_engine(engine):
+    """Участок трассы на каждый SQL-запрос, выполненный внутри трассируемого запроса"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        parent = current_context()
+        span = Span("db.query", parent) if parent is not None else None
+        if span is not None:
+            span.set_attribute("db.statement", " ".join(statement.split())[:500])
+        conn.info.setdefault("trace_spans", []).append(span)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        span = conn.info["trace_spans"].pop()
+        if span is not None:
+            span.set_attribute("db.rowcount", cursor.rowcount)
+            span.finish()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("trace_spans"):
+            span = conn.info["trace_spans"].pop()
+            if span is not None:
+                span.finish(exception_context.original_exception)
+
+
+# ----------------------------
+# FastAPI
+# ----------------------------
+class TracingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        status = {"code": 500}
+
+        with start_span(f"{scope['method']} {route_template(scope)}", parent, kind="server") as span:
+            async def send_wrapper(message):
+                if message["type"] == "http.response.start":
+                    status["code"] = message["status"]
+                    message = {
+                        **message,
+                        "headers": list(message.get("headers", [])) + [
+                            (b"traceparent", span.context.traceparent().encode()),
+                        ],
+                    }
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                span.set_attribute("http.status_code", status["code"])
+                if status["code"] >= 500:
+                    span.status = "error"
+                logger.info(
+                    f"trace={span.context.trace_id} span={span.context.span_id} "
+                    f"parent={span.parent_id or '-'} {scope['method']} {scope['path']} "
+                    f"-> {status['code']} {span.duration_ms:.1f} мс"
+                )
+
+
+def install_tracing(app, service_name: Optional[str] = None):
+    """Подключает middleware трассировки; при TRACING_DEBUG=1 ещё и GET /debug/traces"""
+    global SERVICE_NAME
+    if service_name:
+        SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", service_name)
+
+    app.add_middleware(TracingMiddleware)
+    if os.getenv("TRACING_DEBUG", "0") != "1":
+        return
+
+    @app.get("/debug/traces", include_in_schema=False)
+    def list_traces(limit: int = 50):
+        return exporter.recent(min(limit, 500))
+
+    @app.get("/debug/traces/{trace_id}", include_in_schema=False)
+    def get_trace(trace_id: str):
+        return exporter.trace(trace_id.lower())